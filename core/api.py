@@ -20,6 +20,7 @@ from core.forms import (
     UpdateStaffForm,
 )
 
+from core.conflicts import deferred_conflicts
 from core.models import Course, Department, Staff, Venue, VenueCategory
 from core.serializers import (
     CourseSerializer,
@@ -109,14 +110,15 @@ class CourseViewSet(ViewSet):
                     data={"details": "Code been used by another course"},
                 )
 
-            course.title = data["title"]
-            course.code = data["code"]
-            course.department = data["department"]
-            course.departments.set(data["departments"])
-            course.student_count = data["student_count"]
-            course.level = data["level"]
-            course.semester = data["semester"]
-            course.save()
+            with deferred_conflicts():
+                course.title = data["title"]
+                course.code = data["code"]
+                course.department = data["department"]
+                course.departments.set(data["departments"])
+                course.student_count = data["student_count"]
+                course.level = data["level"]
+                course.semester = data["semester"]
+                course.save()
 
             return Response(CourseSerializer(course).data)
 
@@ -210,54 +212,56 @@ class CourseViewSet(ViewSet):
 
             courses_added = []
 
-            for current_index in range(count):
-                pool = departments.difference(completed_departments)
-                print(f"Index : {current_index}, Pool Size : {len(pool)}")
-
-                if len(pool) == 0:
-                    break
-
-                else:
-                    department = random.choice(list(pool))
-
-                    if department not in department_courses_count:
-                        department_courses_count[department] = 0
-
-                    course = Course()
-                    course.title = f"Course {current_index + 1}"
-                    course.code = (
-                        f"{department.code}{random.randrange(level+1, level+99)}"
-                    )
-                    course.department = department
-                    course.level = level
-                    course.semester = semester
-                    course.student_count = random.randint(30, 300)
-                    selected_departments = set()
-
-                    if course.code.endswith("101") or random.randint(1, 30) % 8 == 0:
-                        # Is a shared course
-                        shared_department_count = random.randint(1, department_count)
-                        selected_departments = set(
-                            random.choices(list(departments), k=shared_department_count)
-                        )
-                        selected_departments = selected_departments.difference(
-                            completed_departments
-                        )
+            # Every added course is refreshed in the conflict table once, at the end
+            with deferred_conflicts():
+                for current_index in range(count):
+                    pool = departments.difference(completed_departments)
+                    print(f"Index : {current_index}, Pool Size : {len(pool)}")
 
-                    selected_departments.add(department)
-                    try:
-                        course.save()
-                        course.departments.set(selected_departments)
-                        course.save()
-                        department_courses_count[department] = (
-                            department_courses_count[department] + 1
-                        )
-                        courses_added.append(course)
+                    if len(pool) == 0:
+                        break
 
-                        if department_courses_count[department] >= department_max:
-                            completed_departments.add(department)
-                    except Exception:
-                        pass
+                    else:
+                        department = random.choice(list(pool))
+
+                        if department not in department_courses_count:
+                            department_courses_count[department] = 0
+
+                        course = Course()
+                        course.title = f"Course {current_index + 1}"
+                        course.code = (
+                            f"{department.code}{random.randrange(level+1, level+99)}"
+                        )
+                        course.department = department
+                        course.level = level
+                        course.semester = semester
+                        course.student_count = random.randint(30, 300)
+                        selected_departments = set()
+
+                        if course.code.endswith("101") or random.randint(1, 30) % 8 == 0:
+                            # Is a shared course
+                            shared_department_count = random.randint(1, department_count)
+                            selected_departments = set(
+                                random.choices(list(departments), k=shared_department_count)
+                            )
+                            selected_departments = selected_departments.difference(
+                                completed_departments
+                            )
+
+                        selected_departments.add(department)
+                        try:
+                            course.save()
+                            course.departments.set(selected_departments)
+                            course.save()
+                            department_courses_count[department] = (
+                                department_courses_count[department] + 1
+                            )
+                            courses_added.append(course)
+
+                            if department_courses_count[department] >= department_max:
+                                completed_departments.add(department)
+                        except Exception:
+                            pass
 
             return Response(
                 data={
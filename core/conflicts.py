@@ -0,0 +1,112 @@
+"""
+The course conflict graph, kept in the `CourseConflict` table.
+
+Two courses conflict when they have the same level and share a department
+(through `Course.departments`), so they can never be written in the same
+slot. Every conflict is stored in both directions, the conflicts of a course
+are one indexed lookup. The table is refreshed for the courses that change,
+from the signals in `core.signals`, and `deferred_conflicts` lets bulk paths
+refresh every course they touched once, on the way out.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterable
+
+from django.db import transaction
+
+_deferred = threading.local()
+
+
+def conflict_pairs(
+    rows: Iterable[tuple[int, int, int]], course_ids: Iterable[int] | None = None
+) -> set[tuple[int, int]]:
+    """Returns the (course, other) pairs of conflicting courses, in both
+    directions, from (course id, department id, level) rows. With `course_ids`
+    only the pairs touching one of them are returned."""
+    courses_of: dict[tuple[int, int], list[int]] = {}
+    for course_id, department_id, level in rows:
+        courses_of.setdefault((department_id, level), []).append(course_id)
+
+    wanted = set(course_ids) if course_ids is not None else None
+    pairs: set[tuple[int, int]] = set()
+    for courses in courses_of.values():
+        for course_id in courses:
+            if wanted is not None and course_id not in wanted:
+                continue
+            for other_id in courses:
+                if other_id != course_id:
+                    pairs.add((course_id, other_id))
+                    pairs.add((other_id, course_id))
+    return pairs
+
+
+def refresh_conflicts(course_ids: Iterable[int]):
+    """Recomputes the conflicts of the given courses, in three queries
+    whatever their number. Courses that no longer exist just lose their rows."""
+    from core.models import Course, CourseConflict
+
+    course_ids = set(course_ids)
+    if not course_ids:
+        return
+
+    if getattr(_deferred, "course_ids", None) is not None:
+        _deferred.course_ids.update(course_ids)
+        return
+
+    through = Course.departments.through
+    # The department levels of the courses, then every course holding one
+    rows = through.objects.filter(course_id__in=course_ids).values_list(
+        "department_id", "course__level"
+    )
+    department_ids = {department_id for department_id, _ in rows}
+    levels = {level for _, level in rows}
+    candidates = through.objects.filter(
+        department_id__in=department_ids, course__level__in=levels
+    ).values_list("course_id", "department_id", "course__level")
+
+    pairs = conflict_pairs(candidates, course_ids)
+
+    with transaction.atomic():
+        CourseConflict.objects.filter(course__in=course_ids).delete()
+        CourseConflict.objects.filter(other__in=course_ids).delete()
+        CourseConflict.objects.bulk_create(
+            CourseConflict(course_id=course_id, other_id=other_id)
+            for course_id, other_id in pairs
+        )
+
+
+def rebuild_conflicts():
+    """Recomputes the whole conflict table"""
+    from core.models import Course, CourseConflict
+
+    pairs = conflict_pairs(
+        Course.departments.through.objects.values_list(
+            "course_id", "department_id", "course__level"
+        )
+    )
+    with transaction.atomic():
+        CourseConflict.objects.all().delete()
+        CourseConflict.objects.bulk_create(
+            CourseConflict(course_id=course_id, other_id=other_id)
+            for course_id, other_id in pairs
+        )
+
+
+@contextmanager
+def deferred_conflicts():
+    """Collects the courses the signals would refresh inside the block and
+    refreshes them together when it exits, so saving a course and setting its
+    departments, or adding many courses, does not refresh them over and over"""
+    if getattr(_deferred, "course_ids", None) is not None:
+        # Already deferred by an outer block
+        yield
+        return
+
+    _deferred.course_ids = set()
+    try:
+        yield
+    finally:
+        course_ids = _deferred.course_ids
+        _deferred.course_ids = None
+        refresh_conflicts(course_ids)
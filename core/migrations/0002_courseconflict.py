@@ -0,0 +1,44 @@
+# Generated by Django 5.0 on 2026-10-18 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.conflicts import conflict_pairs
+
+
+def backfill_conflicts(apps, schema_editor):
+    Course = apps.get_model("core", "Course")
+    CourseConflict = apps.get_model("core", "CourseConflict")
+
+    pairs = conflict_pairs(
+        Course.departments.through.objects.values_list(
+            "course_id", "department_id", "course__level"
+        )
+    )
+    CourseConflict.objects.bulk_create(
+        CourseConflict(course_id=course_id, other_id=other_id)
+        for course_id, other_id in pairs
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseConflict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conflicts', to='core.course')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.course')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='courseconflict',
+            constraint=models.UniqueConstraint(fields=('course', 'other'), name='unique_course_conflict'),
+        ),
+        migrations.RunPython(backfill_conflicts, migrations.RunPython.noop),
+    ]
@@ -92,6 +92,25 @@ class Course(models.Model):
         return f"{self.title} ({self.code})"
 
 
+class CourseConflict(models.Model):
+    """Two courses of the same level sharing a department, see `core.conflicts`"""
+
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="conflicts"
+    )
+    other = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="+")
+
+    def __str__(self):
+        return f"{self.course} - {self.other}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("course", "other"), name="unique_course_conflict"
+            )
+        ]
+
+
 class Staff(models.Model):
     name = models.CharField(max_length=50)
     staff_id = models.CharField(
@@ -0,0 +1,48 @@
+"""
+Keeps the `CourseConflict` table in step with the courses, see `core.conflicts`.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.conflicts import refresh_conflicts
+from core.models import Course, Department
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance: Course, created: bool, **kwargs):
+    # A new course has no departments yet, they are added after it is saved
+    if not created:
+        refresh_conflicts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Course.departments.through)
+def course_departments_changed(
+    sender, instance, action: str, reverse: bool, pk_set: set[int] | None, **kwargs
+):
+    if not reverse:
+        # instance is a course
+        if action in ("post_add", "post_remove", "post_clear"):
+            refresh_conflicts([instance.pk])
+        return
+
+    # instance is a department, pk_set holds courses
+    if action == "pre_clear":
+        instance._conflict_courses = list(
+            instance.course_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        refresh_conflicts(getattr(instance, "_conflict_courses", ()))
+    elif action in ("post_add", "post_remove"):
+        refresh_conflicts(pk_set or ())
+
+
+@receiver(pre_delete, sender=Department)
+def department_deleting(sender, instance: Department, **kwargs):
+    # Its rows in Course.departments go without a m2m_changed signal
+    instance._conflict_courses = list(instance.course_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Department)
+def department_deleted(sender, instance: Department, **kwargs):
+    refresh_conflicts(getattr(instance, "_conflict_courses", ()))
@@ -3,7 +3,8 @@ import random
 from django.test import TestCase
 from django.db import IntegrityError
 
-from core.models import Department, Course
+from core.conflicts import deferred_conflicts
+from core.models import Department, Course, CourseConflict
 
 
 # Create your tests here.
@@ -49,3 +50,52 @@ class TestCourseModel(TestCase):
 
         else:
             self.assertTrue(Course.objects.count() == 10, "Added 10 courses")
+
+
+class TestCourseConflict(TestCase):
+
+    def setUp(self):
+        self.cs = Department.objects.create(title="Computer Science", code="CS")
+        self.mt = Department.objects.create(title="Mathematics", code="MT")
+
+    def add_course(self, code, level, departments):
+        course = Course.objects.create(title=code, code=code, level=level, student_count=50,
+                                       department=departments[0])
+        course.departments.set(departments)
+        return course
+
+    def others(self, course):
+        return set(CourseConflict.objects.filter(course=course).values_list("other", flat=True))
+
+    def test_conflicts_follow_course_changes(self):
+        a = self.add_course("A", 100, [self.cs])
+        b = self.add_course("B", 100, [self.cs, self.mt])
+        c = self.add_course("C", 100, [self.mt])
+        d = self.add_course("D", 200, [self.cs])
+
+        self.assertEqual(self.others(a), {b.pk})
+        self.assertEqual(self.others(b), {a.pk, c.pk})
+        self.assertEqual(self.others(d), set())
+
+        d.level = 100
+        d.save()
+        self.assertEqual(self.others(d), {a.pk, b.pk})
+
+        b.departments.remove(self.cs)
+        self.assertEqual(self.others(a), {d.pk})
+        self.assertEqual(self.others(b), {c.pk})
+
+        self.mt.course_set.clear()
+        self.assertEqual(self.others(c), set())
+
+        a.delete()
+        self.assertEqual(self.others(d), set())
+
+    def test_deferred_conflicts(self):
+        with deferred_conflicts():
+            a = self.add_course("A", 100, [self.cs])
+            b = self.add_course("B", 100, [self.cs])
+            self.assertEqual(CourseConflict.objects.count(), 0)
+
+        self.assertEqual(self.others(a), {b.pk})
+        self.assertEqual(self.others(b), {a.pk})
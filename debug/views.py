@@ -4,6 +4,7 @@ from django.http.request import HttpRequest
 from .forms import ImporterForm
 import json
 
+from core.conflicts import deferred_conflicts
 from core.models import Course, Department
 
 # Create your views here.
@@ -43,44 +44,46 @@ def handle_uploaded_file(file):
 
     imported_courses = []
 
-    for department_code in departments:
-        department_courses: dict = data[department_code]
-
-        department = Department.objects.filter(code__iexact=department_code.replace("cmp","cs")).first()
-
-        if not department:
-            print(f"{department_code} Not found")
-            continue
-
-        levels = set(department_courses.keys())
-
-        for level in levels:
-            level_courses = department_courses[level]
-
-            for temp_course in level_courses:
-                title = temp_course[0]
-                code = temp_course[1]
-                unit = temp_course[2]
-                count = temp_course[3]
-
-                try:
-                    course = Course.objects.get(code=code)
-                    if course.departments.filter(code=department.code).count() == 0:
-                        course.departments.add(department)
-                        course.student_count = course.student_count + count
+    # Every imported course is refreshed in the conflict table once, at the end
+    with deferred_conflicts():
+        for department_code in departments:
+            department_courses: dict = data[department_code]
+
+            department = Department.objects.filter(code__iexact=department_code.replace("cmp","cs")).first()
+
+            if not department:
+                print(f"{department_code} Not found")
+                continue
+
+            levels = set(department_courses.keys())
+
+            for level in levels:
+                level_courses = department_courses[level]
+
+                for temp_course in level_courses:
+                    title = temp_course[0]
+                    code = temp_course[1]
+                    unit = temp_course[2]
+                    count = temp_course[3]
+
+                    try:
+                        course = Course.objects.get(code=code)
+                        if course.departments.filter(code=department.code).count() == 0:
+                            course.departments.add(department)
+                            course.student_count = course.student_count + count
+                            course.save()
+                            imported_courses.append(course)
+
+                    except Course.DoesNotExist:
+                        course = Course(title=title, code=code)
+                        course.department = department
+                        course.student_count = count
+                        course.level = int(level)
+                        course.semester = 1
                         course.save()
+                        course.departments.set([department])
                         imported_courses.append(course)
 
-                except Course.DoesNotExist:
-                    course = Course(title=title, code=code)
-                    course.department = department
-                    course.student_count = count
-                    course.level = int(level)
-                    course.semester = 1
-                    course.save()
-                    course.departments.set([department])
-                    imported_courses.append(course)
-
     print(f"{len(imported_courses)} Courses imported")
     return {
         "departments": list(map(lambda e: e.upper(), departments)),
@@ -1,6 +1,12 @@
 from django.contrib import admin
 
-from timetable.models import Complain, Timetable, TimetableSlot, SlotCourse
+from timetable.models import (
+    Complain,
+    SlotConstraint,
+    Timetable,
+    TimetableSlot,
+    SlotCourse,
+)
 
 
 # Register your models here.
@@ -22,6 +28,12 @@ class TimetableSlotAdminModel(admin.ModelAdmin):
 class SlotCourseAdminModel(admin.ModelAdmin):
     list_display = ("course", "slot", "supervisor",)
 
+
+@admin.register(SlotConstraint)
+class SlotConstraintAdminModel(admin.ModelAdmin):
+    list_display = ("title", "timetable", "level", "department", "periods")
+
+
 @admin.register(Complain)
 class ComplainAdminModel(admin.ModelAdmin):
     list_display = ('slot_course','user','resolved',)
@@ -0,0 +1,166 @@
+"""
+Simulated annealing over the slots picked by `Generator.start`.
+
+The annealer moves single courses between slots (placing ignored courses when
+a slot can take them) and swaps courses of two slots. The cost of a schedule is
+the number of ignored courses, weighted, plus the spread penalty of the exams,
+see `timetable.objectives.SpreadObjective`, plus the seats and invigilators
+the slots are over by when overloaded slots are penalised. The generator keeps
+both up to date on every placement from the department levels of the moved
+courses alone, so no move rescores the whole schedule.
+"""
+
+import math
+from typing import TYPE_CHECKING
+
+from timetable.records import CourseRecord
+
+if TYPE_CHECKING:
+    from timetable.generator import Generator, Slot
+
+
+class Annealer:
+    def __init__(
+        self,
+        generator: "Generator",
+        iterations: int = 10000,
+        start_temperature: float = 2.0,
+        end_temperature: float = 0.05,
+        ignored_weight: int = 20,
+    ) -> None:
+        self.generator = generator
+        self.iterations = iterations
+        self.start_temperature = start_temperature
+        self.end_temperature = end_temperature
+        self.ignored_weight = ignored_weight
+
+    def cost(self) -> int:
+        cost = (
+            len(self.generator.ignored_courses) * self.ignored_weight
+            + self.generator.spread.penalty
+        )
+        if self.generator.resources is not None:
+            # Only ever above 0 when overloaded slots are penalised
+            cost += self.generator.resources.excess
+        return cost
+
+    def summary(self) -> dict:
+        return {
+            "ignored": len(self.generator.ignored_courses),
+            "same_day_exams": self.generator.spread.same_day,
+            "consecutive_day_exams": self.generator.spread.consecutive_days,
+            "cost": self.cost(),
+        }
+
+    def add(self, course: CourseRecord, slot: "Slot") -> bool:
+        return self.generator.place(course, slot)
+
+    def remove(self, course: CourseRecord):
+        self.generator.unplace(course)
+
+    def move(self, course: CourseRecord, target: "Slot") -> bool:
+        """Moves a placed or ignored course to target, returns False (with
+        nothing changed) if target can not take it"""
+        source = self.generator.placements.get(course.id)
+        if source is target:
+            return False
+
+        if source:
+            self.remove(course)
+
+        if self.add(course, target):
+            self.generator.ignored_courses.discard(course)
+            return True
+
+        if source:
+            self.add(course, source)
+        return False
+
+    def undo_move(self, course: CourseRecord, source: "Slot | None"):
+        self.remove(course)
+        if source:
+            self.add(course, source)
+        else:
+            self.generator.ignored_courses.add(course)
+
+    def swap(self, first: CourseRecord, second: CourseRecord) -> bool:
+        """Swaps the slots of two placed courses, returns False (with nothing
+        changed) if the slots can not take them"""
+        first_slot = self.generator.placements[first.id]
+        second_slot = self.generator.placements[second.id]
+        if first_slot is second_slot:
+            return False
+
+        self.remove(first)
+        self.remove(second)
+
+        if self.add(first, second_slot):
+            if self.add(second, first_slot):
+                return True
+            self.remove(first)
+
+        self.add(first, first_slot)
+        self.add(second, second_slot)
+        return False
+
+    def run(self) -> dict:
+        """Anneals the schedule, until the budget of the generator runs out,
+        and returns the iterations it ran and the cost summary before and
+        after"""
+        generator = self.generator
+        rng = generator.random
+        courses = generator.courses
+        slots = generator.slots
+        before = self.summary()
+
+        if not courses or len(slots) < 2 or self.iterations < 1:
+            return {"iterations": 0, "before": before, "after": before}
+
+        best_cost = self.cost()
+        best_placements = dict(generator.placements)
+        cooling = (self.end_temperature / self.start_temperature) ** (1 / self.iterations)
+        temperature = self.start_temperature
+
+        iterations = 0
+        while iterations < self.iterations and not generator.out_of_time("annealing"):
+            iterations += 1
+            temperature *= cooling
+            cost = self.cost()
+            course = rng.choice(courses)
+            source = generator.placements.get(course.id)
+
+            if source and rng.random() < 0.5:
+                other = rng.choice(courses)
+                if other.id not in generator.placements or not self.swap(course, other):
+                    continue
+                delta = self.cost() - cost
+                if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+                    self.swap(course, other)
+            else:
+                if not self.move(course, rng.choice(slots)):
+                    continue
+                delta = self.cost() - cost
+                if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+                    self.undo_move(course, source)
+
+            if self.cost() < best_cost:
+                best_cost = self.cost()
+                best_placements = dict(generator.placements)
+
+        if self.cost() > best_cost:
+            self.restore(best_placements)
+
+        return {"iterations": iterations, "before": before, "after": self.summary()}
+
+    def restore(self, placements: dict[int, "Slot"]):
+        """Puts every course back in the slot it has in placements"""
+        generator = self.generator
+        for course in generator.courses:
+            if course.id in generator.placements:
+                self.remove(course)
+
+        generator.ignored_courses.clear()
+        for course in generator.courses:
+            slot = placements.get(course.id)
+            if not slot or not self.add(course, slot):
+                generator.ignored_courses.add(course)
@@ -17,7 +17,7 @@ from django.http import FileResponse, HttpResponse
 from rest_framework.viewsets import ViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from core.models import Course, Department, Staff, Venue
+from core.models import Course, CourseConflict, Department, Staff, Venue
 from core.serializers import (
     CourseSerializer,
     DepartmentSerializer,
@@ -27,21 +27,26 @@ from core.serializers import (
 from timetable.forms import (
     AddSlotCourseForm,
     AddTimetableForm,
+    GenerateOptionsForm,
     NewComplainForm,
     NewComplainMessageForm,
+    SlotConstraintForm,
     TimetableConfigurationForm,
     UpdateSlotCourse,
 )
 
 from timetable.qeueing import Queue, each
+from timetable.repair import REPAIR_DEPTH
 
 from timetable.models import (
+    INVIGILATION_FLOW,
     Complain,
     ComplainMessage,
+    SlotConstraint,
     SlotCourse,
     Timetable,
     TimetableSlot,
-    assign_invigilator,
+    assign_slot_venues,
     slot_courses,
 )
 from timetable.serializers import (
@@ -49,6 +54,7 @@ from timetable.serializers import (
     CreatedTimetableSerializer,
     MinimalTimetableSlotSeriallizer,
     complainSerializer,
+    SlotConstraintSerializer,
     SlotCourseSeriallizer,
     TimetableSerializer,
     TimetableSlotSeriallizer,
@@ -134,9 +140,7 @@ class TimetableViewSet(ViewSet):
             if request_method == "DELETE":
                 courses_pk: list[int] = request.data  # type: ignore
                 courses_to_remove = Course.objects.filter(Q(pk__in=courses_pk))
-
-                for course in courses_to_remove:
-                    timetable.courses.remove(course)
+                timetable.remove_courses(courses_to_remove)
 
                 return Response(CourseSerializer(courses_to_remove, many=True).data)
 
@@ -158,6 +162,45 @@ class TimetableViewSet(ViewSet):
                 data={"details": "Timetable not found"},
             )
 
+    @action(
+        detail=True, methods=("POST",), permission_classes=(IsAuthenticated, IsAdmin)
+    )
+    def place_courses(self, request: Request, pk=None):
+        """Adds courses to an already generated timetable and places them into
+        its existing slots, without regenerating the timetable
+
+        Returns:
+            404 : Timetable not found
+            409 : Timetable has not been generated yet
+            200 : The slot courses of the placed courses and the courses that
+            could not be placed
+        """
+
+        try:
+            timetable = Timetable.objects.get(pk=pk)
+            courses_pk: list[int] = request.data  # type: ignore
+            courses_to_place = Course.objects.filter(Q(pk__in=courses_pk))
+
+            placed, unplaced = timetable.place_courses(courses_to_place)
+
+            return Response(
+                {
+                    "placed": SlotCourseSeriallizer(placed, many=True).data,
+                    "unplaced": CourseSerializer(unplaced, many=True).data,
+                }
+            )
+
+        except Timetable.DoesNotExist:
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data={"details": "Timetable not found"},
+            )
+        except Timetable.NotGenerated as e:
+            return Response(
+                status=status.HTTP_409_CONFLICT,
+                data={"details": "Timetable has not been generated", "errors": str(e)},
+            )
+
     @action(detail=True, methods=["GET"])
     def courses_by_slot_course(self, request: Request, pk=None):
         """
@@ -252,6 +295,64 @@ class TimetableViewSet(ViewSet):
                 data={"details": "Timetable not found"},
             )
 
+    @action(detail=True, methods=["POST", "GET", "DELETE"])
+    def constraints(self, request: Request, pk=None):
+        """
+        Route for handling listing, adding and deleting the slot constraints
+        of a table, see `timetable.domains`. They apply from the next
+        generation of the timetable.
+
+        Returns:
+            404 : Timetable not found
+            400 : Invalid form was provided
+            200 : The constraints listed, added or deleted
+        """
+
+        try:
+            timetable = Timetable.objects.get(pk=pk)
+            request_method = request._request.method
+
+            if request_method in ("POST", "DELETE") and not userIsAdmin(request):
+                raise PermissionDenied("Only admin users can change slot constraints")
+
+            if request_method == "DELETE":
+                constraint_pks: list[int] = request.data  # type: ignore
+                constraints_to_remove = SlotConstraint.objects.filter(
+                    timetable=timetable.pk, pk__in=constraint_pks
+                )
+                removed = SlotConstraintSerializer(constraints_to_remove, many=True).data
+                constraints_to_remove.delete()
+
+                return Response(removed)
+
+            elif request_method == "POST":
+                form = SlotConstraintForm(request.data)  # type: ignore
+                if not form.is_valid():
+                    return Response(
+                        status=status.HTTP_400_BAD_REQUEST,
+                        data={
+                            "details": "Invalid form was provided",
+                            "errors": form.errors,
+                        },
+                    )
+
+                with transaction.atomic():
+                    constraint: SlotConstraint = form.save(commit=False)
+                    constraint.timetable = timetable
+                    constraint.save()
+                    form.save_m2m()
+
+                return Response(SlotConstraintSerializer(constraint).data)
+            else:
+                constraints = timetable.constraints.filter()  # type: ignore
+                return Response(SlotConstraintSerializer(constraints, many=True).data)
+
+        except Timetable.DoesNotExist:
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data={"details": "Timetable not found"},
+            )
+
     @action(
         detail=True, methods=("POST",), permission_classes=(IsAuthenticated, IsAdmin)
     )
@@ -512,6 +613,9 @@ class TimetableViewSet(ViewSet):
             course_slot.venues.set(venues)
             course_slot.invigilators.set(invigilators)
             course_slot.supervisor = supervisor
+            # Pinned slot courses survive partial regenerations
+            if data["pinned"] is not None:
+                course_slot.pinned = data["pinned"]
 
             course_slot.save()
 
@@ -584,6 +688,7 @@ class TimetableViewSet(ViewSet):
 
             slot_course: SlotCourse = form.save(commit=False)
             slot_course.slot = slot
+            slot_course.pinned = form.cleaned_data["pinned"]
             slot_course.save()
 
             return Response(
@@ -634,32 +739,107 @@ class TimetableViewSet(ViewSet):
 
     @action(detail=True, permission_classes=(IsAuthenticated, IsAdmin))
     def generate(self, request: Request, pk=None):
+        """Generates the timetable and assigns its invigilators
+
+        Courses a slot has no seats or invigilators for are only rejected while
+        slotting with `?resources=reject`, or counted against the slot with
+        `?resources=penalise`. Left out, resources are not checked until the
+        venues are assigned, see `Timetable.generate`.
+
+        Returns:
+            400 : Invalid generation options
+            404 : Timetable not found
+            200 : The generation and invigilation summary
+        """
         try:
             timetable = Timetable.objects.get(pk=pk)
-            result = timetable.generate()
-            timetable.auto_assign_invigilators()
+        except Timetable.DoesNotExist:
             return Response(
-                result
+                status=status.HTTP_404_NOT_FOUND, data={"detail": "Timetable not fount"}
             )
 
+        # Only the options are user input, errors of the run are not
+        form = GenerateOptionsForm(data=request.query_params)
+        if not form.is_valid():
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={"details": "Invalid generation option", "errors": form.errors},
+            )
+        options = form.cleaned_data
+
+        budget = timetable.generation_budget(options["budget"])
+        result = timetable.generate(
+            strategy=options["strategy"] or None,
+            restarts=options["restarts"] or 1,
+            workers=options["workers"],
+            anneal=options["anneal"] or 0,
+            seed=options["seed"],
+            share_venues=options["share_venues"],
+            resources=options["resources"],
+            repair=REPAIR_DEPTH if options["repair"] is None else options["repair"],
+            partial=options["partial"],
+            budget=budget,
+        )
+        (_, unasigned_slot_courses, workload) = timetable.auto_assign_invigilators(
+            options["invigilation"] or INVIGILATION_FLOW,
+            options["max_duties"],
+            budget,
+        )
+        result["uninvigilated"] = [
+            slot_course.pk for slot_course in unasigned_slot_courses
+        ]
+        result["workload"] = workload
+        result["truncated"] = bool(budget.truncated)
+        result["truncated_phases"] = list(budget.truncated)
+        return Response(
+            result
+        )
+
+    @action(
+        detail=True, methods=("POST",), permission_classes=(IsAuthenticated, IsAdmin)
+    )
+    def cancel_generation(self, request: Request, pk=None):
+        """Cancels the running generation of the timetable, it stops with what
+        it has done so far and reports itself as truncated"""
+        try:
+            timetable = Timetable.objects.get(pk=pk)
+            timetable.cancel_generation()
+            return Response({"details": "Generation cancelled"})
         except Timetable.DoesNotExist:
             return Response(
-                status=status.HTTP_404_NOT_FOUND, data={"detail": "Timetable not fount"}
+                status=status.HTTP_404_NOT_FOUND,
+                data={"details": "Timetable not found"},
             )
 
     @action(
         detail=True, methods=("POST",), permission_classes=(IsAuthenticated, IsAdmin)
     )
     def auto_assign_invigilators(self, request: Request, pk=None):
-        """Tries to assign invigilators to all the courses in the timetable"""
+        """Tries to assign invigilators to all the courses in the timetable, the
+        `mode` query parameter picks the invigilation mode"""
         try:
             timetable = Timetable.objects.get(pk=pk)
-            (slots, unasigned_slots) = timetable.auto_assign_invigilators()
-            return Response(TimetableSlotSeriallizer(slots, many=True).data)
-        except TimetableSlot.DoesNotExist:
+            max_duties = request.query_params.get("max_duties", None)
+            (slots, unasigned_slots, workload) = timetable.auto_assign_invigilators(
+                request.query_params.get("mode", INVIGILATION_FLOW),
+                int(max_duties) if max_duties else None,
+            )
+            return Response(
+                {
+                    "slots": TimetableSlotSeriallizer(slots, many=True).data,
+                    "workload": workload,
+                    "unassigned": [slot_course.pk for slot_course in unasigned_slots],
+                }
+            )
+        except (Timetable.DoesNotExist, TimetableSlot.DoesNotExist):
             return Response(
                 status=status.HTTP_404_NOT_FOUND, data={"details": "Slot not found"}
             )
+        except ValueError as e:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={"details": "Invalid invigilation mode", "errors": str(e)},
+            )
 
     @action(
         detail=True, methods=("POST",), permission_classes=(IsAuthenticated, IsAdmin)
@@ -680,32 +860,14 @@ class TimetableViewSet(ViewSet):
                         data={"details": "No venues for timetable"},
                     )
 
-                slot_courses = SlotCourse.objects.filter(slot=pk).order_by(
-                    "course__student_count"
-                )
+                slot_courses = SlotCourse.objects.filter(slot=slot.pk).order_by(
+                    "-course__student_count"
+                ).select_related("course")
 
                 if len(slot_courses) == 0:
                     continue
 
-                adjacent_slot_courses = SlotCourse.objects.filter(
-                    slot__day=slot.day,
-                ).exclude(pk=slot.pk)
-
-                used_venues: set[Venue] = set()
-                each(
-                    lambda sCourse: used_venues.update(sCourse.venues.all()),
-                    adjacent_slot_courses,
-                )
-
-                available_venues = set(slot.timetable.venues.all())
-                # - used_venues
-
-                if len(available_venues) < 1:
-                    available_venues = set(slot.timetable.venues.all())
-
-                for slot_course in slot_courses:
-                    slot_course.auto_assign_venues(available_venues)
-                    available_venues = available_venues - set(slot_course.venues.all())
+                assign_slot_venues(slot_courses, all_venues)
 
             return Response(TimetableSlotSeriallizer(slots, many=True).data)
         except Timetable.DoesNotExist:
@@ -873,21 +1035,37 @@ class SlotCourseViewSet(ViewSet):
     @action(
         detail=True, methods=("POST",), permission_classes=(IsAuthenticated, IsAdmin)
     )
-    def auto_assign_invigilator(self, Request: Request, pk=None):
+    def auto_assign_invigilator(self, request: Request, pk=None):
+        """Assigns the invigilators of a slot course, balancing their duties
+        with the rest of its timetable, see `Timetable.auto_assign_invigilators`"""
         try:
-            slot_course = SlotCourse.objects.get(pk=pk)
-            # slot_course.auto_assign_invigilator()
-            assign_invigilator(slot_course)
-            return Response(SlotCourseSeriallizer(slot_course).data)
-        except SlotCourse.NoStaffAvailable as e:
-            return Response(
-                status=status.HTTP_412_PRECONDITION_FAILED,
-                data={"details": "No staff avaialble", "error": str(e)},
+            slot_course = SlotCourse.objects.select_related("slot__timetable").get(pk=pk)
+            if not slot_course.venues.exists():
+                return Response(
+                    status=status.HTTP_406_NOT_ACCEPTABLE,
+                    data={
+                        "details": "No venue assigned",
+                        "error": "No venue(s) was assigned to slot course",
+                    },
+                )
+
+            slot_course.slot.timetable.auto_assign_invigilators(
+                request.query_params.get("mode", INVIGILATION_FLOW),
+                slot_courses=[slot_course.pk],
             )
-        except SlotCourse.NoVenueAssigned as e:
+            if not slot_course.invigilators.exists():
+                return Response(
+                    status=status.HTTP_412_PRECONDITION_FAILED,
+                    data={
+                        "details": "No staff avaialble",
+                        "error": "No available staff to invigilate slot course",
+                    },
+                )
+            return Response(SlotCourseSeriallizer(slot_course).data)
+        except ValueError as e:
             return Response(
-                status=status.HTTP_406_NOT_ACCEPTABLE,
-                data={"details": "No venue assigned", "error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+                data={"details": "Invalid invigilation mode", "errors": str(e)},
             )
         except SlotCourse.DoesNotExist:
             return Response(
@@ -914,31 +1092,13 @@ class SlotViewSet(ViewSet):
             )
 
         slot_courses = SlotCourse.objects.filter(slot=pk).order_by(
-            "course__student_count"
-        )
+            "-course__student_count"
+        ).select_related("course")
 
         if len(slot_courses) == 0:
             return Response(TimetableSlotSeriallizer(slot).data)
 
-        adjacent_slot_courses = SlotCourse.objects.filter(
-            slot__day=slot.day,
-        ).exclude(pk=slot.pk)
-
-        used_venues: set[Venue] = set()
-        each(
-            lambda sCourse: used_venues.update(sCourse.venues.all()),
-            adjacent_slot_courses,
-        )
-
-        available_venues = set(slot.timetable.venues.all())
-        # - used_venues
-
-        if len(available_venues) < 1:
-            available_venues = set(slot.timetable.venues.all())
-
-        for slot_course in slot_courses:
-            slot_course.auto_assign_venues(available_venues)
-            available_venues = available_venues - set(slot_course.venues.all())
+        assign_slot_venues(slot_courses, all_venues)
 
         return Response(TimetableSlotSeriallizer(slot).data)
 
@@ -948,18 +1108,18 @@ class SlotViewSet(ViewSet):
     def auto_assign_invigilators(self, request: Request, pk=None):
         """Tries to assign invigilators to all the courses in a slot"""
         try:
-            slot = TimetableSlot.objects.get(pk=pk)
-            all_slot_courses = slot_courses([slot])
-
-            unasigned_slot_courses: set[SlotCourse] = set()
-
-            for slot_course in all_slot_courses:
-                try:
-                    assign_invigilator(slot_course)
-                except SlotCourse.NoStaffAvailable:
-                    unasigned_slot_courses.add(slot_course)
+            slot = TimetableSlot.objects.select_related("timetable").get(pk=pk)
+            slot.timetable.auto_assign_invigilators(
+                request.query_params.get("mode", INVIGILATION_FLOW),
+                slot_courses=slot_courses([slot]).values_list("pk", flat=True),
+            )
 
             return Response(TimetableSlotSeriallizer(slot).data)
+        except ValueError as e:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={"details": "Invalid invigilation mode", "errors": str(e)},
+            )
         except TimetableSlot.DoesNotExist:
             return Response(
                 status=status.HTTP_404_NOT_FOUND, data={"details": "Slot not found"}
@@ -1016,24 +1176,23 @@ class ComplainViewSet(ViewSet):
 
         try:
             slot_course = SlotCourse.objects.get(pk=pk)
-            similar_courses = SlotCourse.objects.filter(
-                slot=slot_course.slot.pk, course__level=slot_course.course.level
+            course = slot_course.course
+            # The slot course itself and the ones its course conflicts with
+            level_conflicts = Q(pk=slot_course.pk) | Q(
+                course__in=CourseConflict.objects.filter(course=course.pk).values(
+                    "other"
+                )
             )
-            matchies: set[SlotCourse] = set([])
-
-            departments = set(slot_course.course.departments.all())
-
-            for course in similar_courses:
-                if course.course.department == slot_course.course.department:
-                    matchies.add(course)
-                    continue
-                if course.course.departments.contains(slot_course.course.department):
-                    matchies.add(course)
-
-                similar_departments = set(course.course.departments.all())
-
-                if len(departments.intersection(similar_departments)) > 0:
-                    matchies.add(course)
+            # The conflict table only knows the departments of the courses, the
+            # main department of the course matches too even when it is not one
+            if course.department_id is not None:
+                level_conflicts |= Q(course__level=course.level) & (
+                    Q(course__department=course.department_id)
+                    | Q(course__departments=course.department_id)
+                )
+            matchies = SlotCourse.objects.filter(
+                level_conflicts, slot=slot_course.slot_id
+            ).distinct()
 
             return Response(SlotCourseSeriallizer(matchies, many=True).data)
         except SlotCourse.DoesNotExist:
@@ -0,0 +1,70 @@
+"""
+Microbenchmarks of `timetable.qeueing.Queue`.
+
+Run with `python -m timetable.bench_qeueing`, every operation is timed 1000
+times on queues of 10k and 100k items.
+"""
+
+import time
+from typing import Callable
+
+from timetable.qeueing import Queue
+
+SIZES = (10_000, 100_000)
+OPERATIONS = 1000
+DEPARTMENTS = 50
+
+
+def timed(setup: Callable[[int], Queue], run: Callable[[Queue], object], size: int):
+    queue = setup(size)
+    start = time.perf_counter()
+    for _ in range(OPERATIONS):
+        run(queue)
+    return (time.perf_counter() - start) * 1000
+
+
+def benchmarks() -> dict[str, tuple[Callable[[int], Queue], Callable[[Queue], object]]]:
+    def numbers(size: int):
+        return Queue(list(range(size)))
+
+    def departments(size: int):
+        # Items are (id, department), the last department is the rarest
+        return Queue([(item, item % DEPARTMENTS) for item in range(size)])
+
+    cases: dict[str, tuple[Callable[[int], Queue], Callable[[Queue], object]]] = {
+        "pop": (numbers, lambda queue: queue.pop()),
+        "push": (numbers, lambda queue: queue.push(0)),
+        "shift": (numbers, lambda queue: queue.shift()),
+        "magic_refilling": (
+            departments,
+            lambda queue: queue.magic_refilling(
+                lambda item: item[1] == DEPARTMENTS - 1
+            ),
+        ),
+    }
+
+    if hasattr(Queue, "magic_refilling_by_key"):
+
+        def keyed_departments(size: int):
+            return Queue(
+                [(item, item % DEPARTMENTS) for item in range(size)],
+                key=lambda item: item[1],
+            )
+
+        cases["magic_refilling_by_key"] = (
+            keyed_departments,
+            lambda queue: queue.magic_refilling_by_key(DEPARTMENTS - 1),
+        )
+
+    return cases
+
+
+def main():
+    print(f"{'operation':<24}" + "".join(f"{size:>12}" for size in SIZES))
+    for name, (setup, run) in benchmarks().items():
+        times = [timed(setup, run, size) for size in SIZES]
+        print(f"{name:<24}" + "".join(f"{time_:>10.2f}ms" for time_ in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Wall clock budget and cooperative cancellation of a generation.
+
+Every phase of a generation (slotting, annealing, repair, venues and
+invigilators) checks `Budget.exhausted` in its loop and stops when it is, with
+what it has done so far: courses it did not get to are left ignored, without
+venues or without invigilators, so the timetable stays consistent. The phase
+is recorded in `Budget.truncated`.
+
+The deadline is a wall clock time, so a budget sent to a worker process keeps
+it. The cancellation check, usually a cache lookup, is only made every
+`interval` seconds and is not sent to workers, they stop at the deadline.
+"""
+
+import time
+from typing import Callable
+
+
+class Budget:
+    def __init__(
+        self,
+        seconds: float | None = None,
+        cancelled: Callable[[], bool] | None = None,
+        interval: float = 0.25,
+    ) -> None:
+        """
+        Args:
+            seconds (float | None): Time the generation has, unbounded when None
+            cancelled (Callable[[], bool] | None): Returns True once the
+                generation is cancelled
+            interval (float): Seconds between two cancellation checks
+        """
+        self.deadline = time.time() + seconds if seconds is not None else None
+        self.cancelled = cancelled
+        self.interval = interval
+        self.checked = time.time()
+        self.stopped = False
+        # The phases that stopped before their end, in order
+        self.truncated: list[str] = []
+
+    def __getstate__(self):
+        return (self.deadline, self.interval, self.stopped, self.truncated)
+
+    def __setstate__(self, state):
+        self.deadline, self.interval, self.stopped, self.truncated = state
+        self.cancelled = None
+        self.checked = time.time()
+
+    def exhausted(self) -> bool:
+        """Returns True once the deadline is past or the generation is
+        cancelled, and from then on"""
+        if self.stopped:
+            return True
+        if self.deadline is None and self.cancelled is None:
+            return False
+
+        now = time.time()
+        if self.deadline is not None and now >= self.deadline:
+            self.stopped = True
+        elif self.cancelled is not None and now - self.checked >= self.interval:
+            self.checked = now
+            self.stopped = self.cancelled()
+        return self.stopped
+
+    def truncate(self, phase: str):
+        """Records that a phase stopped before its end"""
+        if phase not in self.truncated:
+            self.truncated.append(phase)
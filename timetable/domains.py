@@ -0,0 +1,91 @@
+"""
+Slot domains: the slots each course may be written in.
+
+The slot constraints of a timetable, see `timetable.models.SlotConstraint`,
+are compiled against its real dates into one integer mask per course, with bit
+`index - 1` set when the course may be written in the slot of that index. A
+course matched by several constraints keeps the slots all of them allow.
+Courses no constraint restricts are left out, so a generation without
+constraints carries an empty mapping and every slot check is a dict lookup.
+"""
+
+import datetime
+from typing import Iterable
+
+from timetable.records import CourseRecord, SlotConstraintRecord
+
+
+def constraint_mask(
+    constraint: SlotConstraintRecord, days: list[str], slot_per_day: int
+) -> int:
+    """Returns the mask of the slots a constraint allows
+
+    Args:
+        days (list[str]): The "YYYY-MM-DD" dates of the days of the timetable,
+            in order, see `Timetable.timetable_days`
+    """
+    periods = [
+        period
+        for period in range(slot_per_day)
+        if not constraint.periods or period + 1 in constraint.periods
+    ]
+
+    mask = 0
+    for position, day in enumerate(days):
+        if constraint.not_before and day < constraint.not_before:
+            continue
+        if constraint.not_after and day > constraint.not_after:
+            continue
+        if (
+            constraint.excluded_week_days
+            and datetime.date.fromisoformat(day).weekday()
+            in constraint.excluded_week_days
+        ):
+            continue
+        for period in periods:
+            mask |= 1 << (position * slot_per_day + period)
+    return mask
+
+
+def matches(constraint: SlotConstraintRecord, course: CourseRecord) -> bool:
+    """A constraint matches a course that is in every scope it sets"""
+    if constraint.courses and course.id not in constraint.courses:
+        return False
+    if constraint.level is not None and course.level != constraint.level:
+        return False
+    if constraint.department is not None and constraint.department != course.department:
+        return any(
+            department.id == constraint.department for department in course.departments
+        )
+    return True
+
+
+def compile_domains(
+    constraints: Iterable[SlotConstraintRecord],
+    courses: Iterable[CourseRecord],
+    days: list[str],
+    slot_per_day: int,
+) -> dict[int, int]:
+    """Returns the mask of the slots every restricted course may be written
+    in, by course id, in O(constraints x courses). A course no slot is left
+    for gets 0 and is ignored by the generator.
+
+    Args:
+        days (list[str]): The "YYYY-MM-DD" dates of the days of the timetable
+        slot_per_day (int): Slots of a day
+    """
+    masks = [
+        (constraint, constraint_mask(constraint, days, slot_per_day))
+        for constraint in constraints
+    ]
+    every_slot = (1 << (len(days) * slot_per_day)) - 1
+
+    domains: dict[int, int] = {}
+    for course in courses:
+        domain = every_slot
+        for constraint, mask in masks:
+            if matches(constraint, course):
+                domain &= mask
+        if domain != every_slot:
+            domains[course.id] = domain
+    return domains
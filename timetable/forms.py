@@ -1,7 +1,16 @@
 from django import forms
 from core.models import Course
 
-from timetable.models import ComplainMessage, SlotCourse, Timetable, Complain
+from timetable.models import (
+    INVIGILATION_MODES,
+    ComplainMessage,
+    SlotConstraint,
+    SlotCourse,
+    Timetable,
+    Complain,
+)
+from timetable.resources import RESOURCES_MODES
+from timetable.strategies import STRATEGIES
 
 
 class AddTimetableForm(forms.ModelForm):
@@ -22,6 +31,73 @@ class TimetableConfigurationForm(forms.ModelForm):
         )
 
 
+class SlotConstraintForm(forms.ModelForm):
+    class Meta:
+        model = SlotConstraint
+        fields = (
+            "title",
+            "courses",
+            "level",
+            "department",
+            "periods",
+            "excluded_week_days",
+            "not_before",
+            "not_after",
+        )
+
+    def clean_periods(self):
+        periods = self.cleaned_data["periods"] or []
+        if not isinstance(periods, list) or not all(
+            isinstance(period, int) and period >= 1 for period in periods
+        ):
+            raise forms.ValidationError("Periods must be a list of slots of a day, from 1")
+        return periods
+
+    def clean_excluded_week_days(self):
+        week_days = self.cleaned_data["excluded_week_days"] or []
+        if not isinstance(week_days, list) or not all(
+            isinstance(week_day, int) and 0 <= week_day <= 6 for week_day in week_days
+        ):
+            raise forms.ValidationError(
+                "Excluded week days must be a list of week days, from 0 (Monday) to 6"
+            )
+        return week_days
+
+
+class GenerateOptionsForm(forms.Form):
+    """Query parameters of the generate route, checked before it runs"""
+
+    strategy = forms.ChoiceField(
+        choices=[(name, name) for name in STRATEGIES], required=False
+    )
+    restarts = forms.IntegerField(min_value=1, required=False)
+    workers = forms.IntegerField(min_value=1, required=False)
+    anneal = forms.IntegerField(min_value=0, required=False)
+    seed = forms.IntegerField(min_value=0, required=False)
+    share_venues = forms.BooleanField(required=False)
+    # Opt-in, "reject" or "penalise". Left out, or "0", "false" and "none",
+    # resources are not checked while slotting, see `Timetable.generate`
+    resources = forms.CharField(required=False)
+    repair = forms.IntegerField(min_value=0, required=False)
+    partial = forms.BooleanField(required=False)
+    # Seconds the generation, invigilators included, has
+    budget = forms.FloatField(min_value=0, required=False)
+    invigilation = forms.ChoiceField(
+        choices=[(mode, mode) for mode in INVIGILATION_MODES], required=False
+    )
+    max_duties = forms.IntegerField(min_value=1, required=False)
+
+    def clean_resources(self):
+        resources = self.cleaned_data["resources"]
+        if resources in ("", "0", "false", "none"):
+            return None
+        if resources not in RESOURCES_MODES:
+            raise forms.ValidationError(
+                f"Resources must be one of {', '.join(RESOURCES_MODES)}"
+            )
+        return resources
+
+
 class UpdateSlotCourse(forms.Form):
     venues = forms.Field(
         widget=forms.SelectMultiple,
@@ -29,9 +105,14 @@ class UpdateSlotCourse(forms.Form):
     )
     invigilators = forms.Field(widget=forms.SelectMultiple, required=False)
     supervisor = forms.IntegerField(min_value=1)
+    # Left out, the slot course keeps its pin
+    pinned = forms.NullBooleanField(required=False)
 
 
 class AddSlotCourseForm(forms.ModelForm):
+    # Added slot courses are only pinned when asked to
+    pinned = forms.BooleanField(required=False)
+
     class Meta:
         model = SlotCourse
         fields = ("supervisor", "course", "slot")
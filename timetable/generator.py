@@ -1,203 +1,858 @@
-from django.db import transaction
-from django.db.models import Q, Count
-from django.utils import log
-from core.models import Department, Course, Venue, Staff
-from typing import Iterable, TypeAlias, TypeVar, Callable, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
 import math
+import os
 import random
 
-from timetable.qeueing import Queue, each
+from timetable.annealing import Annealer
+from timetable.budget import Budget
+from timetable.objectives import SpreadObjective
+from timetable.qeueing import each
+from timetable.repair import Repair
+from timetable.records import CourseRecord, DepartmentRecord, VenueRecord
+from timetable.resources import RESOURCES_MODES, RESOURCES_REJECT, SlotResources
+from timetable.strategies import get_strategy
+from timetable.venues import SharedVenuePool, VenuePool
+
+# Fewest courses a generation needs before its independent components are
+# slotted apart, below that splitting and merging them costs more than it saves
+COMPONENT_MIN_COURSES = 1000
+
+
+class DepartmentLevelIndex:
+    """Interns (department code, level) pairs into bit positions so a slot can
+    describe the department levels it holds as a single integer mask.
+
+    The mask of each course is computed once and cached by the course id.
+    """
+
+    def __init__(self) -> None:
+        self.bits: dict[tuple[str, int], int] = {}
+        self.keys: list[tuple[str, int]] = []
+        self.course_masks: dict[int, int] = {}
+
+    def bit(self, department_code: str, level: int) -> int:
+        key = (department_code, level)
+        if key not in self.bits:
+            self.bits[key] = len(self.keys)
+            self.keys.append(key)
+        return self.bits[key]
+
+    def course_mask(self, course: CourseRecord) -> int:
+        if course.id in self.course_masks:
+            return self.course_masks[course.id]
+
+        mask = 0
+        for department in course.departments:
+            mask |= 1 << self.bit(department.code, course.level)
+
+        self.course_masks[course.id] = mask
+        return mask
+
+    def decode(self, mask: int) -> dict[str, set[int]]:
+        """Converts a mask back to the {department code: levels} mapping"""
+        departments: dict[str, set[int]] = {}
+        while mask:
+            lowest = mask & -mask
+            code, level = self.keys[lowest.bit_length() - 1]
+            departments.setdefault(code, set()).add(level)
+            mask ^= lowest
+        return departments
 
 
 class Slot:
-    def __init__(self, index: int) -> None:
+    def __init__(
+        self,
+        index: int,
+        levels: DepartmentLevelIndex | None = None,
+        day: int | None = None,
+    ) -> None:
         self.index = index
-        self.courses: set[Course] = set()
-        self.departments: dict[str, set[int]] = {}
+        self.day = day
+        self.levels = levels if levels is not None else DepartmentLevelIndex()
+        self.courses: set[CourseRecord] = set()
+        self.mask = 0
         pass
 
+    @property
+    def departments(self) -> dict[str, set[int]]:
+        return self.levels.decode(self.mask)
+
     def clear(self):
-        self.courses: set[Course] = set()
-        self.departments: dict[str, set[int]] = {}
+        self.courses: set[CourseRecord] = set()
+        self.mask = 0
 
-    def has_level(self, level: int, department: Department):
-        if department.code not in self.departments:
+    def has_level(self, level: int, department: DepartmentRecord):
+        bit = self.levels.bits.get((department.code, level))
+        if bit is None:
             return False
 
-        levels = self.departments[department.code]
-        return level in levels
+        return bool(self.mask >> bit & 1)
 
     def slot_day(self, slot_per_day: int):
+        if self.day is not None:
+            return self.day
         return math.ceil(self.index / slot_per_day)
 
-    def add_course(self, course: Course) -> bool:
-        for department in course.departments.all():
-            if self.has_level(course.level, department):
-                return False
+    def add_course(self, course: CourseRecord) -> bool:
+        mask = self.levels.course_mask(course)
+        if self.mask & mask:
+            return False
 
         self.courses.add(course)
-
-        for department in course.departments.all():
-            # Loop over each department of the course
-            if department.code not in self.departments:
-                self.departments[department.code] = set()
-
-            self.departments[department.code].add(course.level)
+        self.mask |= mask
 
         return True
 
-    def remove_course(self, course_to_remove: Course):
+    def remove_course(self, course_to_remove: CourseRecord):
         if course_to_remove not in self.courses:
             return True
 
         self.courses.remove(course_to_remove)
-        self.departments.clear()
-
-        for course in self.courses:
-            # loop over the courses in the slot
-
-            for department in course.departments.all():
-                # Loop over each department of the course
-                if department.code not in self.departments:
-                    self.departments[department.code] = set([course.level])
-
-                else:
-                    self.departments[department.code].add(course.level)
+        # Courses sharing a slot never share a department level, so the bits of
+        # the removed course belong to it alone
+        self.mask &= ~self.levels.course_mask(course_to_remove)
         return True
 
 
 class Generator:
     def __init__(
         self,
-        courses: list[Course],
+        courses: list[CourseRecord],
         slot_per_day: int,
         days_count: int,
+        strategy: str | None = None,
+        seed: int | None = None,
+        conflicts: dict[int, tuple[int, ...]] | None = None,
+        workers: int = 1,
+        domains: dict[int, int] | None = None,
+        pinned: dict[int, int] | None = None,
+        budget: Budget | None = None,
     ) -> None:
-        self.courses = courses
+        # Time every phase has and cancellation, see `timetable.budget`
+        self.budget = budget if budget is not None else Budget()
+        # Slot indexes of the pinned courses by course id, they are put there
+        # before anything else and never moved, `courses` are the others
+        self.pinned = pinned or {}
+        self.pinned_courses = [course for course in courses if course.id in self.pinned]
+        self.courses = [course for course in courses if course.id not in self.pinned]
+        # Masks of the slots the restricted courses may be written in, by
+        # course id, see `timetable.domains`. Other courses may use any slot.
+        self.domains = domains or {}
+        self.domain_slots: dict[int, tuple[Slot, ...]] = {}
+        # Processes the independent components of the courses are slotted on,
+        # see `start`, they never change the result
+        self.workers = workers
+        # Persisted course conflicts by course id, strategies build the
+        # conflict graph from the department level masks when they are None
+        self.conflicts = conflicts
         self.slot_per_day = slot_per_day
         self.days_count = days_count
+        self.strategy = get_strategy(strategy)
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        self.ignored_courses: set[CourseRecord] = set()
+        self.placements: dict[int, Slot] = {}
+        self.annealing: dict | None = None
+        self.repairing: dict | None = None
+        # Seats, venues and invigilators checked at placement, see `use_resources`
+        self.resources: SlotResources | None = None
+
+        self.levels = DepartmentLevelIndex()
+        self.spread = SpreadObjective(self.levels)
+
+        # grid[day - 1] holds the slots of a day in order, ordered_slots every
+        # slot by index and neighbours[index - 1] the slots next to a slot on
+        # the same day. They never change, strategies shuffle `slots`, the
+        # candidate order, instead.
+        self.grid: list[tuple[Slot, ...]] = [
+            tuple(
+                Slot(day * slot_per_day + period + 1, self.levels, day + 1)
+                for period in range(slot_per_day)
+            )
+            for day in range(days_count)
+        ]
+        self.ordered_slots: tuple[Slot, ...] = tuple(
+            slot for day_slots in self.grid for slot in day_slots
+        )
+        self.neighbours: list[tuple[Slot, ...]] = [
+            tuple(
+                day_slots[adjacent]
+                for adjacent in (period - 1, period + 1)
+                if 0 <= adjacent < slot_per_day
+            )
+            for day_slots in self.grid
+            for period in range(slot_per_day)
+        ]
+        self.slots: list[Slot] = list(self.ordered_slots)
 
-        self.ignored_courses: set[Course] = set()
+    def get_slot(self, index: int) -> Slot:
+        return self.ordered_slots[index - 1]
 
-        self.slots: list[Slot] = []
+    def get_day_slots(self, day: int) -> tuple[Slot, ...]:
+        if 1 <= day <= self.days_count:
+            return self.grid[day - 1]
+        return ()
 
-        for slot_index in range(days_count * slot_per_day):
-            self.slots.append(Slot(slot_index + 1))
+    def get_adjacent_slots(self, slot: Slot) -> tuple[Slot, ...]:
+        return self.neighbours[slot.index - 1]
 
-        pass
-
-    def get_day_slots(self, day: int):
-        return list(
-            filter(lambda slot: slot.slot_day(self.slot_per_day) == day, self.slots)
+    def use_resources(
+        self,
+        venues: Iterable[VenueRecord],
+        invigilators: int,
+        mode: str = RESOURCES_REJECT,
+        share_venues: bool = False,
+    ):
+        """Checks the seats and the number of the venues and the invigilators
+        of every slot and the slots next to it when placing courses, see
+        `timetable.resources.SlotResources`
+
+        Raises:
+            ValueError: If mode is not a resources mode
+        """
+        self.resources = SlotResources(
+            self.ordered_slots,
+            self.neighbours,
+            [venue.capacity for venue in venues],
+            invigilators,
+            mode,
+            share_venues,
         )
 
-    def get_adjacent_slots(self, slot: Slot):
-        return list(
-            filter(
-                lambda _slot: _slot.slot_day(self.slot_per_day)
-                == slot.slot_day(self.slot_per_day)
-                and _slot.index in [slot.index - 1, slot.index + 1],
-                self.slots,
+    def overload(self, course: CourseRecord, slot: Slot) -> int:
+        """Returns the excess resources placing the course in the slot would add"""
+        if self.resources is None:
+            return 0
+        return self.resources.overload(course, slot)
+
+    def allows(self, course: CourseRecord, slot: Slot) -> bool:
+        """Returns True if the domain of the course holds the slot"""
+        domain = self.domains.get(course.id)
+        return domain is None or bool(domain >> (slot.index - 1) & 1)
+
+    def allowed_slots(self, course: CourseRecord) -> tuple[Slot, ...]:
+        """Returns the slots, by index, the domain of the course holds"""
+        domain = self.domains.get(course.id)
+        if domain is None:
+            return self.ordered_slots
+        if domain not in self.domain_slots:
+            self.domain_slots[domain] = tuple(
+                slot for slot in self.ordered_slots if domain >> (slot.index - 1) & 1
             )
-        )
+        return self.domain_slots[domain]
+
+    def out_of_time(self, phase: str) -> bool:
+        """Returns True, recording the phase as truncated, once the budget of
+        the generation is exhausted"""
+        if self.budget.exhausted():
+            self.budget.truncate(phase)
+            return True
+        return False
+
+    def is_pinned(self, course: CourseRecord) -> bool:
+        return course.id in self.pinned
+
+    def place_pinned(self):
+        """Puts the pinned courses in their slots, whatever their domains, the
+        resources of the slots or the courses already there"""
+        for course in self.pinned_courses:
+            slot = self.get_slot(self.pinned[course.id])
+            slot.courses.add(course)
+            slot.mask |= self.levels.course_mask(course)
+            self.placements[course.id] = slot
+            self.spread.add(course, slot.day)  # type: ignore
+            if self.resources is not None:
+                self.resources.add(course, slot)
+
+    def place(self, course: CourseRecord, slot: Slot) -> bool:
+        """Tries to add the course to the slot, returns False if the slot can not take it"""
+        if self.domains and not self.allows(course, slot):
+            return False
+
+        if self.resources is not None and self.resources.rejects(course, slot):
+            return False
+
+        if not slot.add_course(course):
+            return False
+
+        self.placements[course.id] = slot
+        self.spread.add(course, slot.day)  # type: ignore
+        if self.resources is not None:
+            self.resources.add(course, slot)
+        return True
+
+    def unplace(self, course: CourseRecord):
+        slot = self.placements.pop(course.id, None)
+        if slot:
+            slot.remove_course(course)
+            self.spread.remove(course, slot.day)  # type: ignore
+            if self.resources is not None:
+                self.resources.remove(course, slot)
 
     def start(self):
-        # Sort courses by department counts
-        self.courses.sort(key=lambda course: course.departments.count(), reverse=True)
         each(lambda slot: slot.clear(), self.slots)
-
+        self.ignored_courses.clear()
+        self.placements.clear()
+        self.spread.clear()
+        if self.resources is not None:
+            self.resources.clear()
+        self.place_pinned()
+
+        # Whether the components are slotted apart only depends on the inputs,
+        # never on the workers, so the same seed gives the same timetable on
+        # any machine. Components are slotted apart from the pinned courses,
+        # and from the resources every component shares, so they only run
+        # without either.
+        if (
+            not self.pinned
+            and self.resources is None
+            and len(self.courses) >= COMPONENT_MIN_COURSES
+        ):
+            components = self.components()
+            if len(components) > 1:
+                self.slot_components(components, self.workers)
+                return
+
+        self.strategy.assign(self)
+
+    def components(self) -> list[list[CourseRecord]]:
+        """Splits the courses into the connected components of the conflict
+        graph, largest first. Courses of different components never share a
+        department level, so each component can be slotted on its own. Courses
+        without departments conflict with nothing and form one component.
+
+        Department levels are joined with a union find over their bits, in
+        O(department levels of the courses).
+        """
+        parent: dict[int, int] = {}
+
+        def find(bit: int) -> int:
+            root = bit
+            while parent.setdefault(root, root) != root:
+                root = parent[root]
+            while bit != root:
+                parent[bit], bit = root, parent[bit]
+            return root
+
+        firsts: list[int | None] = []
         for course in self.courses:
-            random.shuffle(self.slots)
-            slot_pool: Queue[Slot] = Queue(self.slots)
-
-            while slot_pool.count() > 0:
-                # Iterate over all the slot in the slot pool and try adding the course,
-                # If it fails pop the next slot and try again, if slot pool is empty
-                # Add the course to ignored courses
-                print(f"Queue counting : {slot_pool.count()}")
-                slot = slot_pool.pop()
-                if slot.add_course(course):
-                    break
+            mask = self.levels.course_mask(course)
+            first = None
+            while mask:
+                lowest = mask & -mask
+                bit = lowest.bit_length() - 1
+                if first is None:
+                    first = find(bit)
+                else:
+                    parent[find(bit)] = first
+                mask ^= lowest
+            firsts.append(first)
+
+        groups: dict[int | None, list[CourseRecord]] = {}
+        for course, first in zip(self.courses, firsts):
+            root = find(first) if first is not None else None
+            groups.setdefault(root, []).append(course)
+
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def slot_components(self, components: list[list[CourseRecord]], workers: int):
+        """Slots every component with the strategy of the generator on a pool
+        of `workers` processes, in this process when it is 1, then merges them
+        with `merge_components`. Each component gets its own seed drawn from
+        the generator, so the result does not depend on the number of workers.
+        """
+        arguments = [
+            (
+                component,
+                self.slot_per_day,
+                self.days_count,
+                self.strategy.name,
+                self.random.randrange(2**31),
+                self.component_conflicts(component),
+                {
+                    course.id: self.domains[course.id]
+                    for course in component
+                    if course.id in self.domains
+                },
+                self.budget,
+            )
+            for component in components
+        ]
+
+        if workers == 1:
+            results = [slot_component(*argument) for argument in arguments]
+        else:
+            workers = min(workers, len(components))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(slot_component, *zip(*arguments)))
+
+        for _, _, truncated in results:
+            for phase in truncated:
+                self.budget.truncate(phase)
+        self.merge_components([(placements, ignored) for placements, ignored, _ in results])
+
+    def component_conflicts(
+        self, component: list[CourseRecord]
+    ) -> dict[int, tuple[int, ...]] | None:
+        if self.conflicts is None:
+            return None
+        return {
+            course.id: self.conflicts[course.id]
+            for course in component
+            if course.id in self.conflicts
+        }
+
+    def merge_components(self, results: list[tuple[dict[int, int], list[int]]]):
+        """Places the slotted components, given as ({course id: slot index},
+        [ignored course ids]), into the slots of the generator.
+
+        Components are independent, so mapping the days of a component to the
+        days of the timetable, and the slots of a day to the slots of another,
+        keeps its placements valid and its same-day exams unchanged. Its
+        consecutive-day exams depend on the days that end up next to each
+        other, so the mapping keeps them from growing, see
+        `component_mapping`, and then levels the students seated in every
+        slot, which the venues and the invigilators of a slot have to cover,
+        the largest components first. A component with restricted courses
+        keeps its slots, its domains are only valid for them.
+        """
+        courses_by_id = {course.id: course for course in self.courses}
+        seats = [0] * len(self.ordered_slots)
+
+        def component_seats(placements: dict[int, int]) -> dict[int, int]:
+            slot_seats: dict[int, int] = {}
+            for course_id, index in placements.items():
+                slot_seats[index] = (
+                    slot_seats.get(index, 0) + courses_by_id[course_id].student_count
+                )
+            return slot_seats
+
+        loads = [
+            (component_seats(placements), placements, ignored)
+            for placements, ignored in results
+        ]
+        loads.sort(key=lambda load: sum(load[0].values()), reverse=True)
+
+        for slot_seats, placements, ignored in loads:
+            if any(course_id in self.domains for course_id in placements):
+                mapping = {index: index for index in placements.values()}
             else:
-                print("Ignored Course")
-                self.ignored_courses.add(course)
+                mapping = self.component_mapping(
+                    slot_seats,
+                    seats,
+                    self.day_pairs(
+                        [
+                            (courses_by_id[course_id], index)
+                            for course_id, index in placements.items()
+                        ]
+                    ),
+                )
+
+            for course_id, index in placements.items():
+                course = courses_by_id[course_id]
+                slot = self.get_slot(mapping[index])
+                if self.place(course, slot):
+                    seats[slot.index - 1] += course.student_count
+                else:
+                    self.ignored_courses.add(course)
+
+            self.ignored_courses.update(courses_by_id[course_id] for course_id in ignored)
+
+    def day_pairs(self, placements: list[tuple[CourseRecord, int]]) -> list[int]:
+        """Returns, for every day of the placements, given as (course, slot
+        index), the exams pairs a department level writes on that day and the
+        next one, the last day pairing with the first"""
+        exams: list[dict[int, int]] = [{} for _ in range(self.days_count)]
+        for course, index in placements:
+            day_exams = exams[(index - 1) // self.slot_per_day]
+            for bit in self.spread.bits(course):
+                day_exams[bit] = day_exams.get(bit, 0) + 1
+
+        pairs = []
+        for day, day_exams in enumerate(exams):
+            # Two days are only next to each other once
+            if day == self.days_count - 1 and self.days_count <= 2:
+                pairs.append(0)
+                continue
+            next_exams = exams[(day + 1) % self.days_count]
+            pairs.append(
+                sum(count * next_exams.get(bit, 0) for bit, count in day_exams.items())
+            )
+        return pairs
+
+    def component_mapping(
+        self, slot_seats: dict[int, int], seats: list[int], day_pairs: list[int]
+    ) -> dict[int, int]:
+        """Maps the slot indexes of a component to the slots of the generator
+        given the `seats` already taken in every slot, see `merge_components`.
+
+        The days of the component are rotated, and maybe reflected, onto the
+        days of the timetable, which keeps all but one of the `day_pairs`,
+        the consecutive-day exams of each day of the component and the next,
+        the last day going round to the first, next to each other. The
+        mapping with the fewest consecutive-day exams, then the smallest sum
+        of squared day seats, is picked, in O(days²), so the spread penalty
+        of the component never grows. The most loaded slot of each day then
+        goes to the least loaded one of its target day.
+        """
+        slot_per_day = self.slot_per_day
+        days_count = self.days_count
+
+        component_days = [
+            sum(
+                slot_seats.get(day * slot_per_day + period + 1, 0)
+                for period in range(slot_per_day)
+            )
+            for day in range(days_count)
+        ]
+        target_days = [
+            sum(seats[day * slot_per_day : (day + 1) * slot_per_day])
+            for day in range(days_count)
+        ]
+
+        def cost(days: list[int]) -> tuple[int, int]:
+            return (
+                sum(
+                    pairs
+                    for day, pairs in enumerate(day_pairs)
+                    if abs(days[day] - days[(day + 1) % days_count]) == 1
+                ),
+                sum(
+                    (target_days[target] + component_days[day]) ** 2
+                    for day, target in enumerate(days)
+                ),
+            )
+
+        # days[day] = day of the timetable the day of the component goes to
+        days = min(
+            (
+                [(shift + direction * day) % days_count for day in range(days_count)]
+                for direction in (1, -1)
+                for shift in range(days_count)
+            ),
+            key=cost,
+        )
+
+        mapping: dict[int, int] = {}
+        for day, target in enumerate(days):
+            periods = sorted(
+                range(slot_per_day),
+                key=lambda period: (
+                    -slot_seats.get(day * slot_per_day + period + 1, 0),
+                    period,
+                ),
+            )
+            target_periods = sorted(
+                range(slot_per_day),
+                key=lambda period: (seats[target * slot_per_day + period], period),
+            )
+            for period, target_period in zip(periods, target_periods):
+                mapping[day * slot_per_day + period + 1] = (
+                    target * slot_per_day + target_period + 1
+                )
+        return mapping
+
+    def improve(self, iterations: int):
+        """Runs the simulated annealing phase on the slots picked by `start`"""
+        self.annealing = Annealer(self, iterations).run()
+
+    def repair(self, depth: int):
+        """Tries to place the ignored courses with ejection chains `depth`
+        levels deep, see `timetable.repair.Repair`"""
+        self.repairing = Repair(self, depth).run()
 
     def get_slots_courses(self, slots: Iterable[Slot]):
         courses = set()
         each(lambda slot: courses.update(slot.courses), slots)
         return courses
 
-    def get_courses_venues(self, courses: Iterable[Course]):
-        venues: set[Venue] = set()
+    def get_courses_venues(self, courses: Iterable[CourseRecord]):
+        venues: set[VenueRecord] = set()
         for course in courses:
             if course in self.course_assigned_venues:
                 venues.update(self.course_assigned_venues[course])
         return venues
 
-    def select_multiple_venue(self, venues: Iterable[Venue], capacity: int):
-        _venues = Queue(list(venues))
-        selected_venues = []
-        current_capacity = 0
-        while len(_venues) > 0:
-            venue = _venues.pop()
-            selected_venues.append(venue)
-            current_capacity = current_capacity + venue.capacity
-            if current_capacity > capacity:
-                return selected_venues
-        return None
-
-    def assign_venues(self, venues: list[Venue]):
-        self.course_assigned_venues: dict[Course, set[Venue]] = {}
-        self.unassigned_venue_courses: set[Course] = set()
-
-        _venues = set(venues)
-        for slot in self.slots:
+    def assign_venues(
+        self,
+        venues: list[VenueRecord],
+        share_venues: bool = False,
+        pinned_venues: dict[int, tuple[int, ...]] | None = None,
+    ):
+        """Assigns venues to the courses of every slot, largest course first.
+
+        With `share_venues` several courses of a slot can write in one venue,
+        see `timetable.venues.SharedVenuePool`, otherwise every course gets
+        venues of its own. The courses of the slots left when the budget runs
+        out get none. The pinned courses keep the venue ids they have in
+        `pinned_venues`, which no other course of their slot, or the slots
+        next to it, is given. `venue_occupancy` keeps the seats taken in each
+        (venue id, slot index).
+        """
+        self.course_assigned_venues: dict[CourseRecord, set[VenueRecord]] = {}
+        self.unassigned_venue_courses: set[CourseRecord] = set()
+        self.venue_occupancy: dict[tuple[int, int], int] = {}
+
+        venues_by_id = {venue.id: venue for venue in venues}
+        for course in self.pinned_courses:
+            self.course_assigned_venues[course] = {
+                venues_by_id[venue_id]
+                for venue_id in (pinned_venues or {}).get(course.id, ())
+                if venue_id in venues_by_id
+            }
+
+        # Sorted once, each slot pool is a filtered copy that keeps the order
+        pool_class = SharedVenuePool if share_venues else VenuePool
+        all_venues: VenuePool[VenueRecord] = pool_class(venues)
+        for slot in self.ordered_slots:
+            if self.out_of_time("venues"):
+                self.unassigned_venue_courses.update(
+                    course for course in slot.courses if not self.is_pinned(course)
+                )
+                continue
+
             adjacent_slots = self.get_adjacent_slots(slot)
             adjacent_slots_courses = self.get_slots_courses(adjacent_slots)
             exclude_venues = self.get_courses_venues(adjacent_slots_courses)
-
-            _venue_pool = sorted(
-                list(_venues - exclude_venues),
-                key=lambda venue: venue.capacity,
-                reverse=True,
+            exclude_venues.update(
+                self.get_courses_venues(filter(self.is_pinned, slot.courses))
             )
 
+            venue_pool = all_venues.without(exclude_venues)
+
             courses = sorted(
-                slot.courses, key=lambda course: course.student_count, reverse=True
+                (course for course in slot.courses if not self.is_pinned(course)),
+                key=lambda course: course.student_count,
+                reverse=True,
             )
 
             for course in courses:
-                # TODO This filtering here will not work
-                # if all the venues capacity are morethan 130% of the course student count.
-                _single_possible_venue_pool = list(
-                    filter(
-                        lambda venue: venue.capacity > course.student_count
-                        # TODO 1.3 is the margin for accuracy for student spacing
-                        and venue.capacity <= course.student_count * 1.3,
-                        _venue_pool,
-                    )
-                )
-
-                if len(_single_possible_venue_pool) > 0:
-                    # There is sutable venue
-                    selected_venue = random.choice(_single_possible_venue_pool)
-                    self.course_assigned_venues[course] = set([selected_venue])
-                    _venue_pool.remove(
-                        selected_venue
-                    )  # Remove selected venue from the venue pool
+                selected_venues = venue_pool.allocate(course.student_count)
 
+                if selected_venues != None:
+                    self.course_assigned_venues[course] = set(selected_venues)
                 else:
-                    # multiple venues is required
-                    selected_venues = self.select_multiple_venue(
-                        _venue_pool, course.student_count
-                    )
+                    # No venues to contain this course
+                    self.unassigned_venue_courses.add(course)
+
+            for venue, seated in venue_pool.occupancy.items():
+                self.venue_occupancy[(venue.id, slot.index)] = seated
+
+    def shared_venues(self) -> dict[tuple[int, int], list[CourseRecord]]:
+        """Returns the courses writing in each (venue id, slot index) that more
+        than one course writes in"""
+        courses_of: dict[tuple[int, int], list[CourseRecord]] = {}
+        for course, venues in self.course_assigned_venues.items():
+            slot = self.placements.get(course.id)
+            if slot is None:
+                continue
+            for venue in venues:
+                courses_of.setdefault((venue.id, slot.index), []).append(course)
+        return {key: courses for key, courses in courses_of.items() if len(courses) > 1}
+
+    def spread_penalty(self) -> int:
+        """Returns the penalty of the exams a department level writes on the
+        same day and on consecutive days, see `SpreadObjective`"""
+        return self.spread.penalty
+
+    def score(self) -> tuple[int, int, int]:
+        """Scores a finished run, lower is better: ignored courses first, then
+        courses without venues, then the spread penalty of the exams"""
+        return (
+            len(self.ignored_courses),
+            len(self.unassigned_venue_courses),
+            self.spread_penalty(),
+        )
 
-                    if selected_venues != None:
-                        self.course_assigned_venues[course] = set(selected_venues)
-                        # remove the selected venues from the pool
-                        each(lambda venue: _venue_pool.remove(venue), selected_venues)
-                    else:
-                        # No venues to contain this course
-                        self.unassigned_venue_courses.add(course)
 
+def slot_component(
+    courses: list[CourseRecord],
+    slot_per_day: int,
+    days_count: int,
+    strategy: str | None = None,
+    seed: int | None = None,
+    conflicts: dict[int, tuple[int, ...]] | None = None,
+    domains: dict[int, int] | None = None,
+    budget: Budget | None = None,
+) -> tuple[dict[int, int], list[int], list[str]]:
+    """Slots one component of a generation, see `Generator.slot_components`,
+    and returns its placements as {course id: slot index}, its ignored
+    course ids, which are cheaper to send back from a worker than slots, and
+    the phases the budget truncated"""
+    generator = Generator(
+        courses,
+        slot_per_day,
+        days_count,
+        strategy,
+        seed,
+        conflicts,
+        domains=domains,
+        budget=budget,
+    )
+    generator.start()
+    return (
+        {course_id: slot.index for course_id, slot in generator.placements.items()},
+        [course.id for course in generator.ignored_courses],
+        list(generator.budget.truncated),
+    )
+
+
+def run_generation(
+    courses: list[CourseRecord],
+    venues: list[VenueRecord],
+    slot_per_day: int,
+    days_count: int,
+    strategy: str | None = None,
+    seed: int | None = None,
+    anneal: int = 0,
+    share_venues: bool = False,
+    conflicts: dict[int, tuple[int, ...]] | None = None,
+    workers: int = 1,
+    resources: str | None = None,
+    invigilators: int = 0,
+    repair: int = 0,
+    domains: dict[int, int] | None = None,
+    pinned: dict[int, int] | None = None,
+    pinned_venues: dict[int, tuple[int, ...]] | None = None,
+    budget: Budget | None = None,
+) -> Generator:
+    """Runs a complete generation, slotting (the `pinned` courses in their
+    slots with their `pinned_venues`, then the other courses, their
+    independent components on `workers` processes, each course in the slots
+    of its `domains` mask, checking the seats and the number of the venues
+    and the `invigilators` of each slot in `resources` mode when it is given),
+    `anneal` iterations of simulated annealing when it is not 0, the repair
+    of the ignored courses with ejection chains `repair` levels deep when it
+    is not 0, then venues, and returns the generator. Every phase stops with
+    what it has done when the `budget` runs out, see `timetable.budget`."""
+    generator = Generator(
+        courses,
+        slot_per_day,
+        days_count,
+        strategy,
+        seed,
+        conflicts,
+        workers,
+        domains,
+        pinned,
+        budget,
+    )
+    if resources:
+        generator.use_resources(venues, invigilators, resources, share_venues)
+    generator.start()
+    if anneal:
+        generator.improve(anneal)
+    if repair:
+        generator.repair(repair)
+    generator.assign_venues(venues, share_venues, pinned_venues)
+    return generator
+
+
+def generate_best(
+    courses: list[CourseRecord],
+    venues: list[VenueRecord],
+    slot_per_day: int,
+    days_count: int,
+    strategy: str | None = None,
+    restarts: int = 1,
+    workers: int | None = None,
+    seed: int | None = None,
+    anneal: int = 0,
+    share_venues: bool = False,
+    conflicts: dict[int, tuple[int, ...]] | None = None,
+    resources: str | None = None,
+    invigilators: int = 0,
+    repair: int = 0,
+    domains: dict[int, int] | None = None,
+    pinned: dict[int, int] | None = None,
+    pinned_venues: dict[int, tuple[int, ...]] | None = None,
+    budget: Budget | None = None,
+) -> Generator:
+    """Runs `restarts` independently seeded generations and returns the one with
+    the best `Generator.score`.
+
+    Args:
+        restarts (int): Number of generations to run
+        workers (int | None): Size of the process pool, defaults to the number
+            of cpus. The generations run in this process when it is 1. A single
+            generation slots the independent components of the courses on it
+            instead, see `Generator.start`. It never changes the result.
+        seed (int | None): Seed the seeds of the restarts are drawn from
+        anneal (int): Simulated annealing iterations each restart runs
+        share_venues (bool): Lets several courses of a slot share a venue
+        conflicts (dict | None): Persisted course conflicts by course id
+        resources (str | None): Mode the seats and invigilators of the slots
+            are checked in while slotting, see `timetable.resources`, not
+            checked when None
+        invigilators (int): Staffs that can invigilate
+        repair (int): Depth of the ejection chains that repair the ignored
+            courses of each restart, not repaired when 0
+        domains (dict | None): Masks of the slots the restricted courses may
+            be written in by course id, see `timetable.domains`
+        pinned (dict | None): Slot indexes of the courses that are not
+            re-slotted, by course id
+        pinned_venues (dict | None): Venue ids the pinned courses keep
+        budget (Budget | None): Time the generation has and its cancellation,
+            the restarts that have not started when it runs out are skipped.
+            The phases it truncated are recorded on it.
+
+    Raises:
+        ValueError: If restarts or workers is less than 1, or resources is
+            not a resources mode
+    """
+    if restarts < 1:
+        raise ValueError("restarts must be greater than 0")
+
+    workers = workers or os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be greater than 0")
+
+    if resources and resources not in RESOURCES_MODES:
+        raise ValueError(
+            f"Unknown resources mode '{resources}', expected one of {', '.join(RESOURCES_MODES)}"
+        )
 
+    seeds = random.Random(seed).sample(range(2**31), restarts)
+    arguments = [
+        (
+            courses,
+            venues,
+            slot_per_day,
+            days_count,
+            strategy,
+            restart_seed,
+            anneal,
+            share_venues,
+            conflicts,
+            workers if restarts == 1 else 1,
+            resources,
+            invigilators,
+            repair,
+            domains,
+            pinned,
+            pinned_venues,
+            budget,
+        )
+        for restart_seed in seeds
+    ]
+
+    if restarts == 1 or workers == 1:
+        generators = []
+        for argument in arguments:
+            if generators and budget is not None and budget.exhausted():
+                budget.truncate("restarts")
+                break
+            generators.append(run_generation(*argument))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, restarts)) as executor:
+            generators = list(executor.map(run_generation, *zip(*arguments)))
+
+        if budget is not None:
+            # Workers ran on copies of the budget
+            for generator in generators:
+                for phase in generator.budget.truncated:
+                    budget.truncate(phase)
+
+    return min(generators, key=lambda generator: generator.score())
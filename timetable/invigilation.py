@@ -0,0 +1,477 @@
+"""
+Supervisor and invigilator assignment for a whole generated timetable.
+
+Everything runs in memory on the records of `timetable.records`, the
+timetable is loaded and written back by `Timetable.auto_assign_invigilators`.
+
+Every slot course needs one invigilator per venue it writes in, drawn from the
+staffs of its course department that can invigilate. A staff can not work in
+a slot next to one where they already supervise or invigilate on the same day.
+
+Assigning slot course by slot course lets the first ones take staffs the later
+ones had no replacement for (`assign_invigilators_greedy` still does it that
+way). Instead, `assign_invigilators_by_flow` solves each day as a bipartite flow
+problem: the source feeds every staff one unit, a staff is linked to every
+slot course they may invigilate, and every slot course drains to the sink as
+many units as it still needs invigilators. The maximum flow is the largest
+number of duties the day can be covered with, given one duty per staff. The
+day is solved again, with the slots next to the duties just given taken out
+of each staff's links, until no more duties can be added, so a staff can
+still work in several slots of a day that are not next to each other.
+
+Both modes hand duties out through a `DutyRoster`, so the least loaded staffs
+are picked first and no staff goes over the optional duty cap. Slot courses
+with fixed invigilators, the pinned ones and the ones an assignment of a few
+slot courses leaves alone, are left as they are, their staffs just count as
+working there. When the budget of the assignment runs out, the
+slot courses not covered yet are reported as missing all their invigilators.
+"""
+
+import heapq
+from collections import deque
+from typing import Callable, Container, Iterable
+
+from timetable.budget import Budget
+from timetable.records import SlotCourseRecord, StaffRecord
+
+
+class MaxFlow:
+    """Dinic's maximum flow over a graph of `nodes` integer nodes"""
+
+    def __init__(self, nodes: int) -> None:
+        self.edges: list[list[int]] = [[] for _ in range(nodes)]
+        # Edge i goes to targets[i], its reverse edge is i ^ 1
+        self.targets: list[int] = []
+        self.capacities: list[int] = []
+
+    def add_edge(self, source: int, target: int, capacity: int) -> int:
+        """Adds an edge and returns its index"""
+        index = len(self.targets)
+        self.edges[source].append(index)
+        self.targets.append(target)
+        self.capacities.append(capacity)
+        self.edges[target].append(index + 1)
+        self.targets.append(source)
+        self.capacities.append(0)
+        return index
+
+    def flow(self, edge: int) -> int:
+        """Returns the flow going through an edge"""
+        return self.capacities[edge ^ 1]
+
+    def levels(self, source: int, sink: int) -> list[int] | None:
+        level = [-1] * len(self.edges)
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for edge in self.edges[node]:
+                target = self.targets[edge]
+                if self.capacities[edge] > 0 and level[target] < 0:
+                    level[target] = level[node] + 1
+                    queue.append(target)
+        return level if level[sink] >= 0 else None
+
+    def augment(
+        self, node: int, sink: int, pushed: int, level: list[int], next_edge: list[int]
+    ) -> int:
+        if node == sink:
+            return pushed
+
+        edges = self.edges[node]
+        while next_edge[node] < len(edges):
+            edge = edges[next_edge[node]]
+            target = self.targets[edge]
+            if self.capacities[edge] > 0 and level[target] == level[node] + 1:
+                flow = self.augment(
+                    target, sink, min(pushed, self.capacities[edge]), level, next_edge
+                )
+                if flow:
+                    self.capacities[edge] -= flow
+                    self.capacities[edge ^ 1] += flow
+                    return flow
+            next_edge[node] += 1
+        return 0
+
+    def max_flow(self, source: int, sink: int) -> int:
+        """Pushes the maximum flow from source to sink and returns it.
+
+        The augmenting paths are as long as the level graph is deep, which is
+        three edges for the invigilation graphs.
+        """
+        total = 0
+        while (level := self.levels(source, sink)) is not None:
+            next_edge = [0] * len(self.edges)
+            while pushed := self.augment(source, sink, 1 << 62, level, next_edge):
+                total += pushed
+        return total
+
+
+def staffs_by_department(
+    staffs: Iterable[StaffRecord], supervise: bool = False
+) -> dict[int | None, list[StaffRecord]]:
+    """Groups the staffs that can invigilate, or supervise, by department, the
+    None key holds all of them for courses without a department"""
+    staffs_of: dict[int | None, list[StaffRecord]] = {None: []}
+    for staff in staffs:
+        if staff.can_supervise if supervise else staff.can_invigilate:
+            staffs_of[None].append(staff)
+            if staff.department is not None:
+                staffs_of.setdefault(staff.department, []).append(staff)
+    return staffs_of
+
+
+def working_slots(
+    slot_courses: Iterable[SlotCourseRecord],
+) -> dict[tuple[int, int], set[int]]:
+    """Returns the indexes of the slots each supervisor works in, keyed by
+    (staff id, day)"""
+    busy: dict[tuple[int, int], set[int]] = {}
+    for slot_course in slot_courses:
+        if slot_course.supervisor:
+            busy.setdefault((slot_course.supervisor, slot_course.day), set()).add(
+                slot_course.slot
+            )
+    return busy
+
+
+def is_resting(busy: dict[tuple[int, int], set[int]], staff_id: int, day: int, slot: int):
+    """Returns True if the staff works in the slot, or one next to it, that day"""
+    return any(abs(index - slot) <= 1 for index in busy.get((staff_id, day), ()))
+
+
+def hold_fixed(
+    slot_courses: Iterable[SlotCourseRecord],
+    fixed: dict[int, list[int]],
+    roster: "DutyRoster",
+    busy: dict[tuple[int, int], set[int]],
+) -> list[SlotCourseRecord]:
+    """Gives the duties of the slot courses with `fixed` invigilators, staff
+    ids by slot course id, to their staffs and marks them working in their
+    slots, and returns the other slot courses"""
+    free: list[SlotCourseRecord] = []
+    for slot_course in slot_courses:
+        if slot_course.id not in fixed:
+            free.append(slot_course)
+            continue
+        for staff_id in fixed[slot_course.id]:
+            if staff_id in roster.duties:
+                roster.add(staff_id)
+            busy.setdefault((staff_id, slot_course.day), set()).add(slot_course.slot)
+    return free
+
+
+class DutyRoster:
+    """Counts the invigilation duties of every staff over a whole assignment
+    run and hands out the least loaded staffs first.
+
+    Each department keeps a min-heap of (duties, staff id), and the None key a
+    heap of all the staffs. When a staff takes a duty a fresh entry is pushed
+    to their heaps and the old ones are skipped as stale when popped, so
+    picking a staff costs O(log n) amortised. Staffs with `max_duties` duties
+    are not picked anymore.
+    """
+
+    def __init__(
+        self,
+        staffs_of: dict[int | None, list[StaffRecord]],
+        max_duties: int | None = None,
+    ) -> None:
+        self.max_duties = max_duties
+        self.duties: dict[int, int] = {}
+        self.departments: dict[int, list[int | None]] = {}
+        self.heaps: dict[int | None, list[tuple[int, int]]] = {}
+
+        for department, staffs in staffs_of.items():
+            heap = self.heaps[department] = []
+            for staff in staffs:
+                self.duties[staff.id] = 0
+                self.departments.setdefault(staff.id, []).append(department)
+                heap.append((0, staff.id))
+            heapq.heapify(heap)
+
+    def can_take(self, staff_id: int) -> bool:
+        return self.max_duties is None or self.duties[staff_id] < self.max_duties
+
+    def add(self, staff_id: int):
+        """Gives a duty to a staff"""
+        self.duties[staff_id] += 1
+        for department in self.departments[staff_id]:
+            heapq.heappush(self.heaps[department], (self.duties[staff_id], staff_id))
+
+    def pick(
+        self, department: int | None, count: int, eligible: Callable[[int], bool]
+    ) -> list[int]:
+        """Gives a duty to the count least loaded staffs of a department that
+        are eligible, or to as many as there are, and returns their ids"""
+        heap = self.heaps.get(department, [])
+        picked: list[int] = []
+        passed: list[tuple[int, int]] = []
+
+        while heap and len(picked) < count:
+            duties, staff_id = heapq.heappop(heap)
+            if duties != self.duties[staff_id]:
+                # Stale, the staff took a duty since and has a fresher entry
+                continue
+            if not self.can_take(staff_id):
+                # Every staff left has at least as many duties
+                passed.append((duties, staff_id))
+                break
+            if not eligible(staff_id):
+                passed.append((duties, staff_id))
+                continue
+            picked.append(staff_id)
+
+        for entry in passed:
+            heapq.heappush(heap, entry)
+        for staff_id in picked:
+            self.add(staff_id)
+        return picked
+
+
+def workload_summary(duties: dict[int, int]) -> dict:
+    """Returns how the duties are spread over the staffs, `distribution` maps a
+    number of duties to the number of staffs with that many"""
+    distribution: dict[int, int] = {}
+    for count in duties.values():
+        distribution[count] = distribution.get(count, 0) + 1
+
+    return {
+        "staffs": len(duties),
+        "duties": sum(duties.values()),
+        "min": min(duties.values(), default=0),
+        "max": max(duties.values(), default=0),
+        "distribution": dict(sorted(distribution.items())),
+    }
+
+
+class SupervisorRota:
+    """Hands supervision round the staffs of each department.
+
+    Every department has a deque of its staffs that can supervise, and the
+    None key a deque of all of them for courses without a department. The
+    staff at the front supervises next and goes to the back, an O(1)
+    rotation. Staffs working in the slot, or a slot next to it, that day are
+    passed over, which only costs as many rotations as there are busy staffs
+    in the department.
+    """
+
+    def __init__(
+        self,
+        staffs: Iterable[StaffRecord],
+        busy: dict[tuple[int, int], set[int]] | None = None,
+    ) -> None:
+        self.rotas: dict[int | None, deque[StaffRecord]] = {
+            department: deque(department_staffs)
+            for department, department_staffs in staffs_by_department(
+                staffs, supervise=True
+            ).items()
+        }
+        # busy[(staff id, day)] = indexes of the slots the staff works in that day
+        self.busy: dict[tuple[int, int], set[int]] = busy if busy is not None else {}
+
+    def next(self, department: int | None, day: int, slot: int) -> StaffRecord | None:
+        """Returns the next staff of the department free to supervise in the
+        slot and marks them busy there, or None if every staff is busy"""
+        rota = self.rotas.get(department)
+        if not rota:
+            return None
+
+        for _ in range(len(rota)):
+            staff = rota[0]
+            rota.rotate(-1)
+            if not is_resting(self.busy, staff.id, day, slot):
+                self.busy.setdefault((staff.id, day), set()).add(slot)
+                return staff
+        return None
+
+
+def assign_supervisors(
+    slot_courses: Iterable[SlotCourseRecord],
+    staffs: Iterable[StaffRecord],
+    only: Container[int] | None = None,
+    fixed: dict[int, list[int]] | None = None,
+) -> list[SlotCourseRecord]:
+    """Gives a supervisor to every slot course without one, or to the ones
+    whose ids are in `only` when it is given, from the staffs of its course
+    department that can supervise and do not work next to its slot, as the
+    supervisor or one of the `fixed` invigilators, staff ids by slot course
+    id, of another slot course
+
+    Returns:
+        list[SlotCourseRecord]: The slot courses, with their new supervisors
+    """
+    slot_courses = list(slot_courses)
+    busy = working_slots(slot_courses)
+    for slot_course in slot_courses:
+        for staff_id in (fixed or {}).get(slot_course.id, ()):
+            busy.setdefault((staff_id, slot_course.day), set()).add(slot_course.slot)
+    rota = SupervisorRota(staffs, busy)
+
+    supervised = []
+    for slot_course in slot_courses:
+        if slot_course.supervisor is None and (only is None or slot_course.id in only):
+            supervisor = rota.next(
+                slot_course.department, slot_course.day, slot_course.slot
+            )
+            if supervisor:
+                slot_course = SlotCourseRecord(
+                    slot_course.id,
+                    slot_course.slot,
+                    slot_course.day,
+                    slot_course.department,
+                    supervisor.id,
+                    slot_course.venues,
+                )
+        supervised.append(slot_course)
+    return supervised
+
+
+def assign_invigilators_greedy(
+    slot_courses: Iterable[SlotCourseRecord],
+    staffs: Iterable[StaffRecord],
+    max_duties: int | None = None,
+    fixed: dict[int, list[int]] | None = None,
+    budget: Budget | None = None,
+) -> tuple[dict[int, list[int]], dict[int, int], dict[int, int]]:
+    """Assigns invigilators slot course by slot course, in slot order, each one
+    taking the least loaded staffs still free for it, until the `budget` runs
+    out. The slot courses in `fixed` keep their invigilators, see `hold_fixed`.
+
+    Returns:
+        tuple[dict[int, list[int]], dict[int, int], dict[int, int]]: The staff
+        ids assigned to each slot course id, the number of invigilators each
+        slot course that could not be fully covered is still missing, and the
+        duties of each staff
+    """
+    slot_courses = list(slot_courses)
+    roster = DutyRoster(staffs_by_department(staffs), max_duties)
+    busy = working_slots(slot_courses)
+    slot_courses = hold_fixed(slot_courses, fixed or {}, roster, busy)
+
+    assignments: dict[int, list[int]] = {}
+    missing: dict[int, int] = {}
+    for slot_course in slot_courses:
+        if budget is not None and budget.exhausted():
+            budget.truncate("invigilation")
+            assignments[slot_course.id] = []
+            if slot_course.venues:
+                missing[slot_course.id] = slot_course.venues
+            continue
+
+        day, slot = slot_course.day, slot_course.slot
+        assigned = assignments[slot_course.id] = roster.pick(
+            slot_course.department,
+            slot_course.venues,
+            lambda staff_id: not is_resting(busy, staff_id, day, slot),
+        )
+        for staff_id in assigned:
+            busy.setdefault((staff_id, day), set()).add(slot)
+
+        if len(assigned) < slot_course.venues:
+            missing[slot_course.id] = slot_course.venues - len(assigned)
+    return assignments, missing, roster.duties
+
+
+def assign_invigilators_by_flow(
+    slot_courses: Iterable[SlotCourseRecord],
+    staffs: Iterable[StaffRecord],
+    max_duties: int | None = None,
+    fixed: dict[int, list[int]] | None = None,
+    budget: Budget | None = None,
+) -> tuple[dict[int, list[int]], dict[int, int], dict[int, int]]:
+    """Assigns invigilators to every slot course, see the module docstring.
+
+    Staffs are added to each network from the least loaded, and Dinic's search
+    follows the edges in that order, so the duties of a round go to the least
+    loaded staffs the maximum flow allows.
+
+    Args:
+        slot_courses (Iterable[SlotCourseRecord]): The slot courses of the timetable
+        staffs (Iterable[StaffRecord]): The staffs of the timetable
+        max_duties (int | None): Most duties a staff can take
+        fixed (dict[int, list[int]] | None): Staff ids of the slot courses
+            that keep their invigilators, by slot course id
+        budget (Budget | None): Time the assignment has, the rounds left when
+            it runs out are not solved
+
+    Returns:
+        tuple[dict[int, list[int]], dict[int, int], dict[int, int]]: The staff
+        ids assigned to each slot course id, the number of invigilators each
+        slot course that could not be fully covered is still missing, and the
+        duties of each staff
+    """
+    slot_courses = list(slot_courses)
+    staffs_of = staffs_by_department(staffs)
+    roster = DutyRoster(staffs_of, max_duties)
+    # busy[(staff id, day)] = indexes of the slots the staff works in that day
+    busy = working_slots(slot_courses)
+    slot_courses = hold_fixed(slot_courses, fixed or {}, roster, busy)
+
+    courses_of_day: dict[int, list[SlotCourseRecord]] = {}
+    for slot_course in slot_courses:
+        courses_of_day.setdefault(slot_course.day, []).append(slot_course)
+
+    assignments: dict[int, list[int]] = {
+        slot_course.id: [] for slot_course in slot_courses
+    }
+    for day, day_courses in courses_of_day.items():
+        while True:
+            if budget is not None and budget.exhausted():
+                budget.truncate("invigilation")
+                break
+
+            needing = [
+                slot_course
+                for slot_course in day_courses
+                if len(assignments[slot_course.id]) < slot_course.venues
+            ]
+            if not needing:
+                break
+
+            # The positions of the slot courses each staff may invigilate
+            links: dict[int, list[int]] = {}
+            for position, slot_course in enumerate(needing):
+                assigned = assignments[slot_course.id]
+                for staff in staffs_of.get(slot_course.department, ()):
+                    if (
+                        staff.id in assigned
+                        or not roster.can_take(staff.id)
+                        or is_resting(busy, staff.id, day, slot_course.slot)
+                    ):
+                        continue
+                    links.setdefault(staff.id, []).append(position)
+
+            # Node 0 is the source, 1 the sink, then the slot courses and the staffs
+            network = MaxFlow(len(needing) + 2 + len(links))
+            for position, slot_course in enumerate(needing):
+                network.add_edge(
+                    position + 2,
+                    1,
+                    slot_course.venues - len(assignments[slot_course.id]),
+                )
+
+            link_edges: list[tuple[int, int, int]] = []
+            staff_ids = sorted(links, key=lambda staff_id: (roster.duties[staff_id], staff_id))
+            for node, staff_id in enumerate(staff_ids, len(needing) + 2):
+                network.add_edge(0, node, 1)
+                for position in links[staff_id]:
+                    edge = network.add_edge(node, position + 2, 1)
+                    link_edges.append((edge, staff_id, position))
+
+            if network.max_flow(0, 1) == 0:
+                break
+
+            for edge, staff_id, position in link_edges:
+                if network.flow(edge):
+                    slot_course = needing[position]
+                    assignments[slot_course.id].append(staff_id)
+                    roster.add(staff_id)
+                    busy.setdefault((staff_id, day), set()).add(slot_course.slot)
+
+    missing = {
+        slot_course.id: slot_course.venues - len(assignments[slot_course.id])
+        for slot_course in slot_courses
+        if len(assignments[slot_course.id]) < slot_course.venues
+    }
+    return assignments, missing, roster.duties
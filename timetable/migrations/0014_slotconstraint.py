@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_courseconflict'),
+        ('timetable', '0013_alter_complain_related_course_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotConstraint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, default='', max_length=50)),
+                ('level', models.IntegerField(blank=True, null=True)),
+                ('periods', models.JSONField(blank=True, default=list)),
+                ('excluded_week_days', models.JSONField(blank=True, default=list)),
+                ('not_before', models.DateField(blank=True, null=True)),
+                ('not_after', models.DateField(blank=True, null=True)),
+                ('courses', models.ManyToManyField(blank=True, to='core.course')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.department')),
+                ('timetable', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='constraints', to='timetable.timetable')),
+            ],
+            options={
+                'verbose_name': 'Slot Constraint',
+                'verbose_name_plural': 'Slot Constraints',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0014_slotconstraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slotcourse',
+            name='pinned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,23 +1,70 @@
 import datetime
+import hashlib
 import json
+import math
 import random
 from typing import Iterable
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from rest_framework import status
 from openpyxl import Workbook, styles
 import tempfile
 from account.models import Account
 
-from core.models import Course, Staff, Venue
+from core.models import Course, Department, Staff, Venue
+from timetable.budget import Budget
+from timetable.domains import compile_domains
 from timetable.qeueing import Queue, each
-from timetable.generator import Generator as TimetableGenerator
+from timetable.generator import Generator as TimetableGenerator, Slot, generate_best
+from timetable.invigilation import (
+    assign_invigilators_by_flow,
+    assign_invigilators_greedy,
+    DutyRoster,
+    SupervisorRota,
+    assign_supervisors,
+    is_resting,
+    staffs_by_department,
+    workload_summary,
+)
+from timetable.records import (
+    fingerprint,
+    load_pinned_records,
+    load_slot_course_records,
+    load_staff_records,
+    load_timetable_records,
+)
+from timetable.repair import REPAIR_DEPTH
+from timetable.resources import RESOURCES_PENALISE
+from timetable.strategies import get_strategy
+from timetable.venues import VenuePool
+
+
+GENERATION_CACHE_TIMEOUT = 60 * 60 * 24
+GENERATION_CANCEL_TIMEOUT = 60 * 10
+
+INVIGILATION_FLOW = "flow"
+INVIGILATION_GREEDY = "greedy"
+INVIGILATION_MODES = (INVIGILATION_FLOW, INVIGILATION_GREEDY)
 
 
 def default_excluded_week_days():
     return [0]
 
 
+def generation_cache_key(inputs_hash: str, seed: int, strategy: str | None, **options):
+    """Cache key of a generator result, `options` are the other generation
+    options that change the result"""
+    strategy = get_strategy(strategy).name
+    options_key = ",".join(f"{name}={options[name]}" for name in sorted(options))
+    return f"timetable-generation:{inputs_hash}:{seed}:{strategy}:{options_key}"
+
+
+def generation_cancel_key(timetable_pk: int) -> str:
+    """Cache key set while the generation of a timetable is cancelled"""
+    return f"timetable-generation-cancel:{timetable_pk}"
+
+
 def now_date():
     return datetime.datetime.now()
 
@@ -153,6 +200,20 @@ class Timetable(models.Model):
         invigilators_sheet.column_dimensions[f"D"].width = 16
         invigilators_sheet.column_dimensions[f"E"].width = 5
 
+        shared_venues_sheet = book.create_sheet("Shared Venues")
+        shared_venues_sheet.freeze_panes = "A2"
+        shared_venues_sheet["A1"] = "Venue"
+        shared_venues_sheet["B1"] = "Courses"
+        shared_venues_sheet["C1"] = "Students"
+        shared_venues_sheet["D1"] = "Date"
+        shared_venues_sheet["E1"] = "Slot"
+
+        shared_venues_sheet.column_dimensions[f"A"].width = 16
+        shared_venues_sheet.column_dimensions[f"B"].width = 40
+        shared_venues_sheet.column_dimensions[f"C"].width = 10
+        shared_venues_sheet.column_dimensions[f"D"].width = 16
+        shared_venues_sheet.column_dimensions[f"E"].width = 5
+
         dates = self.timetable_days()
         slots = TimetableSlot.objects.filter(timetable=self.pk).order_by("index")
         slots_queue = Queue(list(slots))
@@ -161,6 +222,7 @@ class Timetable(models.Model):
         column_indexes = "B,C,D,E,F,G,H,I,J,K,L,M,N,O,P,Q,R,S,T,U,V,W,X,Y,Z".split(",")
 
         invigilator_index = 2
+        shared_venue_index = 2
 
         if main_sheet:
             main_sheet[f"A1"] = f"Date"  # type: ignore
@@ -183,12 +245,43 @@ class Timetable(models.Model):
             try:
                 for slot_index in range(self.slot_per_day):
                     slot = slots_queue.pop()
-                    courses = slot.courses
+                    courses = list(
+                        slot.courses.select_related("course").prefetch_related("venues")
+                    )
                     buffer = ""
 
+                    # Courses writing in each venue of the slot, a venue with
+                    # more than one course is shared
+                    venue_courses: dict[str, list[SlotCourse]] = {}
+                    for course in courses:
+                        for venue in course.venues.all():
+                            venue_courses.setdefault(venue.code, []).append(course)
+
+                    for venue_code, shared_courses in venue_courses.items():
+                        if len(shared_courses) < 2:
+                            continue
+                        shared_venues_sheet[f"A{shared_venue_index}"] = venue_code
+                        shared_venues_sheet[f"B{shared_venue_index}"] = ", ".join(
+                            shared_course.course.code for shared_course in shared_courses
+                        )
+                        shared_venues_sheet[f"C{shared_venue_index}"] = sum(
+                            shared_course.course.student_count
+                            for shared_course in shared_courses
+                        )
+                        shared_venues_sheet[f"D{shared_venue_index}"] = date
+                        shared_venues_sheet[f"E{shared_venue_index}"] = slot_index + 1
+                        shared_venue_index = shared_venue_index + 1
+
                     for course in courses:
                         venues_buffer = list(
-                            map(lambda venue: venue.code, course.venues.all())
+                            map(
+                                lambda venue: (
+                                    f"{venue.code} shared"
+                                    if len(venue_courses[venue.code]) > 1
+                                    else venue.code
+                                ),
+                                course.venues.all(),
+                            )
                         )
 
                         # Add course supervisor to shett
@@ -235,70 +328,544 @@ class Timetable(models.Model):
         book.save(temp.name)
         return temp
 
-    def generate(self):
-        staffs: Queue[Staff] = Queue(list(self.staffs.all()))
-
-        courses = self.courses.all()
-        venues = self.venues.all()
-        generator = TimetableGenerator(
-            list(courses), self.slot_per_day, self.days_count()
+    def generate(
+        self,
+        strategy: str | None = None,
+        restarts: int = 1,
+        workers: int | None = None,
+        anneal: int = 0,
+        seed: int | None = None,
+        share_venues: bool = False,
+        resources: str | None = None,
+        repair: int = REPAIR_DEPTH,
+        partial: bool = False,
+        budget: Budget | None = None,
+    ):
+        """Generates the timetable slots and persists the best of `restarts`
+        generations, which run on a pool of `workers` processes. Each generation
+        is improved with `anneal` iterations of simulated annealing. With
+        `share_venues` several courses of a slot can write in one venue. The
+        seats and the number of the venues and the invigilators of every slot
+        are checked while slotting in `resources` mode when it is given, see
+        `timetable.resources`, courses a slot has no room for are ignored in
+        reject mode and counted against it in penalise mode. Resources are
+        opt-in: without a mode, overflowing courses are only found once the
+        venues are assigned, as before, and large inputs keep being slotted
+        by independent components, which share no resources. The ignored courses are then repaired with ejection chains `repair` levels
+        deep, see `timetable.repair`, when it is not 0. Courses are only
+        slotted where the slot constraints of the timetable allow, see
+        `timetable.domains`.
+
+        A `partial` generation keeps the pinned slot courses, with their slot,
+        venues, supervisor and invigilators, and only re-slots the other
+        courses around them, in the existing slots. Pinned slot courses of a
+        slot the timetable does not have anymore are re-slotted too. A full
+        generation starts from nothing.
+
+        Every phase of the generation stops when the `budget` runs out or the
+        generation is cancelled, see `generation_budget`, with the best it has:
+        the courses it did not get to are ignored or left without venues. The
+        result is then persisted as it is, with the truncated phases, and not
+        cached.
+
+        The same `seed` on unchanged inputs always gives the same timetable, and
+        the generator result is cached on the inputs hash and the options, so
+        regenerating it does not run the generator again. A random seed is
+        drawn, and returned, when none is given.
+        """
+        if budget is None:
+            budget = Budget()
+        records = load_timetable_records(self)
+        courses_by_id = {course.id: course for course in records.courses}
+        days_count = self.days_count()
+
+        pins = [
+            pin
+            for pin in (load_pinned_records(self) if partial else ())
+            if pin.course in courses_by_id
+            and pin.slot <= days_count * self.slot_per_day
+            and pin.day == math.ceil(pin.slot / self.slot_per_day)
+        ]
+        # The staffs of the pinned slot courses are busy in their slots
+        busy: dict[tuple[int, int], set[int]] = {}
+        for pin in pins:
+            for staff_id in pin.staffs:
+                busy.setdefault((staff_id, pin.day), set()).add(pin.slot)
+        supervisors = SupervisorRota(records.staffs, busy)
+
+        if seed is None:
+            seed = random.randrange(2**31)
+
+        days = self.timetable_days()
+        inputs_hash = fingerprint(records, self.slot_per_day, days)
+        cache_key = generation_cache_key(
+            inputs_hash,
+            seed,
+            strategy,
+            restarts=restarts,
+            anneal=anneal,
+            share_venues=share_venues,
+            resources=resources,
+            repair=repair,
+            pinned=hashlib.sha256(
+                json.dumps([(pin.course, pin.slot, pin.venues) for pin in pins]).encode()
+            ).hexdigest()
+            if pins
+            else "",
         )
-        generator.start()
-        generator.assign_venues(list(venues))
-
-        TimetableSlot.objects.filter(timetable=self.pk).delete()
+        generator = cache.get(cache_key)
+        cached = generator is not None
+
+        if not cached:
+            generator = generate_best(
+                list(records.courses),
+                list(records.venues),
+                self.slot_per_day,
+                days_count,
+                strategy=strategy,
+                restarts=restarts,
+                workers=workers,
+                seed=seed,
+                anneal=anneal,
+                share_venues=share_venues,
+                conflicts=records.conflicts,
+                resources=resources,
+                invigilators=sum(staff.can_invigilate for staff in records.staffs),
+                repair=repair,
+                domains=compile_domains(
+                    records.constraints,
+                    records.courses,
+                    days[:days_count],
+                    self.slot_per_day,
+                ),
+                pinned={pin.course: pin.slot for pin in pins},
+                pinned_venues={pin.course: pin.venues for pin in pins},
+                budget=budget,
+            )
+            if not budget.truncated:
+                cache.set(cache_key, generator, GENERATION_CACHE_TIMEOUT)
 
-        for day in range(self.days_count()):
-            current_day = day + 1
-            slots = generator.get_day_slots(current_day)
+        with transaction.atomic():
+            slots = generator.ordered_slots
 
-            for slot in slots:
-                timetable_slot = TimetableSlot()
-                timetable_slot.timetable = self
-                timetable_slot.index = slot.index
-                timetable_slot.day = slot.slot_day(self.slot_per_day)
-                timetable_slot.save()
+            if partial:
+                timetable_slots = self.keep_slots(slots, [pin.id for pin in pins])
+            else:
+                TimetableSlot.objects.filter(timetable=self.pk).delete()
+                timetable_slots = TimetableSlot.objects.bulk_create(
+                    [
+                        TimetableSlot(timetable=self, index=slot.index, day=slot.day)
+                        for slot in slots
+                    ]
+                )
 
+            slot_courses: list[SlotCourse] = []
+            for slot, timetable_slot in zip(slots, timetable_slots):
                 for course in slot.courses:
-                    slot_course = SlotCourse()
-                    slot_course.slot = timetable_slot
-                    slot_course.course = course
-                    supervisor = staffs.magic_refilling(
-                        lambda staff: staff.department == course.department
+                    if generator.is_pinned(course):
+                        continue
+                    supervisor = supervisors.next(
+                        course.department, timetable_slot.day, slot.index
+                    )
+                    slot_courses.append(
+                        SlotCourse(
+                            slot=timetable_slot,
+                            course_id=course.id,
+                            supervisor_id=supervisor.id if supervisor else None,
+                        )
                     )
-                    slot_course.supervisor = supervisor
 
-                    slot_course.save()
-                    if course in generator.course_assigned_venues:
-                        slot_course.venues.set(generator.course_assigned_venues[course])
-                        slot_course.save()
+            SlotCourse.objects.bulk_create(slot_courses)
+
+            SlotCourse.venues.through.objects.bulk_create(
+                [
+                    SlotCourse.venues.through(slotcourse_id=slot_course.pk, venue_id=venue.id)
+                    for slot_course in slot_courses
+                    for venue in generator.course_assigned_venues.get(
+                        courses_by_id[slot_course.course_id], ()  # type: ignore
+                    )
+                ]
+            )
 
         return {
             "details": "Timetable generated",
+            "strategy": generator.strategy.name,
+            "seed": seed,
+            "inputs_hash": inputs_hash,
+            "cached": cached,
+            "restarts": restarts,
+            "pinned": len(pins),
+            "truncated": bool(budget.truncated),
+            "truncated_phases": list(budget.truncated),
+            "score": generator.score(),
+            "annealing": generator.annealing,
+            "repair": generator.repairing,
+            "spread": generator.spread.summary(),
             "ignored": len(generator.ignored_courses),
+            "shared_venues": len(generator.shared_venues()),
+            "resources": (
+                generator.resources.summary() if generator.resources else None
+            ),
             "ignored_courses": map(
                 lambda course: f"{course.title} {course.code}",
                 generator.ignored_courses,
             ),
         }
 
-    def auto_assign_invigilators(self,):
-        """Tries to assign invigilators to all the courses in the timetable"""
-        
-        slots = TimetableSlot.objects.filter(timetable=self.pk)
-        unasigned_slot_courses: set[SlotCourse] = set()
-        for slot in slots:
-            all_slot_courses = slot_courses([slot])
+    def generation_budget(self, seconds: float | None = None) -> Budget:
+        """Returns a budget of `seconds`, unbounded when None, for generating
+        the timetable, that `cancel_generation` cancels"""
+        key = generation_cancel_key(self.pk)
+        cache.delete(key)
+        return Budget(seconds, lambda: bool(cache.get(key)))
+
+    def cancel_generation(self):
+        """Cancels the generation of the timetable running with a budget from
+        `generation_budget`, its phases stop at their next check"""
+        cache.set(generation_cancel_key(self.pk), True, GENERATION_CANCEL_TIMEOUT)
+
+    def keep_slots(self, slots: Iterable[Slot], pinned: list[int]):
+        """Deletes the slot courses of the timetable but the `pinned` ones and
+        the slots that are not in `slots`, creates the missing ones, and
+        returns the timetable slot of every slot, in order"""
+        SlotCourse.objects.filter(slot__timetable=self.pk).exclude(pk__in=pinned).delete()
+
+        existing = {
+            (timetable_slot.index, timetable_slot.day): timetable_slot
+            for timetable_slot in TimetableSlot.objects.filter(timetable=self.pk)
+        }
+        keys = [(slot.index, slot.day) for slot in slots]
+        TimetableSlot.objects.filter(timetable=self.pk).exclude(
+            pk__in=[existing[key].pk for key in keys if key in existing]
+        ).delete()
+
+        created = iter(
+            TimetableSlot.objects.bulk_create(
+                [
+                    TimetableSlot(timetable=self, index=index, day=day)
+                    for index, day in keys
+                    if (index, day) not in existing
+                ]
+            )
+        )
+        return [existing[key] if key in existing else next(created) for key in keys]
+
+    def place_courses(self, courses: Iterable[Course]):
+        """Adds courses to the timetable and places each one into the persisted
+        schedule without regenerating it.
+
+        The persisted slot courses are the pinned courses of a generator, see
+        `timetable.generator.Generator`, and each new course is placed with
+        `Generator.place` in the slot, among the slots its slot constraints
+        allow where none of its department levels already writes, with the
+        fewest resources over, see `timetable.resources`, then the least
+        spread penalty, see `timetable.objectives`, then the fewest students
+        seated. Its venues, supervisor and invigilators are picked from what
+        the slot and its adjacent slots leave free, the supervisor from a
+        `SupervisorRota` and the invigilators from a `DutyRoster` holding the
+        duties the staffs already have. Only the rows
+        of the placed courses are written, in bulk.
+
+        Raises:
+            Timetable.NotGenerated: If the timetable has no slots yet
 
-            
+        Returns:
+            tuple[list[SlotCourse], list[Course]]: The slot courses of the
+            courses, and the courses that could not be placed
+        """
+        timetable_slots = {
+            slot.index: slot for slot in TimetableSlot.objects.filter(timetable=self.pk)
+        }
+        if len(timetable_slots) == 0:
+            raise Timetable.NotGenerated("Timetable has not been generated yet")
 
-            for slot_course in all_slot_courses:
-                try:
-                    assign_invigilator(slot_course)
-                except SlotCourse.NoStaffAvailable:
-                    unasigned_slot_courses.add(slot_course)
-            
-        return (slots, unasigned_slot_courses)
+        # The courses are only added with the rows of their slot courses
+        with transaction.atomic():
+            courses = list(courses)
+            self.courses.add(*courses)
+
+            records = load_timetable_records(self)
+            courses_by_id = {course.id: course for course in records.courses}
+            days_count = math.ceil(max(timetable_slots) / self.slot_per_day)
+
+            existing = list(
+                SlotCourse.objects.filter(slot__timetable=self.pk).values_list(
+                    "pk", "course_id", "slot__index", "slot__day", "supervisor_id"
+                )
+            )
+            existing_of = {course_id: pk for pk, course_id, _, _, _ in existing}
+            pinned = {
+                course_id: index
+                for _, course_id, index, _, _ in existing
+                if course_id in courses_by_id
+            }
+            new_courses = [course for course in courses if course.pk not in existing_of]
+            new_records = [courses_by_id[course.pk] for course in new_courses]
+
+            generator = TimetableGenerator(
+                [courses_by_id[course_id] for course_id in pinned] + new_records,
+                self.slot_per_day,
+                days_count,
+                domains=compile_domains(
+                    records.constraints,
+                    new_records,
+                    self.timetable_days()[:days_count],
+                    self.slot_per_day,
+                ),
+                pinned=pinned,
+            )
+            generator.use_resources(
+                records.venues,
+                sum(staff.can_invigilate for staff in records.staffs),
+                RESOURCES_PENALISE,
+            )
+            generator.place_pinned()
+
+            def in_range(index: int):
+                # The slot and its adjacent slots on the same day
+                return [index] + [
+                    adjacent.index
+                    for adjacent in generator.get_adjacent_slots(generator.get_slot(index))
+                ]
+
+            seats: dict[int, int] = {slot.index: 0 for slot in generator.ordered_slots}
+            for course_id, index in pinned.items():
+                seats[index] += courses_by_id[course_id].student_count
+
+            used_venues: dict[int, set[int]] = {index: set() for index in seats}
+            for index, venue_id in SlotCourse.venues.through.objects.filter(
+                slotcourse__slot__timetable=self.pk
+            ).values_list("slotcourse__slot__index", "venue_id"):
+                used_venues[index].add(venue_id)
+
+            # busy[(staff id, day)] = indexes of the slots the staff works in that day
+            busy: dict[tuple[int, int], set[int]] = {}
+            for _, _, index, day, supervisor_id in existing:
+                if supervisor_id:
+                    busy.setdefault((supervisor_id, day), set()).add(index)
+
+            roster = DutyRoster(staffs_by_department(records.staffs))
+            supervisors = SupervisorRota(records.staffs, busy)
+            for staff_id, index, day in SlotCourse.invigilators.through.objects.filter(
+                slotcourse__slot__timetable=self.pk
+            ).values_list("staff_id", "slotcourse__slot__index", "slotcourse__slot__day"):
+                busy.setdefault((staff_id, day), set()).add(index)
+                if staff_id in roster.duties:
+                    roster.add(staff_id)
+
+            placed: list[SlotCourse] = list(
+                SlotCourse.objects.filter(
+                    pk__in=[existing_of[course.pk] for course in courses if course.pk in existing_of]
+                )
+            )
+            unplaced: list[Course] = []
+            slot_courses: list[tuple[SlotCourse, list[int], list[int]]] = []
+
+            new_courses.sort(
+                key=lambda course: generator.levels.course_mask(
+                    courses_by_id[course.pk]
+                ).bit_count(),
+                reverse=True,
+            )
+            for course in new_courses:
+                record = courses_by_id[course.pk]
+                mask = generator.levels.course_mask(record)
+
+                candidates = [
+                    slot
+                    for slot in generator.allowed_slots(record)
+                    if not slot.mask & mask
+                ]
+                if len(candidates) == 0:
+                    unplaced.append(course)
+                    continue
+
+                slot = min(
+                    candidates,
+                    key=lambda slot: (
+                        generator.overload(record, slot),
+                        generator.spread.delta(record, slot.day),  # type: ignore
+                        seats[slot.index],
+                        slot.index,
+                    ),
+                )
+                generator.place(record, slot)
+                seats[slot.index] += record.student_count
+                day: int = slot.day  # type: ignore
+
+                unavailable_venues: set[int] = set()
+                for index in in_range(slot.index):
+                    unavailable_venues.update(used_venues[index])
+
+                venue_pool = VenuePool(
+                    venue for venue in records.venues if venue.id not in unavailable_venues
+                )
+                venues = venue_pool.select(record.student_count) or []
+                used_venues[slot.index].update(venue.id for venue in venues)
+
+                supervisor = supervisors.next(record.department, day, slot.index)
+                invigilators = roster.pick(
+                    record.department,
+                    len(venues),
+                    lambda staff_id: not is_resting(busy, staff_id, day, slot.index),
+                )
+                for staff_id in invigilators:
+                    busy.setdefault((staff_id, day), set()).add(slot.index)
+
+                slot_courses.append(
+                    (
+                        SlotCourse(
+                            slot=timetable_slots[slot.index],
+                            course=course,
+                            supervisor_id=supervisor.id if supervisor else None,
+                        ),
+                        [venue.id for venue in venues],
+                        invigilators,
+                    )
+                )
+
+            SlotCourse.objects.bulk_create([slot_course for slot_course, _, _ in slot_courses])
+            SlotCourse.venues.through.objects.bulk_create(
+                [
+                    SlotCourse.venues.through(slotcourse_id=slot_course.pk, venue_id=venue_id)
+                    for slot_course, venue_ids, _ in slot_courses
+                    for venue_id in venue_ids
+                ]
+            )
+            SlotCourse.invigilators.through.objects.bulk_create(
+                [
+                    SlotCourse.invigilators.through(slotcourse_id=slot_course.pk, staff_id=staff_id)
+                    for slot_course, _, staff_ids in slot_courses
+                    for staff_id in staff_ids
+                ]
+            )
+            placed.extend(slot_course for slot_course, _, _ in slot_courses)
+
+            return (placed, unplaced)
+
+    def remove_courses(self, courses: Iterable[Course]):
+        """Removes courses from the timetable, deleting only their slot courses"""
+        courses = list(courses)
+        SlotCourse.objects.filter(slot__timetable=self.pk, course__in=courses).delete()
+        self.courses.remove(*courses)
+
+    def auto_assign_invigilators(
+        self,
+        mode: str = INVIGILATION_FLOW,
+        max_duties: int | None = None,
+        budget: Budget | None = None,
+        slot_courses: Iterable[int] | None = None,
+    ):
+        """Assigns the invigilators of every course in the timetable, and a
+        supervisor to the courses without one. Pinned slot courses are left as
+        they are, and so are the slot courses not in `slot_courses` when it is
+        given: their staffs keep their duties and count as working there, so
+        the duties stay balanced over the whole timetable.
+
+        The slot courses, their venue counts and supervisors and the staffs are
+        loaded in a handful of queries, the assignment runs in memory (see
+        `timetable.invigilation`) and is written back in one transaction with
+        bulk queries, whatever the size of the timetable.
+
+        Args:
+            mode (str): "flow" solves the invigilators of each day at once,
+                "greedy" assigns them slot course by slot course
+            max_duties (int | None): Most invigilation duties a staff can take
+            budget (Budget | None): Time the assignment has, the slot courses
+                left when it runs out are returned as missing invigilators
+            slot_courses (Iterable[int] | None): Ids of the only slot courses
+                to assign
+
+        Raises:
+            ValueError: If mode is not an invigilation mode
+
+        Returns:
+            tuple[QuerySet[TimetableSlot], set[SlotCourse], dict]: The slots of
+            the timetable, the slot courses that are missing invigilators and
+            the workload of the staffs, see `workload_summary`
+        """
+        if mode not in INVIGILATION_MODES:
+            raise ValueError(
+                f"Unknown invigilation mode '{mode}', expected one of {', '.join(INVIGILATION_MODES)}"
+            )
+
+        staffs = load_staff_records(self)
+        records = load_slot_course_records(self)
+
+        # Pinned slot courses, and the ones not assigned, keep their invigilators
+        fixed: dict[int, list[int]] = {
+            pk: []
+            for pk in SlotCourse.objects.filter(
+                slot__timetable=self.pk, pinned=True
+            ).values_list("pk", flat=True)
+        }
+        if slot_courses is None:
+            invigilations = SlotCourse.invigilators.through.objects.filter(
+                slotcourse__in=list(fixed)
+            )
+        else:
+            assigned = set(slot_courses) - set(fixed)
+            fixed.update(
+                (record.id, []) for record in records if record.id not in assigned
+            )
+            invigilations = SlotCourse.invigilators.through.objects.filter(
+                slotcourse__slot__timetable=self.pk
+            ).exclude(slotcourse__in=list(assigned))
+        for slot_course_id, staff_id in invigilations.values_list(
+            "slotcourse_id", "staff_id"
+        ):
+            fixed[slot_course_id].append(staff_id)
+
+        supervised = assign_supervisors(
+            records,
+            staffs,
+            None if slot_courses is None else {record.id for record in records} - set(fixed),
+            fixed,
+        )
+
+        if mode == INVIGILATION_FLOW:
+            assign = assign_invigilators_by_flow
+        else:
+            assign = assign_invigilators_greedy
+        assignments, missing, duties = assign(
+            supervised, staffs, max_duties, fixed, budget
+        )
+
+        with transaction.atomic():
+            SlotCourse.objects.bulk_update(
+                [
+                    SlotCourse(pk=record.id, supervisor_id=record.supervisor)
+                    for record, previous in zip(supervised, records)
+                    if record.supervisor != previous.supervisor
+                    and record.id not in fixed
+                ],
+                ["supervisor"],
+            )
+            replaced = SlotCourse.invigilators.through.objects.filter(
+                slotcourse__slot__timetable=self.pk, slotcourse__pinned=False
+            )
+            if slot_courses is not None:
+                replaced = replaced.filter(slotcourse__in=list(assignments))
+            replaced.delete()
+            SlotCourse.invigilators.through.objects.bulk_create(
+                [
+                    SlotCourse.invigilators.through(
+                        slotcourse_id=slot_course_id, staff_id=staff_id
+                    )
+                    for slot_course_id, staff_ids in assignments.items()
+                    for staff_id in staff_ids
+                ]
+            )
+
+        slots = TimetableSlot.objects.filter(timetable=self.pk)
+        return (
+            slots,
+            set(SlotCourse.objects.filter(pk__in=missing)),
+            workload_summary(duties),
+        )
+
+    class NotGenerated(Exception):
+        pass
 
 
 class TimetableSlot(models.Model):
@@ -338,10 +905,35 @@ class SlotCourse(models.Model):
         Staff, blank=True, related_name="invigilating"
     )
     venues = models.ManyToManyField(Venue, blank=True)
+    # A pinned slot course keeps its slot, venues and invigilators when the
+    # timetable is regenerated with `partial`, see `Timetable.generate`
+    pinned = models.BooleanField(default=False)
 
     def complain_count(self):
         return Complain.objects.filter(slot_course=self.pk).count()
 
+    def shared_venues(self):
+        """Returns the venues of this slot course that other courses of its slot
+        write in as well, with the codes of those courses"""
+        shared = (
+            SlotCourse.venues.through.objects.filter(
+                slotcourse__slot=self.slot_id,  # type: ignore
+                venue__in=self.venues.values("pk"),
+            )
+            .exclude(slotcourse=self.pk)
+            .values_list("venue__code", "slotcourse__course__code")
+            .order_by("venue__code", "slotcourse__course__code")
+        )
+
+        courses_of: dict[str, list[str]] = {}
+        for venue_code, course_code in shared:
+            courses_of.setdefault(venue_code, []).append(course_code)
+
+        return [
+            {"venue": venue_code, "courses": course_codes}
+            for venue_code, course_codes in courses_of.items()
+        ]
+
     class Meta:
         verbose_name_plural = "Slot Courses"
         verbose_name = "Slot Course"
@@ -349,22 +941,27 @@ class SlotCourse(models.Model):
     def __str__(self):
         return f"{self.course} {self.slot}"
 
-    def auto_assign_venues(self, venues: set[Venue] | None = None):
+    def auto_assign_venues(self, venues: "set[Venue] | VenuePool[Venue] | None" = None):
         """Tries to assign venue automatically to this slot course
 
         Args:
-            venues (set[Venue]): Pool of available venues to use
+            venues (set[Venue] | VenuePool[Venue]): Pool of available venues to use,
+            when it is a VenuePool the assigned venues are taken out of it
 
         Returns:
             boolean: True if the operation was successful
         """
-        avialable_venues: list[Venue] = list()
-        if not venues:
+        if isinstance(venues, VenuePool):
+            pool = venues
+        elif venues:
+            pool = VenuePool(venues)
+        else:
             # get all the venues for the timetable
             # and remove venues that are used by other adjacent slot  slotCourses
             # and slot courses in thesame slot as this slot course
 
             adjacent_slot_courses = SlotCourse.objects.filter(
+                slot__timetable=self.slot.timetable_id,  # type: ignore
                 slot__day=self.slot.day,
                 slot__index__in=[
                     self.slot.index - 1,
@@ -373,149 +970,21 @@ class SlotCourse(models.Model):
                 ],
             ).exclude(pk=self.pk)
 
-            used_venues: set[Venue] = set()
-            each(
-                lambda sCourse: used_venues.update(sCourse.venues.all()),
-                adjacent_slot_courses,
-            )
-
-            avialable_venues: list[Venue] = list(
-                set(self.slot.timetable.venues.all()) - used_venues
-            )
-
-        else:
-            avialable_venues = list(venues)
-
-        # Sort the available venues by capacity from high to low and
-        # convert it to queue, loop through each venue and pick venues
-        # the best fit to contain the slot course course student count
-
-        random.shuffle(avialable_venues)
-
-        assigned_venues: list[Venue] = []
-        count = 0
-        done = False
-        course = self.course
-
-        ignored_venues: list[Venue] = list()
-
-        for venue in avialable_venues:
-            if (
-                venue.capacity > course.student_count
-                and venue.capacity <= course.student_count * 1.3
-            ):
-                assigned_venues = [venue]
-                done = True
-                break
-            elif (count + venue.capacity) < (course.student_count * 1.3):
-                assigned_venues.append(venue)
-                count = count + venue.capacity
-            else:
-                ignored_venues.append(venue)
-
-        if not done:
-            sorted(ignored_venues, key=lambda venue: venue.capacity)
+            used_venues = Venue.objects.filter(slotcourse__in=adjacent_slot_courses)
+            pool = VenuePool(self.slot.timetable.venues.exclude(pk__in=used_venues))
 
-            for venue in ignored_venues:
-                if count + venue.capacity < course.student_count * 1.3:
-                    assigned_venues.append(venue)
-                elif count >= course.student_count:
-                    break
+        # Pick the best fitting venue, or venues, for the course student count
+        # and if the pool can not seat the course give it the largest venue left
+        assigned_venues = pool.allocate(self.course.student_count)
 
-        if len(assigned_venues) == 0:
-            assigned_venues.append(avialable_venues.pop())
+        if not assigned_venues:
+            largest = pool.largest()
+            assigned_venues = [pool.take(largest)] if largest else []
         self.venues.set(assigned_venues)
         self.save()
 
         return True
 
-    def auto_assign_invigilator(self, staffs: set[Staff] | None = None):
-        """Tries to assign invigilators automatically based on the number
-        of venues assigned to the slot course
-
-        Returns:
-            int: Status code that represent the success of the assignmnent
-            200 : Means assignment was successfully
-            406 : NO venue was assigned to slot course
-            412 : No available staff
-
-        """
-        venues = set(self.venues.all())
-
-        if len(venues) < 1:
-            raise SlotCourse.NoVenueAssigned("No venue(s) was assigned to slot course")
-
-        # Get slotCourse in thesame slot with this slotcourse and
-        # extract all the staffs that are assgined as supervisors and
-        # invigilators
-        adjacent_slot_courses = SlotCourse.objects.filter(slot=self.slot.pk).exclude(
-            pk=self.pk
-        )
-        unavailable_staffs: set[Staff] = set()
-
-        for adjacent_slot_course in adjacent_slot_courses:
-            unavailable_staffs.update(adjacent_slot_course.invigilators.all())
-
-            if adjacent_slot_course.supervisor:
-                unavailable_staffs.add(adjacent_slot_course.supervisor)
-
-        # Get all slotcourses that are in adjacent slot to this course_slot slot
-        # and extract all the staffs that are assgined as supervisors and
-        # invigilators
-        adjacent_slots_slot_courses = SlotCourse.objects.filter(
-            slot__day=self.slot.day
-        ).exclude(slot=self.slot)
-        for adjacent_slot_course in adjacent_slots_slot_courses:
-            unavailable_staffs.update(adjacent_slot_course.invigilators.all())
-
-            if adjacent_slot_course.supervisor:
-                unavailable_staffs.add(adjacent_slot_course.supervisor)
-
-        # Get all staffs from the slot timetable that can invigilate
-        # and filter then to staffs that are from the course department
-
-        if staffs:
-            course_department_staffs = filter(
-                lambda staff: staff.department == self.course.department, staffs
-            )
-
-            if self.course.department:
-                course_department_staffs = filter(
-                    lambda staff: staff.department == self.course.department,
-                    course_department_staffs,
-                )
-        else:
-            course_department_staffs = self.slot.timetable.staffs.filter(
-                can_invigilate=True,
-            )
-
-            if self.course.department:
-                course_department_staffs = course_department_staffs.filter(
-                    department=self.course.department.pk
-                )
-
-        available_staffs: set[Staff] = (
-            set(course_department_staffs) - unavailable_staffs
-        )
-
-        # No available staff to assign
-        if len(available_staffs) < 1:
-            raise SlotCourse.NoStaffAvailable(
-                "No available staff to invigilate slot course"
-            )
-
-        # Not enough staffs to assigned to number of venue
-        elif len(available_staffs) < len(venues):
-            self.invigilators.set(available_staffs)
-
-        # No issue
-        else:
-            self.invigilators.set(list(available_staffs)[0 : len(venues)])
-
-        self.save()
-
-        return True
-
     def make_complain(self, message: str):
         complain = Complain(slot_course=self, message=message)
         complain.save()
@@ -575,6 +1044,37 @@ class ComplainMessage(models.Model):
     time = models.DateTimeField(auto_created=True, auto_now_add=True)
 
 
+class SlotConstraint(models.Model):
+    """Restricts the slots the courses it matches can be written in, see
+    `timetable.domains`. A constraint matches the courses of its timetable
+    that are in `courses`, have `level` and belong to `department`, a scope
+    left empty matches every course. The matched courses can only be written
+    in the `periods` of a day (1 for the first slot), not on the
+    `excluded_week_days` (0 for Monday), and between `not_before` and
+    `not_after`."""
+
+    timetable = models.ForeignKey(
+        Timetable, on_delete=models.CASCADE, related_name="constraints"
+    )
+    title = models.CharField(max_length=50, blank=True, default="")
+    courses = models.ManyToManyField(Course, blank=True)
+    level = models.IntegerField(null=True, blank=True)
+    department = models.ForeignKey(
+        Department, on_delete=models.CASCADE, null=True, blank=True
+    )
+    periods = models.JSONField(default=list, blank=True)
+    excluded_week_days = models.JSONField(default=list, blank=True)
+    not_before = models.DateField(null=True, blank=True)
+    not_after = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Slot Constraints"
+        verbose_name = "Slot Constraint"
+
+    def __str__(self):
+        return f"{self.title or 'Constraint'} ({self.timetable})"
+
+
 def adjacent_slots(slot: TimetableSlot, include_self=False):
     indexes = (
         [slot.index - 1, slot.index + 1]
@@ -598,61 +1098,14 @@ def slot_courses(slots: Iterable[TimetableSlot]):
     return SlotCourse.objects.filter(slot__in=map(lambda slot: slot.pk, slots))
 
 
-def assign_invigilator(
-    slot_course: SlotCourse, staffs: Iterable[Staff] | None = None
-) -> Iterable[Staff]:
-    """Tries to assign invigilators to all the venues used in the course slot"""
-    venues = slot_course.venues
-    if venues.count() < 1:
-        return []
-
-    # course has venues
-
-    available_staffs: set[Staff] = set()
-
-    if staffs and slot_course.course.department:
-        available_staffs.update(
-            filter(
-                lambda staff: staff.department == slot_course.course.department, staffs
-            )
-        )
-    elif staffs:
-        available_staffs.update(staffs)
-    elif staffs == None and slot_course.course.department:
-        available_staffs.update(
-            slot_course.slot.timetable.staffs.filter(
-                department=slot_course.course.department.pk
-            )
-        )
-    else:
-        available_staffs.update(slot_course.slot.timetable.staffs.all())
+def assign_slot_venues(slot_courses: Iterable[SlotCourse], venues: Iterable[Venue]):
+    """Assigns venues to the courses of a slot from one shared pool, so a venue
+    picked for a course is not offered to the next ones"""
+    pool: VenuePool[Venue] = VenuePool(venues)
 
-    if not staffs:
-        # NO staffs was provided to filter out staffs that are already in the previous slots
-
-        busy_staffs: set[Staff] = set()
-
-        # Loop over each adjacent slot
-
-        in_range_slots = adjacent_slots(slot_course.slot, include_self=True)
-        for adjacent_slot_course in slot_courses(in_range_slots).exclude(
-            pk=slot_course.pk
-        ):
-            busy_staffs.update(adjacent_slot_course.invigilators.all())
-            if adjacent_slot_course.supervisor:
-                busy_staffs.add(adjacent_slot_course.supervisor)
-
-        available_staffs = available_staffs - busy_staffs
-
-    if len(available_staffs) == 0:
-        raise SlotCourse.NoStaffAvailable("No enough staff to assign as invigilators")
-
-    # Available staffs is insufficient to assign to venues
-    if len(available_staffs) < venues.count():
-        slot_course.invigilators.set(available_staffs)
-        return available_staffs
-
-    selected_Staffs = map(lambda index: available_staffs.pop(), range(venues.count()))
-    slot_course.invigilators.set(selected_Staffs)
-
-    return selected_Staffs
+    for slot_course in slot_courses:
+        if len(pool) == 0:
+            # Every venue is taken, fall back to what the adjacent slots leave free
+            slot_course.auto_assign_venues()
+        else:
+            slot_course.auto_assign_venues(pool)
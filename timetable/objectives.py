@@ -0,0 +1,107 @@
+"""
+Soft constraints a generation is scored on, on top of the hard "no department
+level twice in a slot" rule.
+
+`SpreadObjective` penalises a department level writing several exams on one
+day, and exams on consecutive days. It keeps the exams of every (department
+level, day), so the penalty change of placing or removing a course only looks
+at the department levels of the course and the day before and after, and is
+kept up to date by `Generator.place` and `Generator.unplace`.
+"""
+
+from typing import TYPE_CHECKING
+
+from timetable.records import CourseRecord
+
+if TYPE_CHECKING:
+    from timetable.generator import DepartmentLevelIndex
+
+# Penalty of every pair of exams a department level writes on the same day
+SAME_DAY_WEIGHT = 3
+
+# Penalty of every pair of exams a department level writes on consecutive days
+CONSECUTIVE_DAY_WEIGHT = 1
+
+
+class SpreadObjective:
+    def __init__(
+        self,
+        levels: "DepartmentLevelIndex",
+        same_day_weight: int = SAME_DAY_WEIGHT,
+        consecutive_day_weight: int = CONSECUTIVE_DAY_WEIGHT,
+    ) -> None:
+        self.levels = levels
+        self.same_day_weight = same_day_weight
+        self.consecutive_day_weight = consecutive_day_weight
+
+        # exams[(department level bit, day)] = exams the department level writes that day
+        self.exams: dict[tuple[int, int], int] = {}
+        self.same_day = 0
+        self.consecutive_days = 0
+        self.course_levels: dict[int, tuple[int, ...]] = {}
+
+    def clear(self):
+        self.exams = {}
+        self.same_day = 0
+        self.consecutive_days = 0
+
+    def bits(self, course: CourseRecord) -> tuple[int, ...]:
+        """The department level bits of a course"""
+        if course.id not in self.course_levels:
+            bits = []
+            mask = self.levels.course_mask(course)
+            while mask:
+                lowest = mask & -mask
+                bits.append(lowest.bit_length() - 1)
+                mask ^= lowest
+            self.course_levels[course.id] = tuple(bits)
+        return self.course_levels[course.id]
+
+    @property
+    def penalty(self) -> int:
+        return (
+            self.same_day * self.same_day_weight
+            + self.consecutive_days * self.consecutive_day_weight
+        )
+
+    def pairs(self, course: CourseRecord, day: int) -> tuple[int, int]:
+        """Returns the exams already on the day and on the days next to it that
+        the course would pair with"""
+        exams = self.exams
+        same_day = consecutive_days = 0
+        for bit in self.bits(course):
+            same_day += exams.get((bit, day), 0)
+            consecutive_days += exams.get((bit, day - 1), 0) + exams.get(
+                (bit, day + 1), 0
+            )
+        return same_day, consecutive_days
+
+    def delta(self, course: CourseRecord, day: int) -> int:
+        """Returns the penalty adding the course on the day would add"""
+        same_day, consecutive_days = self.pairs(course, day)
+        return (
+            same_day * self.same_day_weight
+            + consecutive_days * self.consecutive_day_weight
+        )
+
+    def add(self, course: CourseRecord, day: int):
+        same_day, consecutive_days = self.pairs(course, day)
+        self.same_day += same_day
+        self.consecutive_days += consecutive_days
+        for bit in self.bits(course):
+            self.exams[(bit, day)] = self.exams.get((bit, day), 0) + 1
+
+    def remove(self, course: CourseRecord, day: int):
+        for bit in self.bits(course):
+            self.exams[(bit, day)] -= 1
+        same_day, consecutive_days = self.pairs(course, day)
+        self.same_day -= same_day
+        self.consecutive_days -= consecutive_days
+
+    def summary(self) -> dict:
+        return {
+            "same_day_pairs": self.same_day,
+            "consecutive_day_pairs": self.consecutive_days,
+            "penalty": self.penalty,
+            "most_exams_a_day": max(self.exams.values(), default=0),
+        }
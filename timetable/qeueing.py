@@ -1,3 +1,4 @@
+from collections import deque
 from typing import Any, Callable, TypeVar, Iterable
 
 
@@ -13,46 +14,94 @@ X = TypeVar("X")
 
 
 class Queue(Iterable[X]):
-    def __init__(self, items: list[X] | None = None):
-        if items:
-            self.__items: list = items.copy()
-        else:
-            self.__items: list = []
+    """First in first out queue on a `collections.deque`.
+
+    `pop`, `push` and `shift` are O(1) per item. Items taken out of the middle
+    of the queue, by `remove` or `magic_refilling`, are not deleted from the
+    deque: their entry is emptied and skipped once it reaches the front, and
+    the deque is compacted when dead entries outnumber the items.
+
+    With a `key`, the queue also keeps the entries of each key in queue order,
+    so `magic_refilling_by_key` finds the first item of a key without scanning
+    the queue.
+    """
+
+    def __init__(
+        self, items: Iterable[X] | None = None, key: Callable[[X], Any] | None = None
+    ):
+        # Entries are [item] while the item is queued and [] once it is not
+        self.__entries: deque[list] = deque()
+        self.__index: dict[Any, deque[list]] = {}
+        self.__key = key
+        self.__count = 0
+        self.__dead = 0
+
+        for item in items or ():
+            self.push(item)
 
     def __iter__(self):
-        while len(self.__items) != 0:
+        while self.__count != 0:
             yield self.pop()
 
+    def __kill(self, entry: list):
+        entry.clear()
+        self.__count -= 1
+        self.__dead += 1
+
+        if self.__dead > self.__count + 64:
+            self.__entries = deque(entry for entry in self.__entries if entry)
+            for key, entries in self.__index.items():
+                self.__index[key] = deque(entry for entry in entries if entry)
+            self.__dead = 0
+
     def pop(self) -> X:
-        if len(self.__items) == 0:
+        while self.__entries and not self.__entries[0]:
+            self.__entries.popleft()
+            self.__dead -= 1
+
+        if self.__count == 0:
             raise IndexError("Queue has no items in it to pop")
-        item: X = self.__items[0]
-        self.__items = self.__items[1:]
+
+        entry = self.__entries.popleft()
+        item: X = entry[0]
+        entry.clear()
+        self.__count -= 1
+
+        if self.__key:
+            # The popped entry was the first of its key too
+            entries = self.__index[self.__key(item)]
+            while entries and not entries[0]:
+                entries.popleft()
         return item
 
     def remove(self, item: X):
-        if item in self.__items:
-            self.__items.remove(item)
+        for entry in self.__entries:
+            if entry and entry[0] == item:
+                self.__kill(entry)
+                return
 
     def shift(self, size=1):
-        tail = self.__items[:size]
-        head = self.__items[size:]
-        self.__items = head + tail
+        for _ in range(min(size, self.__count)):
+            self.push(self.pop())
 
     def push(self, item: X):
-        self.__items.append(item)
+        entry = [item]
+        self.__entries.append(entry)
+        self.__count += 1
+        if self.__key:
+            self.__index.setdefault(self.__key(item), deque()).append(entry)
         return self
 
     def __len__(self):
-        return len(self.__items)
+        return self.__count
 
     def __str__(self) -> str:
-        return f"{self.__items}"
+        return f"{self.items}"
 
     def __repr__(self) -> str:
-        return f"{self.__items}"
-    
-    def magic_refilling(self,selector: Callable[[X], bool])->None | X:
+        return f"{self.items}"
+
+    def magic_refilling(self, selector: Callable[[X], bool]) -> None | X:
         """It searches for first item that return true for the selector callback,
         if any found, it will pop it from the queue and push it to the end of the queue
          and returns the item.
@@ -63,25 +112,48 @@ class Queue(Iterable[X]):
         Returns:
             None | X: _description_
         """
-        
-        matching_item = None
-        
-        for item in self.__items:
-            if selector(item):
-                matching_item = item 
-                break 
-            
-        if matching_item:
-            self.__items.remove(matching_item)
-            self.push(matching_item)
-            return matching_item
+
+        matching_entry = None
+
+        for entry in self.__entries:
+            if entry and selector(entry[0]):
+                matching_entry = entry
+                break
+
+        if matching_entry:
+            item: X = matching_entry[0]
+            self.__kill(matching_entry)
+            self.push(item)
+            return item
         return None
 
+    def magic_refilling_by_key(self, key: Any) -> None | X:
+        """Same as `magic_refilling` with a selector matching the items of a key,
+        in O(1) amortised
+
+        Raises:
+            ValueError: If the queue was not created with a key
+        """
+        if not self.__key:
+            raise ValueError("Queue has no key to look items up by")
+
+        entries = self.__index.get(key)
+        while entries and not entries[0]:
+            entries.popleft()
+        if not entries:
+            return None
+
+        entry = entries.popleft()
+        item: X = entry[0]
+        self.__kill(entry)
+        self.push(item)
+        return item
+
     @property
     def items(
         self,
     ):
-        return self.__items.copy()
+        return [entry[0] for entry in self.__entries if entry]
 
     def count(self):
-        return len(self.__items)
+        return self.__count
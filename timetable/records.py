@@ -0,0 +1,441 @@
+"""
+Compact, immutable records the timetable generator runs on.
+
+The generator never touches Django models: `load_timetable_records` pulls
+everything it needs for a timetable in a fixed number of queries and turns the
+rows into `__slots__` records keyed by their database ids. Records are plain
+python objects, so a loaded timetable can be pickled, sent to worker processes
+or built by hand for benchmarks without a database.
+"""
+
+import hashlib
+import json
+from typing import Any, Iterable
+
+
+class Record:
+    """Base class for the generator records.
+
+    Records are read only, compare and hash by their class and id, and expose
+    `pk` so they can be used where a model instance was used before.
+    """
+
+    __slots__: tuple[str, ...] = ("id",)
+
+    def __init__(self, *values: Any) -> None:
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is read only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is read only")
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, field) for field in self.__slots__))
+
+    @property
+    def pk(self) -> int:
+        return self.id  # type: ignore
+
+    def __eq__(self, other: object) -> bool:
+        return other.__class__ is self.__class__ and other.id == self.id  # type: ignore
+
+    def __hash__(self) -> int:
+        return hash(self.id)  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.id})"  # type: ignore
+
+
+class DepartmentRecord(Record):
+    __slots__ = ("id", "code")
+
+    id: int
+    code: str
+
+
+class CourseRecord(Record):
+    __slots__ = (
+        "id",
+        "code",
+        "title",
+        "level",
+        "student_count",
+        "department",
+        "departments",
+    )
+
+    id: int
+    code: str
+    title: str
+    level: int
+    student_count: int
+    department: int | None
+    departments: tuple[DepartmentRecord, ...]
+
+    def __str__(self) -> str:
+        return f"{self.title} ({self.code})"
+
+
+class VenueRecord(Record):
+    __slots__ = ("id", "code", "capacity")
+
+    id: int
+    code: str
+    capacity: int
+
+
+class StaffRecord(Record):
+    __slots__ = ("id", "name", "department", "can_supervise", "can_invigilate")
+
+    id: int
+    name: str
+    department: int
+    can_supervise: bool
+    can_invigilate: bool
+
+
+class SlotCourseRecord(Record):
+    """A persisted slot course, `slot` is the index of its slot and `venues`
+    the number of venues it writes in"""
+
+    __slots__ = ("id", "slot", "day", "department", "supervisor", "venues")
+
+    id: int
+    slot: int
+    day: int
+    department: int | None
+    supervisor: int | None
+    venues: int
+
+
+class PinnedRecord(Record):
+    """A pinned slot course, `slot` is the index of its slot, `venues` the ids
+    of its venues and `staffs` the ids of its supervisor and invigilators"""
+
+    __slots__ = ("id", "course", "slot", "day", "venues", "staffs")
+
+    id: int
+    course: int
+    slot: int
+    day: int
+    venues: tuple[int, ...]
+    staffs: tuple[int, ...]
+
+
+class SlotConstraintRecord(Record):
+    """A slot constraint of a timetable, `courses` are course ids, empty when
+    it matches courses of any id, and the dates are "YYYY-MM-DD" strings"""
+
+    __slots__ = (
+        "id",
+        "courses",
+        "level",
+        "department",
+        "periods",
+        "excluded_week_days",
+        "not_before",
+        "not_after",
+    )
+
+    id: int
+    courses: frozenset[int]
+    level: int | None
+    department: int | None
+    periods: tuple[int, ...]
+    excluded_week_days: tuple[int, ...]
+    not_before: str | None
+    not_after: str | None
+
+
+class TimetableRecords:
+    """Everything the generator needs to know about a timetable"""
+
+    __slots__ = (
+        "courses",
+        "venues",
+        "staffs",
+        "departments",
+        "conflicts",
+        "constraints",
+    )
+
+    def __init__(
+        self,
+        courses: Iterable[CourseRecord],
+        venues: Iterable[VenueRecord],
+        staffs: Iterable[StaffRecord],
+        departments: Iterable[DepartmentRecord],
+        conflicts: dict[int, tuple[int, ...]] | None = None,
+        constraints: Iterable[SlotConstraintRecord] = (),
+    ) -> None:
+        self.courses: tuple[CourseRecord, ...] = tuple(courses)
+        self.venues: tuple[VenueRecord, ...] = tuple(venues)
+        self.staffs: tuple[StaffRecord, ...] = tuple(staffs)
+        self.departments: dict[int, DepartmentRecord] = {
+            department.id: department for department in departments
+        }
+        # The ids of the courses each course conflicts with, None when they
+        # were not loaded
+        self.conflicts = conflicts
+        self.constraints: tuple[SlotConstraintRecord, ...] = tuple(constraints)
+
+    def __getstate__(self):
+        return (
+            self.courses,
+            self.venues,
+            self.staffs,
+            self.departments,
+            self.conflicts,
+            self.constraints,
+        )
+
+    def __setstate__(self, state):
+        (
+            self.courses,
+            self.venues,
+            self.staffs,
+            self.departments,
+            self.conflicts,
+            self.constraints,
+        ) = state
+
+
+def load_timetable_records(timetable) -> TimetableRecords:
+    """Loads the courses (with their departments), venues, staffs, course
+    conflicts and slot constraints of a timetable in seven queries, whatever
+    the size of the timetable. Rows are read in pk order so a seeded generation always sees the
+    same input.
+
+    Args:
+        timetable (Timetable): The timetable to load
+
+    Returns:
+        TimetableRecords: The records of the timetable
+    """
+    from core.models import Course
+
+    courses = timetable.courses.order_by("pk")
+    course_departments = Course.departments.through.objects.filter(
+        course__in=courses.values("pk")
+    ).values_list("course_id", "department_id", "department__code").order_by("pk")
+
+    departments: dict[int, DepartmentRecord] = {}
+    departments_of: dict[int, list[DepartmentRecord]] = {}
+
+    for course_id, department_id, department_code in course_departments:
+        if department_id not in departments:
+            departments[department_id] = DepartmentRecord(department_id, department_code)
+        departments_of.setdefault(course_id, []).append(departments[department_id])
+
+    course_records = [
+        CourseRecord(
+            pk,
+            code,
+            title,
+            level,
+            student_count,
+            department_id,
+            tuple(departments_of.get(pk, ())),
+        )
+        for pk, code, title, level, student_count, department_id in courses.values_list(
+            "pk", "code", "title", "level", "student_count", "department_id"
+        )
+    ]
+
+    venue_records = [
+        VenueRecord(*row)
+        for row in timetable.venues.order_by("pk").values_list("pk", "code", "capacity")
+    ]
+
+    return TimetableRecords(
+        course_records,
+        venue_records,
+        load_staff_records(timetable),
+        departments.values(),
+        load_conflicts(timetable),
+        load_constraints(timetable),
+    )
+
+
+def load_staff_records(timetable) -> list[StaffRecord]:
+    """Loads the staffs of a timetable in pk order, in one query"""
+    return [
+        StaffRecord(*row)
+        for row in timetable.staffs.order_by("pk").values_list(
+            "pk", "name", "department_id", "can_supervise", "can_invigilate"
+        )
+    ]
+
+
+def load_conflicts(timetable) -> dict[int, tuple[int, ...]]:
+    """Loads the persisted conflicts between the courses of a timetable, see
+    `core.conflicts`, in one query. Courses without conflicts are left out."""
+    from core.models import CourseConflict
+
+    courses = timetable.courses.values("pk")
+    conflicts: dict[int, list[int]] = {}
+    for course_id, other_id in (
+        CourseConflict.objects.filter(course__in=courses, other__in=courses)
+        .order_by("course_id", "other_id")
+        .values_list("course_id", "other_id")
+    ):
+        conflicts.setdefault(course_id, []).append(other_id)
+    return {course_id: tuple(others) for course_id, others in conflicts.items()}
+
+
+def load_constraints(timetable) -> list[SlotConstraintRecord]:
+    """Loads the slot constraints of a timetable in pk order, in two queries"""
+    from timetable.models import SlotConstraint
+
+    constraints = SlotConstraint.objects.filter(timetable=timetable.pk).order_by("pk")
+    courses_of: dict[int, set[int]] = {}
+    for constraint_id, course_id in SlotConstraint.courses.through.objects.filter(
+        slotconstraint__in=constraints.values("pk")
+    ).values_list("slotconstraint_id", "course_id"):
+        courses_of.setdefault(constraint_id, set()).add(course_id)
+
+    return [
+        SlotConstraintRecord(
+            pk,
+            frozenset(courses_of.get(pk, ())),
+            level,
+            department_id,
+            tuple(periods or ()),
+            tuple(excluded_week_days or ()),
+            str(not_before) if not_before else None,
+            str(not_after) if not_after else None,
+        )
+        for (
+            pk,
+            level,
+            department_id,
+            periods,
+            excluded_week_days,
+            not_before,
+            not_after,
+        ) in constraints.values_list(
+            "pk",
+            "level",
+            "department_id",
+            "periods",
+            "excluded_week_days",
+            "not_before",
+            "not_after",
+        )
+    ]
+
+
+def load_slot_course_records(timetable) -> list[SlotCourseRecord]:
+    """Loads the slot courses of a generated timetable, with their slot, the
+    department of their course, their supervisor and their number of venues,
+    in two queries
+
+    Args:
+        timetable (Timetable): The timetable to load
+
+    Returns:
+        list[SlotCourseRecord]: The slot courses in slot order
+    """
+    from timetable.models import SlotCourse
+
+    venue_counts: dict[int, int] = {}
+    for slot_course_id in SlotCourse.venues.through.objects.filter(
+        slotcourse__slot__timetable=timetable.pk
+    ).values_list("slotcourse_id", flat=True):
+        venue_counts[slot_course_id] = venue_counts.get(slot_course_id, 0) + 1
+
+    return [
+        SlotCourseRecord(
+            pk, index, day, department_id, supervisor_id, venue_counts.get(pk, 0)
+        )
+        for pk, index, day, department_id, supervisor_id in SlotCourse.objects.filter(
+            slot__timetable=timetable.pk
+        )
+        .order_by("slot__index", "pk")
+        .values_list(
+            "pk", "slot__index", "slot__day", "course__department_id", "supervisor_id"
+        )
+    ]
+
+
+def load_pinned_records(timetable) -> list[PinnedRecord]:
+    """Loads the pinned slot courses of a timetable in slot order, with their
+    venues and staffs, in three queries"""
+    from timetable.models import SlotCourse
+
+    pinned = SlotCourse.objects.filter(slot__timetable=timetable.pk, pinned=True)
+    venues_of: dict[int, list[int]] = {}
+    for slot_course_id, venue_id in SlotCourse.venues.through.objects.filter(
+        slotcourse__in=pinned.values("pk")
+    ).values_list("slotcourse_id", "venue_id").order_by("venue_id"):
+        venues_of.setdefault(slot_course_id, []).append(venue_id)
+
+    staffs_of: dict[int, list[int]] = {}
+    for slot_course_id, staff_id in SlotCourse.invigilators.through.objects.filter(
+        slotcourse__in=pinned.values("pk")
+    ).values_list("slotcourse_id", "staff_id").order_by("staff_id"):
+        staffs_of.setdefault(slot_course_id, []).append(staff_id)
+
+    return [
+        PinnedRecord(
+            pk,
+            course_id,
+            index,
+            day,
+            tuple(venues_of.get(pk, ())),
+            tuple(
+                ([supervisor_id] if supervisor_id else []) + staffs_of.get(pk, [])
+            ),
+        )
+        for pk, course_id, index, day, supervisor_id in pinned.order_by(
+            "slot__index", "pk"
+        ).values_list("pk", "course_id", "slot__index", "slot__day", "supervisor_id")
+    ]
+
+
+def fingerprint(records: TimetableRecords, slot_per_day: int, days: list[str]) -> str:
+    """Returns a canonical hash of everything a generation depends on: the
+    courses with their departments, levels and student counts, the venues, the
+    staffs, the slot constraints, the number of slots per day and the days of
+    the timetable. The codes and titles of the courses are in too, the cached
+    generator reports its ignored courses by them."""
+    payload = {
+        "courses": sorted(
+            (
+                course.id,
+                course.code,
+                course.title,
+                course.level,
+                course.student_count,
+                course.department,
+                sorted(department.id for department in course.departments),
+            )
+            for course in records.courses
+        ),
+        "venues": sorted((venue.id, venue.capacity) for venue in records.venues),
+        "staffs": sorted(
+            (staff.id, staff.department, staff.can_supervise, staff.can_invigilate)
+            for staff in records.staffs
+        ),
+        "constraints": sorted(
+            (
+                constraint.id,
+                sorted(constraint.courses),
+                constraint.level,
+                constraint.department,
+                sorted(constraint.periods),
+                sorted(constraint.excluded_week_days),
+                constraint.not_before,
+                constraint.not_after,
+            )
+            for constraint in records.constraints
+        ),
+        "slot_per_day": slot_per_day,
+        "days": days,
+    }
+    return hashlib.sha256(
+        json.dumps(payload, separators=(",", ":")).encode()
+    ).hexdigest()
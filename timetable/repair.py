@@ -0,0 +1,187 @@
+"""
+Ejection chain repair of the courses `Generator.start` could not place.
+
+An ignored course is put in a slot whose courses sharing a department level
+with it, its blockers, are few. The blockers are ejected and put back in other
+slots the same way, which can eject courses in turn, down to a bounded depth.
+A chain that can not be completed is undone move by move, so the schedule is
+left as it was. The courses of a chain are never ejected again by the same
+chain, and every course gets a budget of slots to try, so one repair costs at
+most O(budget x slots x courses of a slot). Courses are only moved to the
+slots of their domain, see `timetable.domains`, and pinned courses are never
+ejected. Courses with a department level every slot of their domain already
+holds can not be repaired and are skipped.
+"""
+
+import time
+from typing import TYPE_CHECKING
+
+from timetable.records import CourseRecord
+
+if TYPE_CHECKING:
+    from timetable.generator import Generator, Slot
+
+# Levels of ejected courses a chain goes down
+REPAIR_DEPTH = 3
+
+
+class Repair:
+    def __init__(
+        self,
+        generator: "Generator",
+        depth: int = REPAIR_DEPTH,
+        max_blockers: int = 2,
+        budget: int = 100,
+    ) -> None:
+        """
+        Args:
+            depth (int): Levels of ejected courses a chain goes down
+            max_blockers (int): Most courses a chain ejects from a slot
+            budget (int): Most slots a chain tries for an ignored course
+        """
+        self.generator = generator
+        self.depth = depth
+        self.max_blockers = max_blockers
+        self.budget = budget
+
+        # (course, slot it left or None, slot it went to or None) of the chain
+        self.moves: list[tuple[CourseRecord, "Slot | None", "Slot | None"]] = []
+        self.tries = 0
+
+    def run(self) -> dict:
+        """Repairs every ignored course it can, until the budget of the
+        generator runs out, and returns the number of repaired and still
+        ignored courses and the time it took"""
+        generator = self.generator
+        start = time.perf_counter()
+
+        # Courses with the most department levels are the hardest to fit
+        ignored = sorted(
+            generator.ignored_courses,
+            key=lambda course: (
+                -generator.levels.course_mask(course).bit_count(),
+                -course.student_count,
+                course.id,
+            ),
+        )
+
+        repaired = 0
+        for course in ignored:
+            if generator.out_of_time("repair"):
+                break
+            if self.is_hopeless(course):
+                continue
+            self.moves = []
+            self.tries = 0
+            if self.insert(course, self.depth, frozenset((course.id,))):
+                generator.ignored_courses.discard(course)
+                repaired += 1
+
+        return {
+            "depth": self.depth,
+            "repaired": repaired,
+            "ignored": len(generator.ignored_courses),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    def is_hopeless(self, course: CourseRecord) -> bool:
+        """A course with a department level every slot of its domain already
+        holds can not be placed, whatever course of the level it ejects has
+        nowhere to go"""
+        slots = self.generator.allowed_slots(course)
+        mask = self.generator.levels.course_mask(course)
+        while mask:
+            lowest = mask & -mask
+            if all(slot.mask & lowest for slot in slots):
+                return True
+            mask ^= lowest
+        return False
+
+    def insert(self, course: CourseRecord, depth: int, chain: frozenset[int]) -> bool:
+        """Places the course, ejecting and re-inserting the blockers of a slot
+        when depth allows it. Returns False, with every move of this call
+        undone, if it can not."""
+        generator = self.generator
+        mask = generator.levels.course_mask(course)
+        current = generator.placements.get(course.id)
+
+        options = []
+        for slot in generator.allowed_slots(course):
+            if slot is current:
+                continue
+
+            blockers = (
+                [
+                    other
+                    for other in slot.courses
+                    if generator.levels.course_mask(other) & mask
+                ]
+                if slot.mask & mask
+                else []
+            )
+            if not blockers:
+                if self.place(course, slot):
+                    return True
+                continue
+
+            if (
+                depth > 0
+                and len(blockers) <= self.max_blockers
+                and not any(blocker.id in chain for blocker in blockers)
+                and not any(map(generator.is_pinned, blockers))
+            ):
+                options.append(
+                    (
+                        len(blockers),
+                        sum(blocker.student_count for blocker in blockers),
+                        slot.index,
+                        slot,
+                        blockers,
+                    )
+                )
+
+        # Slots with the fewest, then the smallest, blockers first
+        options.sort(key=lambda option: option[:3])
+        for _, _, _, slot, blockers in options:
+            if self.tries >= self.budget:
+                break
+            self.tries += 1
+
+            mark = len(self.moves)
+            for blocker in blockers:
+                self.unplace(blocker)
+
+            inner_chain = chain.union(blocker.id for blocker in blockers)
+            if self.place(course, slot) and all(
+                self.insert(blocker, depth - 1, inner_chain) for blocker in blockers
+            ):
+                return True
+
+            self.rollback(mark)
+
+        return False
+
+    def place(self, course: CourseRecord, slot: "Slot") -> bool:
+        source = self.generator.placements.get(course.id)
+        if source is not None:
+            self.generator.unplace(course)
+        if self.generator.place(course, slot):
+            self.moves.append((course, source, slot))
+            return True
+        if source is not None:
+            self.generator.place(course, source)
+        return False
+
+    def unplace(self, course: CourseRecord):
+        source = self.generator.placements.get(course.id)
+        self.generator.unplace(course)
+        self.moves.append((course, source, None))
+
+    def rollback(self, mark: int):
+        """Undoes the moves of the chain made after mark, last first"""
+        while len(self.moves) > mark:
+            course, source, target = self.moves.pop()
+            if target is not None:
+                self.generator.unplace(course)
+            if source is not None:
+                self.generator.place(course, source)
@@ -0,0 +1,164 @@
+"""
+Seats, venues and invigilators the slots of a generation use, checked at
+placement.
+
+A venue used in a slot can not be used in the slots next to it on the same
+day, and neither can an invigilator, so two adjacent slots share the venues of
+the timetable and its invigilators between them. `SlotResources` keeps what
+every window of a slot and the slot after it (a slot alone when it is the last
+of its day) uses of each resource and the excess of each window over what the
+timetable has:
+
+- seats: the students of the courses, against the seats of every venue
+- venues: the fewest venues that can seat each course, the largest first,
+  against the number of venues. Not checked when courses share venues, see
+  `timetable.venues.SharedVenuePool`
+- invigilators: one for each of those venues, against the staffs that can
+  invigilate
+
+These are lower bounds. A window within all of them can still leave courses
+without a venue, the largest venues only go to one course of it and venues
+are packed after slotting, see `Generator.assign_venues`, they only keep out
+the windows no packing can cover.
+
+In `RESOURCES_REJECT` mode `Generator.place` refuses a course that would take
+a window over, in `RESOURCES_PENALISE` mode it is placed and the scoring
+strategies and the annealer count the excess against the slot.
+"""
+
+import bisect
+import itertools
+from typing import TYPE_CHECKING, Iterable
+
+from timetable.records import CourseRecord
+
+if TYPE_CHECKING:
+    from timetable.generator import Slot
+
+RESOURCES_REJECT = "reject"
+RESOURCES_PENALISE = "penalise"
+RESOURCES_MODES = (RESOURCES_REJECT, RESOURCES_PENALISE)
+
+# The resources of a window, in the order of `SlotResources.limits`
+RESOURCES = ("seats", "venues", "invigilators")
+
+
+class SlotResources:
+    def __init__(
+        self,
+        slots: "tuple[Slot, ...]",
+        neighbours: "list[tuple[Slot, ...]]",
+        capacities: Iterable[int],
+        invigilators: int,
+        mode: str = RESOURCES_REJECT,
+        share_venues: bool = False,
+    ) -> None:
+        """
+        Args:
+            slots (tuple[Slot, ...]): Every slot of the generation, by index
+            neighbours (list[tuple[Slot, ...]]): The slots next to each slot
+            capacities (Iterable[int]): Capacities of the timetable venues,
+                seats and venues are not checked when there are none
+            invigilators (int): Staffs that can invigilate, not checked when 0
+            share_venues (bool): Courses of a slot can write in one venue, the
+                number of venues is not checked
+
+        Raises:
+            ValueError: If mode is not one of `RESOURCES_MODES`
+        """
+        if mode not in RESOURCES_MODES:
+            raise ValueError(
+                f"Unknown resources mode '{mode}', expected one of {', '.join(RESOURCES_MODES)}"
+            )
+
+        self.mode = mode
+        # largest[k] = seats of the k largest venues
+        capacities = sorted(capacities, reverse=True)
+        self.largest = list(itertools.accumulate(capacities, initial=0))
+        # What the timetable has of each resource, 0 when it is not checked
+        self.limits: tuple[int, ...] = (
+            self.largest[-1],
+            0 if share_venues else len(capacities),
+            invigilators,
+        )
+        self.demands: dict[int, tuple[int, ...]] = {}
+
+        # windows_of[index - 1] are the windows holding a slot: its own, and
+        # the one of the slot before it on the same day
+        self.windows_of: list[tuple[int, ...]] = []
+        for position, slot in enumerate(slots):
+            before = [
+                adjacent for adjacent in neighbours[position] if adjacent.index < slot.index
+            ]
+            self.windows_of.append(
+                (position, before[0].index - 1) if before else (position,)
+            )
+
+        # loads[resource][window] = what the courses of the window use of it
+        self.loads: list[list[int]] = [[0] * len(slots) for _ in RESOURCES]
+        self.excess = 0
+        self.rejected = 0
+
+    def clear(self):
+        self.loads = [[0] * len(loads) for loads in self.loads]
+        self.excess = 0
+        self.rejected = 0
+
+    def demand(self, course: CourseRecord) -> tuple[int, ...]:
+        """Returns the students of a course, the fewest venues that can seat
+        them and the invigilators of those venues"""
+        if course.id not in self.demands:
+            venues = min(
+                max(1, bisect.bisect_left(self.largest, course.student_count)),
+                max(1, len(self.largest) - 1),
+            )
+            self.demands[course.id] = (course.student_count, venues, venues)
+        return self.demands[course.id]
+
+    def overload(self, course: CourseRecord, slot: "Slot") -> int:
+        """Returns the excess resources adding the course to the slot would
+        add, 0 if the slot has room for it"""
+        return self.change(course, slot, 1)
+
+    def change(self, course: CourseRecord, slot: "Slot", step: int) -> int:
+        delta = 0
+        for loads, limit, need in zip(self.loads, self.limits, self.demand(course)):
+            if not limit:
+                continue
+            for window in self.windows_of[slot.index - 1]:
+                load = loads[window]
+                delta += max(0, load + step * need - limit) - max(0, load - limit)
+        return delta
+
+    def rejects(self, course: CourseRecord, slot: "Slot") -> bool:
+        if self.mode == RESOURCES_REJECT and self.overload(course, slot) > 0:
+            self.rejected += 1
+            return True
+        return False
+
+    def add(self, course: CourseRecord, slot: "Slot"):
+        self.update(course, slot, 1)
+
+    def remove(self, course: CourseRecord, slot: "Slot"):
+        self.update(course, slot, -1)
+
+    def update(self, course: CourseRecord, slot: "Slot", step: int):
+        self.excess += self.change(course, slot, step)
+        for loads, need in zip(self.loads, self.demand(course)):
+            for window in self.windows_of[slot.index - 1]:
+                loads[window] += step * need
+
+    def summary(self) -> dict:
+        return {
+            "mode": self.mode,
+            **dict(zip(RESOURCES, self.limits)),
+            "overloaded_windows": sum(
+                1
+                for window in zip(*self.loads)
+                if any(
+                    limit and load > limit for load, limit in zip(window, self.limits)
+                )
+            ),
+            "excess": self.excess,
+            "rejected_placements": self.rejected,
+        }
@@ -21,6 +21,7 @@ from core.serializers import (
 from timetable.models import (
     Complain,
     ComplainMessage,
+    SlotConstraint,
     SlotCourse,
     Timetable,
     TimetableSlot,
@@ -53,6 +54,14 @@ class CreatedTimetableSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class SlotConstraintSerializer(serializers.ModelSerializer):
+    pk = serializers.IntegerField()
+
+    class Meta:
+        model = SlotConstraint
+        fields = "__all__"
+
+
 class ComplainMessageSerializer(serializers.ModelSerializer):
     pk = serializers.IntegerField()
 
@@ -77,6 +86,8 @@ class SlotCourseSeriallizer(serializers.ModelSerializer):
     invigilators = StaffSerializer(many=True)
     venues = PlainVenueSerializer(many=True)
     complain_count = serializers.IntegerField()
+    # Venues other courses of the slot write in as well
+    shared_venues = serializers.ListField(child=serializers.DictField(), read_only=True)
 
     class Meta:
         model = SlotCourse
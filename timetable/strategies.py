@@ -0,0 +1,402 @@
+"""
+Slot assignment strategies used by `timetable.generator.Generator.start`.
+
+A strategy receives the generator, places every course it can through
+`Generator.place` and leaves the rest in `Generator.ignored_courses`. Courses
+with a slot domain, see `timetable.domains`, are only tried in its slots. The
+pinned courses of the generator are already in their slots when it runs.
+When the budget of the generator runs out, the courses it has not got to are
+ignored.
+"""
+
+import heapq
+from typing import TYPE_CHECKING
+
+from timetable.qeueing import Queue
+from timetable.resources import RESOURCES_REJECT
+
+if TYPE_CHECKING:
+    from timetable.generator import Generator, Slot
+
+
+class SlottingStrategy:
+    name = ""
+
+    def assign(self, generator: "Generator") -> None:
+        raise NotImplementedError()
+
+
+class FirstFitStrategy(SlottingStrategy):
+    """Takes the courses with the most departments first and puts each one in
+    the first slot of a freshly shuffled pool of the slots of its domain that
+    accepts it."""
+
+    name = "first-fit"
+
+    def assign(self, generator: "Generator") -> None:
+        # Sort courses by department counts, each department of a course sets
+        # exactly one bit of its mask
+        generator.courses.sort(
+            key=lambda course: generator.levels.course_mask(course).bit_count(),
+            reverse=True,
+        )
+
+        for course in generator.courses:
+            if generator.out_of_time("slotting"):
+                generator.ignored_courses.add(course)
+                continue
+
+            generator.random.shuffle(generator.slots)
+            slot_pool: Queue[Slot] = Queue(
+                [slot for slot in generator.slots if generator.allows(course, slot)]
+                if course.id in generator.domains
+                else generator.slots
+            )
+
+            while slot_pool.count() > 0:
+                # Iterate over all the slot in the slot pool and try adding the course,
+                # If it fails pop the next slot and try again, if slot pool is empty
+                # Add the course to ignored courses
+                slot = slot_pool.pop()
+                if generator.place(course, slot):
+                    break
+            else:
+                generator.ignored_courses.add(course)
+
+
+class DSaturStrategy(SlottingStrategy):
+    """Colours the course conflict graph with the DSatur heuristic.
+
+    Two courses conflict when they share a department level. The graph is built
+    once, every course keeps the set of slots of its domain none of its placed
+    neighbours use, and the course with the fewest slots left is placed next,
+    so restricted courses go first. Ties go to the
+    course with fewer neighbours: when slots run short, a course that blocks
+    many others is the one we would rather leave out.
+
+    Every department level also counts, for each slot, its unplaced courses
+    that still have the slot available, so the options a slot takes away from
+    the neighbours of a course are read from the counts of its department
+    levels instead of being recounted over its neighbours. Each placement only
+    updates the neighbours of the placed course and the counts of their
+    department levels, so a run costs O(E log V) heap operations plus
+    O(department levels of a course x slots) work per course.
+    """
+
+    name = "dsatur"
+
+    def conflict_graph(self, generator: "Generator") -> list[set[int]]:
+        """Returns the neighbours of every course, by position in
+        `generator.courses`, from the persisted conflicts when the generator
+        has them, otherwise from the department level masks"""
+        if generator.conflicts is not None:
+            positions = {
+                course.id: position for position, course in enumerate(generator.courses)
+            }
+            return [
+                {
+                    positions[other]
+                    for other in generator.conflicts.get(course.id, ())
+                    if other in positions
+                }
+                for course in generator.courses
+            ]
+
+        courses_of_level: dict[int, list[int]] = {}
+
+        for position, course in enumerate(generator.courses):
+            mask = generator.levels.course_mask(course)
+            while mask:
+                lowest = mask & -mask
+                courses_of_level.setdefault(lowest.bit_length() - 1, []).append(
+                    position
+                )
+                mask ^= lowest
+
+        neighbours: list[set[int]] = [set() for _ in generator.courses]
+        for positions in courses_of_level.values():
+            for position in positions:
+                neighbours[position].update(positions)
+
+        for position, course_neighbours in enumerate(neighbours):
+            course_neighbours.discard(position)
+
+        return neighbours
+
+    def assign(self, generator: "Generator") -> None:
+        courses = generator.courses
+        slots = list(generator.slots)
+        neighbours = self.conflict_graph(generator)
+
+        # A course goes to the slot with the fewest resources over, see
+        # `Generator.use_resources`, that takes away the fewest options from the
+        # unplaced courses of its department levels, then to the slot adding
+        # the least spread penalty, see `timetable.objectives`, then to the
+        # slot with the fewest students seated so far, ties are broken by a
+        # random rank so equally loaded slots do not always fill in the same order
+        seats = [0] * len(slots)
+        rank = list(range(len(slots)))
+        generator.random.shuffle(rank)
+
+        every_slot = set(range(len(slots)))
+        available: list[set[int]] = [
+            {
+                slot_position
+                for slot_position, slot in enumerate(slots)
+                if generator.allows(course, slot)
+                and not slot.mask & generator.levels.course_mask(course)
+            }
+            if course.id in generator.domains or generator.pinned
+            else set(every_slot)
+            for course in courses
+        ]
+        placed = [False] * len(courses)
+
+        # blocking[bit][slot position] = unplaced courses of the department
+        # level that still have the slot available
+        bits = [generator.spread.bits(course) for course in courses]
+        blocking: list[list[int]] = [[0] * len(slots) for _ in generator.levels.keys]
+        for position, course_bits in enumerate(bits):
+            for bit in course_bits:
+                counts = blocking[bit]
+                for slot_position in available[position]:
+                    counts[slot_position] += 1
+
+        heap = [
+            (len(available[position]) - len(slots), len(neighbours[position]), position)
+            for position in range(len(courses))
+        ]
+        heapq.heapify(heap)
+
+        while heap:
+            saturation, _, position = heapq.heappop(heap)
+            if placed[position] or -saturation != len(slots) - len(available[position]):
+                # Already placed or a stale entry, a fresher one is in the heap
+                continue
+
+            if generator.out_of_time("slotting"):
+                generator.ignored_courses.update(
+                    course
+                    for course, is_placed in zip(courses, placed)
+                    if not is_placed
+                )
+                break
+
+            placed[position] = True
+            course = courses[position]
+            candidates = available[position]
+            open_neighbours = [
+                neighbour for neighbour in neighbours[position] if not placed[neighbour]
+            ]
+            # Placed or ignored, the course no longer needs any slot
+            course_blocking = [blocking[bit] for bit in bits[position]]
+            for counts in course_blocking:
+                for candidate in candidates:
+                    counts[candidate] -= 1
+
+            if not candidates:
+                generator.ignored_courses.add(course)
+                continue
+
+            # The slots do not change while the course is tried, so the excess
+            # resources are evaluated once per candidate and the spread penalty,
+            # which only depends on the day, once per day
+            overload = {
+                candidate: generator.overload(course, slots[candidate])
+                for candidate in candidates
+            }
+            spread = {
+                day: generator.spread.delta(course, day)
+                for day in {slots[candidate].day for candidate in candidates}
+            }
+            while candidates:
+                slot_position = min(
+                    candidates,
+                    key=lambda candidate: (
+                        overload[candidate],
+                        sum(counts[candidate] for counts in course_blocking),
+                        spread[slots[candidate].day],
+                        seats[candidate],
+                        rank[candidate],
+                    ),
+                )
+                if generator.place(course, slots[slot_position]):
+                    seats[slot_position] += course.student_count
+                    break
+                if overload[slot_position] > 0:
+                    # Rejected for its resources, every other slot is over too
+                    candidates.clear()
+                else:
+                    candidates.discard(slot_position)
+            else:
+                generator.ignored_courses.add(course)
+                continue
+
+            for neighbour in open_neighbours:
+                if slot_position not in available[neighbour]:
+                    continue
+
+                available[neighbour].discard(slot_position)
+                for bit in bits[neighbour]:
+                    blocking[bit][slot_position] -= 1
+                heapq.heappush(
+                    heap,
+                    (
+                        len(available[neighbour]) - len(slots),
+                        len(neighbours[neighbour]),
+                        neighbour,
+                    ),
+                )
+
+
+class VectorisedStrategy(SlottingStrategy):
+    """Places the courses with the most department levels first, each one in
+    the best slot it fits, with the whole slot evaluation done in NumPy.
+
+    The strategy keeps a (department level x slot) occupancy matrix, the exams
+    of every department level on every day and the students seated in every
+    slot. For a course, its rows of the incidence matrix select its department
+    levels, one `any` over their occupancy rows, masked by its domain, gives
+    the slots it fits in and sums over their day counts the same-day and
+    consecutive-day exams each slot would add, weighted like
+    `timetable.objectives.SpreadObjective`. The slot with the least spread
+    penalty, then the fewest students seated, is picked, ties going to a
+    random rank, in O(levels of the course x slots) array operations per
+    course. The terms are ranked with one `lexsort`, each on its own array,
+    so no term can spill into another however large it grows. With
+    `Generator.use_resources` the window totals of the resources are kept as
+    a (window x resource) matrix too and the slots with the least excess over
+    them come first.
+
+    NumPy is only imported when the strategy runs.
+    """
+
+    name = "vectorised"
+
+    def assign(self, generator: "Generator") -> None:
+        import numpy as np
+
+        courses = generator.courses
+        slots = generator.ordered_slots
+        levels = generator.levels
+
+        masks = [levels.course_mask(course) for course in courses]
+        # incidence[course, level] is True if the course has the department level
+        incidence = np.zeros((len(courses), len(levels.keys)), dtype=bool)
+        for position, mask in enumerate(masks):
+            while mask:
+                lowest = mask & -mask
+                incidence[position, lowest.bit_length() - 1] = True
+                mask ^= lowest
+
+        occupied = np.zeros((len(levels.keys), len(slots)), dtype=bool)
+        # exams[level, day] with an empty day before the first and after the
+        # last, so the days next to any day can be read without bound checks
+        exams = np.zeros((len(levels.keys), generator.days_count + 2), dtype=np.int64)
+        seats = np.zeros(len(slots), dtype=np.int64)
+        for course in generator.pinned_courses:
+            slot = generator.placements[course.id]
+            course_levels = list(generator.spread.bits(course))
+            occupied[course_levels, slot.index - 1] = True
+            exams[course_levels, slot.day] += 1
+            seats[slot.index - 1] += course.student_count
+        slot_days = np.array([slot.day for slot in slots], dtype=np.int64)
+        same_day_weight = generator.spread.same_day_weight
+        consecutive_day_weight = generator.spread.consecutive_day_weight
+        rank = np.array(generator.random.sample(range(len(slots)), len(slots)))
+        no_overload = np.zeros(len(slots), dtype=np.int64)
+        resources = generator.resources
+        if resources is not None:
+            # loads[window, resource] as kept by the resources after the
+            # pinned courses, and the window before each slot (its own window
+            # has its position), so the overload of every slot is one masked
+            # operation on the window totals
+            loads = np.array(resources.loads, dtype=np.int64).T
+            limits = np.array(resources.limits, dtype=np.int64)
+            checked = limits > 0
+            has_before = np.array([len(windows) > 1 for windows in resources.windows_of])
+            before = np.array(
+                [windows[-1] if len(windows) > 1 else 0 for windows in resources.windows_of]
+            )
+
+        order = sorted(
+            range(len(courses)),
+            key=lambda position: (-incidence[position].sum(), -courses[position].student_count),
+        )
+
+        for position in order:
+            course = courses[position]
+            if generator.out_of_time("slotting"):
+                generator.ignored_courses.add(course)
+                continue
+
+            course_levels = np.flatnonzero(incidence[position])
+
+            feasible = ~occupied[course_levels].any(axis=0)
+            if course.id in generator.domains:
+                allowed = np.zeros(len(slots), dtype=bool)
+                allowed[[slot.index - 1 for slot in generator.allowed_slots(course)]] = True
+                feasible &= allowed
+            if not feasible.any():
+                generator.ignored_courses.add(course)
+                continue
+
+            # Spread penalty the course adds in each slot
+            course_exams = exams[course_levels]
+            spread = same_day_weight * course_exams[:, slot_days].sum(
+                axis=0
+            ) + consecutive_day_weight * (
+                course_exams[:, slot_days - 1].sum(axis=0)
+                + course_exams[:, slot_days + 1].sum(axis=0)
+            )
+            overload = no_overload
+            if resources is not None:
+                # Slots with fewer resources over come first, whatever the rest
+                need = np.array(resources.demand(course), dtype=np.int64)
+                excess = np.where(
+                    checked,
+                    np.maximum(0, loads + need - limits) - np.maximum(0, loads - limits),
+                    0,
+                ).sum(axis=1)
+                overload = excess + np.where(has_before, excess[before], 0)
+                if resources.mode == RESOURCES_REJECT:
+                    feasible &= overload == 0
+                    if not feasible.any():
+                        generator.ignored_courses.add(course)
+                        continue
+            # The feasible slot with the least overload, then spread penalty,
+            # then seats, then random rank, each compared on its own
+            slot_position = int(np.lexsort((rank, seats, spread, overload, ~feasible))[0])
+
+            if not generator.place(course, slots[slot_position]):
+                generator.ignored_courses.add(course)
+                continue
+
+            occupied[course_levels, slot_position] = True
+            exams[course_levels, slot_days[slot_position]] += 1
+            seats[slot_position] += course.student_count
+            if resources is not None:
+                loads[list(resources.windows_of[slot_position])] += need
+
+
+STRATEGIES: dict[str, type[SlottingStrategy]] = {
+    FirstFitStrategy.name: FirstFitStrategy,
+    DSaturStrategy.name: DSaturStrategy,
+    VectorisedStrategy.name: VectorisedStrategy,
+}
+
+DEFAULT_STRATEGY = DSaturStrategy.name
+
+
+def get_strategy(name: str | None = None) -> SlottingStrategy:
+    """Returns an instance of the strategy registered under `name`
+
+    Raises:
+        ValueError: If no strategy is registered under `name`
+    """
+    name = name or DEFAULT_STRATEGY
+    if name not in STRATEGIES:
+        raise ValueError(
+            f"Unknown slotting strategy '{name}', expected one of {', '.join(STRATEGIES)}"
+        )
+    return STRATEGIES[name]()
@@ -1,3 +1,812 @@
+import datetime
+import functools
+import itertools
+import operator
+import random
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from account.models import USER_ADMIN, Account
+
+from core.models import Course, Department, Staff, Venue
+
+from timetable.domains import compile_domains, constraint_mask
+from timetable.forms import AddSlotCourseForm, UpdateSlotCourse
+from timetable.generator import DepartmentLevelIndex, Generator
+from timetable.objectives import SpreadObjective
+from timetable.invigilation import (
+    MaxFlow,
+    assign_invigilators_by_flow,
+    assign_supervisors,
+    is_resting,
+)
+from timetable.models import SlotCourse, Timetable, TimetableSlot
+from timetable.qeueing import Queue
+from timetable.records import (
+    CourseRecord,
+    DepartmentRecord,
+    SlotConstraintRecord,
+    SlotCourseRecord,
+    StaffRecord,
+)
+from timetable.venues import SPACING_MARGIN, split_capacities
+
 
 # Create your tests here.
+class TestSplitCapacities(TestCase):
+
+    def brute_force(self, count, groups, margin, max_halls):
+        """The best (halls, seats) of every combination of the groups"""
+        covers = []
+        for taken in itertools.product(*(range(available + 1) for _, available in groups)):
+            halls = sum(taken)
+            seats = sum(capacity * size for (capacity, _), size in zip(groups, taken))
+            if 0 < halls <= max_halls and seats > count:
+                covers.append((halls, seats))
+        if not covers:
+            return None
+        spaced = [cover for cover in covers if cover[1] <= count * margin]
+        if spaced:
+            return min(spaced)
+        return min(covers, key=lambda cover: (cover[1], cover[0]))
+
+    def test_split_matches_brute_force(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            capacities = rng.sample(range(20, 400, 10), rng.randint(1, 4))
+            groups = tuple(sorted((capacity, rng.randint(1, 3)) for capacity in capacities))
+            count = rng.randint(10, sum(capacity * available for capacity, available in groups))
+            max_halls = rng.randint(1, 6)
+
+            split = split_capacities(count, groups, SPACING_MARGIN, max_halls)
+            expected = self.brute_force(count, groups, SPACING_MARGIN, max_halls)
+
+            if expected is None:
+                self.assertIsNone(split, f"{count} students in {groups}")
+                continue
+            taken = {}
+            for capacity, size in split:
+                taken[capacity] = taken.get(capacity, 0) + size
+            for capacity, available in groups:
+                self.assertLessEqual(taken.pop(capacity, 0), available)
+            self.assertEqual(taken, {}, "Only capacities of the groups are taken")
+            self.assertEqual(
+                (sum(size for _, size in split), sum(capacity * size for capacity, size in split)),
+                expected,
+                f"{count} students in {groups}, at most {max_halls} halls",
+            )
+
+    def test_fewest_halls_within_margin(self):
+        # 2 x 100 seats 190 with less waste, but 1 x 240 is within the margin
+        self.assertEqual(split_capacities(190, ((100, 2), (240, 1))), ((240, 1),))
+
+    def test_not_enough_seats(self):
+        self.assertIsNone(split_capacities(500, ((100, 2), (200, 1))))
+
+
+class TestInvigilationFlow(TestCase):
+
+    def setUp(self):
+        self.staffs = [StaffRecord(i, f"Staff {i}", 1, True, True) for i in range(1, 4)]
+        self.staffs.append(StaffRecord(4, "Staff 4", 2, True, True))
+
+    def test_max_flow(self):
+        # Nodes 2 to 4 are staffs, 5 and 6 slot courses needing one invigilator,
+        # every staff can take 5, only the first can take 6
+        network = MaxFlow(7)
+        for staff in (1, 2, 3):
+            network.add_edge(0, staff + 1, 1)
+        edges = [network.add_edge(node, 5, 1) for node in (2, 3, 4)]
+        network.add_edge(2, 6, 1)
+        network.add_edge(5, 1, 1)
+        network.add_edge(6, 1, 1)
+
+        self.assertEqual(network.max_flow(0, 1), 2)
+        self.assertEqual(sum(network.flow(edge) for edge in edges), 1)
+
+    def test_duties_are_capped(self):
+        # 4 slot courses of one day, each in 2 venues, apart from each other
+        slot_courses = [SlotCourseRecord(i, slot, 1, 1, None, 2) for i, slot in enumerate((1, 3, 5, 7), 1)]
+
+        assignments, missing, duties = assign_invigilators_by_flow(slot_courses, self.staffs, max_duties=2)
+
+        self.assertEqual(sum(map(len, assignments.values())), 6, "3 staffs with 2 duties each")
+        self.assertEqual(sum(missing.values()), 2)
+        self.assertEqual({staff_id: duties[staff_id] for staff_id in (1, 2, 3)}, {1: 2, 2: 2, 3: 2})
+        self.assertEqual(duties[4], 0, "Staffs of other departments never invigilate")
+        for slot_course in slot_courses:
+            staff_ids = assignments[slot_course.id]
+            self.assertEqual(len(staff_ids), len(set(staff_ids)))
+            self.assertEqual(missing.get(slot_course.id, 0), slot_course.venues - len(staff_ids))
+
+    def test_all_covered_without_cap(self):
+        slot_courses = [SlotCourseRecord(i, slot, 1, 1, None, 2) for i, slot in enumerate((1, 3, 5, 7), 1)]
+
+        assignments, missing, duties = assign_invigilators_by_flow(slot_courses, self.staffs)
+
+        self.assertEqual(missing, {})
+        self.assertEqual(max(duties.values()) - min(duties[staff_id] for staff_id in (1, 2, 3)), 1,
+                         "Duties are spread over the staffs")
+
+    def test_staffs_rest_next_to_their_slots(self):
+        # Staff 1 supervises slot 2, slot courses in slots 1 and 3 need all the staffs
+        slot_courses = [
+            SlotCourseRecord(1, 2, 1, 1, 1, 0),
+            SlotCourseRecord(2, 1, 1, 1, None, 3),
+            SlotCourseRecord(3, 3, 1, 1, None, 3),
+        ]
+
+        assignments, missing, _ = assign_invigilators_by_flow(slot_courses, self.staffs)
+
+        self.assertNotIn(1, assignments[2] + assignments[3])
+        self.assertEqual(missing, {2: 1, 3: 1})
+        busy = {(1, 1): {2}}
+        for slot_course in slot_courses[1:]:
+            for staff_id in assignments[slot_course.id]:
+                self.assertFalse(is_resting(busy, staff_id, 1, slot_course.slot))
+
+    def test_supervisors_avoid_fixed_invigilators(self):
+        # Staff 1 invigilates slot course 2, next to slot course 1
+        slot_courses = [SlotCourseRecord(1, 1, 1, 1, None, 1), SlotCourseRecord(2, 2, 1, 1, None, 1)]
+
+        self.assertEqual(assign_supervisors(slot_courses, self.staffs, only={1})[0].supervisor, 1)
+        supervised = assign_supervisors(slot_courses, self.staffs, only={1}, fixed={2: [1]})
+        self.assertNotIn(supervised[0].supervisor, (None, 1))
+        self.assertIsNone(supervised[1].supervisor)
+
+
+class TestQueue(TestCase):
+    """The queue against the list it replaced"""
+
+    def test_matches_list_queue(self):
+        rng = random.Random(0)
+        queue = Queue(range(1, 200), key=lambda item: item % 7)
+        items = list(range(1, 200))
+        pushed = 200
+
+        for _ in range(5000):
+            operation = rng.random()
+            if operation < 0.2:
+                queue.push(pushed)
+                items.append(pushed)
+                pushed += 1
+            elif operation < 0.35 and items:
+                self.assertEqual(queue.pop(), items.pop(0))
+            elif operation < 0.5:
+                size = rng.randint(1, len(items) + 2)
+                queue.shift(size)
+                items = items[size:] + items[:size]
+            elif operation < 0.7:
+                item = rng.choice(items) if items and rng.random() < 0.9 else -1
+                queue.remove(item)
+                if item in items:
+                    items.remove(item)
+            elif operation < 0.85:
+                remainder = rng.randrange(7)
+                matching = next((item for item in items if item % 7 == remainder), None)
+                self.assertEqual(queue.magic_refilling(lambda item: item % 7 == remainder), matching)
+                if matching is not None:
+                    items.remove(matching)
+                    items.append(matching)
+            else:
+                remainder = rng.randrange(7)
+                matching = next((item for item in items if item % 7 == remainder), None)
+                self.assertEqual(queue.magic_refilling_by_key(remainder), matching)
+                if matching is not None:
+                    items.remove(matching)
+                    items.append(matching)
+
+            self.assertEqual(len(queue), len(items))
+        self.assertEqual(queue.items, items)
+        self.assertEqual(list(queue), items)
+        self.assertEqual(len(queue), 0)
+
+    def test_pop_empty(self):
+        queue = Queue([1])
+        queue.remove(1)
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+    def test_refilling_by_key_needs_key(self):
+        with self.assertRaises(ValueError):
+            Queue([1, 2]).magic_refilling_by_key(1)
+
+
+class TestSlotDomains(TestCase):
+    # A Thursday, Friday, Saturday and Monday, with 3 slots a day
+    days = ["2026-10-15", "2026-10-16", "2026-10-17", "2026-10-19"]
+
+    def constraint(self, id=1, courses=(), level=None, department=None, periods=(),
+                   excluded_week_days=(), not_before=None, not_after=None):
+        return SlotConstraintRecord(id, frozenset(courses), level, department, periods,
+                                    excluded_week_days, not_before, not_after)
+
+    def days_mask(self, *positions):
+        return sum(0b111 << (position * 3) for position in positions)
+
+    def test_not_before_and_after(self):
+        self.assertEqual(constraint_mask(self.constraint(not_before="2026-10-16"), self.days, 3),
+                         self.days_mask(1, 2, 3))
+        self.assertEqual(constraint_mask(self.constraint(not_after="2026-10-17"), self.days, 3),
+                         self.days_mask(0, 1, 2))
+        self.assertEqual(constraint_mask(
+            self.constraint(not_before="2026-10-16", not_after="2026-10-16"), self.days, 3),
+            self.days_mask(1))
+
+    def test_excluded_week_days(self):
+        # Saturday and Monday
+        self.assertEqual(constraint_mask(self.constraint(excluded_week_days=(5, 0)), self.days, 3),
+                         self.days_mask(0, 1))
+
+    def test_periods(self):
+        self.assertEqual(constraint_mask(self.constraint(periods=(1, 3)), self.days, 3),
+                         sum(0b101 << (position * 3) for position in range(4)))
+        self.assertEqual(constraint_mask(
+            self.constraint(periods=(2,), excluded_week_days=(3,)), self.days, 3),
+            sum(0b010 << (position * 3) for position in range(1, 4)))
+
+    def test_compile_domains(self):
+        cs, mt = DepartmentRecord(1, "CS"), DepartmentRecord(2, "MT")
+        courses = [
+            CourseRecord(1, "CS101", "", 100, 50, 1, (cs,)),
+            CourseRecord(2, "CS201", "", 200, 50, 1, (cs,)),
+            CourseRecord(3, "MT101", "", 100, 50, 2, (mt, cs)),
+            CourseRecord(4, "MT201", "", 200, 50, 2, (mt,)),
+        ]
+        constraints = [
+            self.constraint(1, department=1, not_before="2026-10-16"),
+            self.constraint(2, level=100, periods=(1,)),
+            self.constraint(3, courses=(2,), not_after="2026-10-15"),
+        ]
+
+        domains = compile_domains(constraints, courses, self.days, 3)
+
+        # Slots all the matching constraints allow, courses without any left out
+        self.assertEqual(domains[1], sum(0b001 << (position * 3) for position in range(1, 4)))
+        self.assertEqual(domains[2], 0, "No slot is both before and after the 16th")
+        self.assertEqual(domains[3], domains[1], "Matched through its other departments")
+        self.assertNotIn(4, domains)
+
+    def test_generator_keeps_to_domains(self):
+        courses = [CourseRecord(i, f"C{i}", "", 100, 50, 1, (DepartmentRecord(1, "CS"),))
+                   for i in range(1, 5)]
+        domains = {1: self.days_mask(3), 2: 0, 3: 0b010010010010}
+
+        for strategy in ("first-fit", "dsatur", "vectorised"):
+            generator = Generator(courses, 3, 4, strategy, seed=1, domains=domains)
+            generator.start()
+
+            self.assertIn(generator.placements[1].index, (10, 11, 12), strategy)
+            self.assertNotIn(2, generator.placements, strategy)
+            self.assertIn(generator.placements[3].index, (2, 5, 8, 11), strategy)
+            self.assertIn(4, generator.placements, strategy)
+
+
+class TestRepair(TestCase):
+
+    def courses(self, seed):
+        rng = random.Random(seed)
+        departments = [DepartmentRecord(i, f"D{i}") for i in range(1, 7)]
+        courses = []
+        for i in range(1, 41):
+            course_departments = tuple(rng.sample(departments, rng.randint(1, 3)))
+            courses.append(CourseRecord(i, f"C{i}", "", rng.choice((100, 200)), rng.randint(10, 300),
+                                        course_departments[0].id, course_departments))
+        return courses
+
+    def assertValid(self, generator, courses):
+        placed = [course for slot in generator.ordered_slots for course in slot.courses]
+        self.assertEqual({course.id for course in placed}, set(generator.placements))
+        self.assertEqual(len(placed) + len(generator.ignored_courses), len(courses))
+        for slot in generator.ordered_slots:
+            for course in slot.courses:
+                self.assertIs(generator.placements[course.id], slot)
+                for other in slot.courses:
+                    if other is not course:
+                        self.assertFalse(generator.levels.course_mask(course)
+                                         & generator.levels.course_mask(other),
+                                         f"{course} and {other} share a department level")
+
+    def test_repair_keeps_levels_apart(self):
+        repaired = 0
+        for seed in range(10):
+            courses = self.courses(seed)
+            domains = {1: 0b111, 2: 0b111000}
+            generator = Generator(courses, 3, 2, "first-fit", seed=seed, domains=domains)
+            generator.start()
+            ignored = len(generator.ignored_courses)
+
+            generator.repair(3)
+
+            self.assertValid(generator, courses)
+            self.assertEqual(generator.repairing["repaired"], ignored - len(generator.ignored_courses))
+            repaired += generator.repairing["repaired"]
+            for course_id, domain in domains.items():
+                if course_id in generator.placements:
+                    self.assertTrue(domain >> (generator.placements[course_id].index - 1) & 1)
+        self.assertGreater(repaired, 0, "Some ignored courses are repaired")
+
+
+class TimetableTestCase(TestCase):
+    """A timetable of 4 days, Monday excluded, with 3 slots a day"""
+
+    def setUp(self):
+        cache.clear()
+        rng = random.Random(0)
+        self.departments = [
+            Department.objects.create(title=f"Department {d}", code=f"D{d}") for d in range(3)
+        ]
+        self.courses = []
+        for i in range(24):
+            department = self.departments[i % 3]
+            self.courses.append(self.add_course(
+                f"C{i}", (100, 200)[i % 2], rng.randint(20, 150),
+                [department] + ([self.departments[(i + 1) % 3]] if i % 5 == 0 else [])))
+        self.venues = [
+            Venue.objects.create(title=f"Venue {i}", code=f"V{i}", capacity=capacity)
+            for i, capacity in enumerate((50, 60, 80, 100, 120, 150, 150, 200))
+        ]
+        self.staffs = [
+            Staff.objects.create(name=f"Staff {i}", staff_id=f"S{i}", department=self.departments[i % 3],
+                                 can_supervise=i < 6)
+            for i in range(15)
+        ]
+        self.timetable = Timetable.objects.create(
+            title="Test", slot_per_day=3, created_on=timezone.now(),
+            start_date=datetime.date(2026, 10, 19), end_date=datetime.date(2026, 10, 24))
+        self.timetable.courses.set(self.courses)
+        self.timetable.venues.set(self.venues)
+        self.timetable.staffs.set(self.staffs)
+
+    def add_course(self, code, level, student_count, departments):
+        course = Course.objects.create(title=code, code=code, level=level, student_count=student_count,
+                                       department=departments[0])
+        course.departments.set(departments)
+        return course
+
+    def login(self):
+        user = User.objects.create_user("admin", password="admin")
+        Account.objects.create(user=user, user_type=USER_ADMIN)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def slot_courses(self):
+        return SlotCourse.objects.filter(slot__timetable=self.timetable).select_related("slot", "course")
+
+    def state(self, slot_course):
+        return (
+            slot_course.course_id,
+            slot_course.slot.index,
+            set(slot_course.venues.values_list("pk", flat=True)),
+            slot_course.supervisor_id,
+            set(slot_course.invigilators.values_list("pk", flat=True)),
+        )
+
+    def assertNoLevelClash(self):
+        seen = set()
+        for slot_course in self.slot_courses().prefetch_related("course__departments"):
+            for department in slot_course.course.departments.all():
+                key = (slot_course.slot.index, department.pk, slot_course.course.level)
+                self.assertNotIn(key, seen, f"{slot_course.course} shares its slot with its level")
+                seen.add(key)
+
+
+class TestPartialGeneration(TimetableTestCase):
+
+    def test_pinned_slot_courses_are_kept(self):
+        self.timetable.generate(seed=1)
+        self.timetable.auto_assign_invigilators()
+        slot_courses = list(self.slot_courses().order_by("pk"))
+        pinned = slot_courses[::3]
+        SlotCourse.objects.filter(pk__in=[slot_course.pk for slot_course in pinned]).update(pinned=True)
+        before = {slot_course.pk: self.state(slot_course) for slot_course in pinned}
+        self.assertTrue(all(state[2] and state[4] for state in before.values()),
+                        "Pinned slot courses have venues and invigilators")
+        slots_before = {slot_course.course_id: slot_course.slot.index for slot_course in slot_courses}
+
+        result = self.timetable.generate(seed=2, partial=True)
+
+        self.assertEqual(result["pinned"], len(pinned))
+        after = {slot_course.pk: self.state(slot_course) for slot_course in self.slot_courses().filter(pinned=True)}
+        self.assertEqual(after, before)
+        moved = [
+            slot_course for slot_course in self.slot_courses().filter(pinned=False)
+            if slots_before[slot_course.course_id] != slot_course.slot.index
+        ]
+        self.assertTrue(moved, "The other courses are slotted again")
+        self.assertNoLevelClash()
+
+    def test_pins_are_explicit(self):
+        self.timetable.generate(seed=1)
+        slot_course = self.slot_courses().first()
+
+        form = AddSlotCourseForm({"course": slot_course.course_id, "supervisor": self.staffs[0].pk,
+                                  "slot": slot_course.slot_id})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data["pinned"], False, "Added slot courses are not pinned")
+
+        form = UpdateSlotCourse({"supervisor": self.staffs[0].pk})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(form.cleaned_data["pinned"], "Updated slot courses keep their pin")
+        form = UpdateSlotCourse({"supervisor": self.staffs[0].pk, "pinned": "true"})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data["pinned"], True)
+
+
+class TestPlaceCourses(TimetableTestCase):
+
+    def test_place_late_courses(self):
+        self.timetable.generate(seed=1)
+        self.timetable.auto_assign_invigilators()
+        before = {slot_course.pk: self.state(slot_course) for slot_course in self.slot_courses()}
+        # One level of a department with a course more than the timetable has slots
+        late = [self.add_course(f"L{i}", 300, 30, [self.departments[0]]) for i in range(13)]
+
+        placed, unplaced = self.timetable.place_courses(late)
+
+        self.assertEqual(len(placed), 12)
+        self.assertEqual(len(unplaced), 1, "The course with no free slot is not placed")
+        self.assertNotIn(unplaced[0].pk, self.slot_courses().values_list("course_id", flat=True))
+        after = {slot_course.pk: self.state(slot_course)
+                 for slot_course in self.slot_courses().filter(pk__in=before)}
+        self.assertEqual(after, before, "The persisted slot courses are left as they are")
+        self.assertNoLevelClash()
+
+        venues_of = {}
+        for slot_course in self.slot_courses().prefetch_related("venues"):
+            for venue in slot_course.venues.all():
+                venues_of.setdefault(venue.pk, []).append(slot_course)
+        for slot_course in placed:
+            self.assertTrue(slot_course.venues.exists(), f"{slot_course.course} has venues")
+            for venue in slot_course.venues.all():
+                for other in venues_of[venue.pk]:
+                    if other.pk != slot_course.pk and other.slot.day == slot_course.slot.day:
+                        self.assertGreater(abs(other.slot.index - slot_course.slot.index), 1,
+                                           f"{venue} is free next to {slot_course.course}")
+
+    def test_nothing_is_kept_on_errors(self):
+        self.timetable.generate(seed=1)
+        late = self.add_course("L", 300, 30, [self.departments[0]])
+
+        with mock.patch.object(SlotCourse.objects, "bulk_create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.timetable.place_courses([late])
+
+        self.assertFalse(self.timetable.courses.filter(pk=late.pk).exists())
+
+    def test_needs_generated_timetable(self):
+        with self.assertRaises(Timetable.NotGenerated):
+            self.timetable.place_courses(self.courses[:1])
+
+
+class TestGenerateRoute(TimetableTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.url = f"/api/timetables/{self.timetable.pk}/generate/"
+
+    def test_generate(self):
+        response = self.client.get(self.url, {"seed": 1, "strategy": "vectorised", "repair": 0})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["strategy"], "vectorised")
+        self.assertIsNone(response.data["resources"])
+        self.assertIn("workload", response.data)
+
+    def test_invalid_options(self):
+        for options in ({"restarts": "many"}, {"restarts": 0}, {"workers": -1}, {"repair": "x"},
+                        {"max_duties": 0}, {"budget": "soon"}, {"strategy": "random"},
+                        {"invigilation": "any"}, {"resources": "all"}):
+            response = self.client.get(self.url, options)
+            self.assertEqual(response.status_code, 400, options)
+            self.assertIn(next(iter(options)), response.data["errors"])
+        self.assertFalse(self.slot_courses().exists(), "Nothing is generated")
+
+    def test_run_errors_are_not_bad_options(self):
+        with mock.patch.object(Timetable, "generate", side_effect=ValueError("bug")):
+            with self.assertRaises(ValueError):
+                self.client.get(self.url, {"seed": 1})
+
+
+class TestLevelCourses(TimetableTestCase):
+
+    def test_level_courses(self):
+        self.login()
+        cs, mt, ph = self.departments
+        slot = TimetableSlot.objects.create(timetable=self.timetable, index=1, day=1)
+        # Its main department is not one of its departments
+        course = self.add_course("A", 300, 50, [mt])
+        course.department = cs
+        course.save()
+        matching = [
+            self.add_course("B", 300, 50, [cs]),
+            self.add_course("C", 300, 50, [ph, mt]),
+            self.add_course("D", 300, 50, [ph]),
+        ]
+        matching[2].department = cs
+        matching[2].save()
+        others = [self.add_course("E", 200, 50, [cs, mt]), self.add_course("F", 300, 50, [ph])]
+        slot_course, *slot_courses = [
+            SlotCourse.objects.create(slot=slot, course=other) for other in [course] + matching + others
+        ]
+
+        response = self.client.get(f"/api/complains/{slot_course.pk}/level_courses/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(match["id"] for match in response.data),
+                         [slot_course.pk] + [slot_course.pk for slot_course in slot_courses[:3]])
+
+
+class TestGenerationCache(TimetableTestCase):
+
+    def generate(self, **options):
+        return self.timetable.generate(**{"seed": 1, **options})
+
+    def test_identical_inputs_hit(self):
+        first = self.generate()
+        placements = {slot_course.course_id: slot_course.slot.index for slot_course in self.slot_courses()}
+
+        second = self.generate()
+
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["inputs_hash"], first["inputs_hash"])
+        self.assertEqual(
+            {slot_course.course_id: slot_course.slot.index for slot_course in self.slot_courses()},
+            placements)
+
+    def test_changed_inputs_miss(self):
+        def course():
+            self.courses[0].student_count += 1
+            self.courses[0].save()
+
+        def rename():
+            self.courses[1].title = "Renamed"
+            self.courses[1].save()
+
+        def venue():
+            self.venues[0].capacity += 10
+            self.venues[0].save()
+
+        def departments():
+            self.courses[2].departments.add(self.departments[0])
+
+        for change in (course, rename, venue, departments):
+            self.generate()
+            change()
+            self.assertFalse(self.generate()["cached"], change.__name__)
+
+    def test_changed_options_miss(self):
+        self.generate()
+        for options in ({"seed": 2}, {"strategy": "first-fit"}, {"restarts": 2}, {"anneal": 10},
+                        {"share_venues": True}, {"resources": "reject"}, {"repair": 0}):
+            self.assertFalse(self.generate(**options)["cached"], options)
+            self.assertTrue(self.generate(**options)["cached"], options)
+
+    def test_changed_pins_miss(self):
+        self.generate()
+        slot_course = self.slot_courses().first()
+        slot_course.pinned = True
+        slot_course.save()
+        self.assertFalse(self.generate(partial=True)["cached"])
+        self.assertTrue(self.generate(partial=True)["cached"])
+
+        other = TimetableSlot.objects.get(timetable=self.timetable, index=slot_course.slot.index % 12 + 1)
+        SlotCourse.objects.filter(pk=slot_course.pk).update(slot=other)
+        self.assertFalse(self.generate(partial=True)["cached"], "A pin moved to another slot")
+
+    def test_ignored_courses_are_reported_by_their_current_name(self):
+        # One level of a department with a course more than the timetable has slots
+        ignored = [self.add_course(f"L{i}", 300, 30, [self.departments[0]]) for i in range(13)]
+        self.timetable.courses.add(*ignored)
+        self.assertEqual(self.generate(repair=0)["ignored"], 1)
+
+        Course.objects.filter(pk__in=[course.pk for course in ignored]).update(title="Renamed")
+
+        result = self.generate(repair=0)
+        self.assertFalse(result["cached"])
+        self.assertTrue(all(name.startswith("Renamed") for name in result["ignored_courses"]))
+
+
+class TestComponents(TestCase):
+
+    def courses(self):
+        # 4 faculties of 3 departments, courses only share departments of their faculty
+        rng = random.Random(1)
+        courses = []
+        for faculty in range(4):
+            departments = [DepartmentRecord(faculty * 10 + d, f"F{faculty}D{d}") for d in range(3)]
+            for i in range(30):
+                course_departments = tuple(rng.sample(departments, rng.randint(1, 2)))
+                courses.append(CourseRecord(len(courses) + 1, f"C{len(courses)}", "", rng.choice((100, 200)),
+                                            rng.randint(10, 300), course_departments[0].id, course_departments))
+        return courses
+
+    def test_merged_components(self):
+        courses = self.courses()
+        # Courses of the first faculty restricted to the first day or the last slot of a day
+        domains = {1: 0b1111, 2: 0b1111, 3: 0b100010001000100010001000}
+
+        for strategy in ("first-fit", "dsatur", "vectorised"):
+            generator = Generator(list(courses), 4, 6, strategy, seed=1, domains=domains)
+            components = []
+            merge = generator.merge_components
+
+            def merged(results):
+                components.extend(results)
+                return merge(results)
+
+            with mock.patch("timetable.generator.COMPONENT_MIN_COURSES", 10), \
+                    mock.patch.object(generator, "merge_components", side_effect=merged):
+                generator.start()
+
+            self.assertEqual(len(components), 8, "Every level of a faculty is slotted apart")
+            placed = [course for slot in generator.ordered_slots for course in slot.courses]
+            self.assertEqual(len(placed) + len(generator.ignored_courses), len(courses))
+            for slot in generator.ordered_slots:
+                masks = [generator.levels.course_mask(course) for course in slot.courses]
+                self.assertEqual(sum(masks), functools.reduce(operator.or_, masks, 0),
+                                 f"No department level twice in slot {slot.index} ({strategy})")
+
+            # The restricted component keeps the slots it was given, in its domains
+            restricted = next(placements for placements, _ in components if 1 in placements)
+            for course_id, index in restricted.items():
+                self.assertEqual(generator.placements[course_id].index, index, strategy)
+            for course_id, domain in domains.items():
+                if course_id in generator.placements:
+                    self.assertTrue(domain >> (generator.placements[course_id].index - 1) & 1, strategy)
+
+            # Merging never adds consecutive-day exams to the components
+            courses_by_id = {course.id: course for course in courses}
+            consecutive_days = 0
+            for placements, _ in components:
+                spread = SpreadObjective(generator.levels)
+                for course_id, index in placements.items():
+                    spread.add(courses_by_id[course_id], (index - 1) // 4 + 1)
+                consecutive_days += spread.consecutive_days
+            self.assertLessEqual(generator.spread.consecutive_days, consecutive_days, strategy)
+
+
+class TestVectorisedStrategy(TestCase):
+
+    def test_choices_match_other_strategies(self):
+        cs, mt = DepartmentRecord(1, "CS"), DepartmentRecord(2, "MT")
+        courses = [
+            CourseRecord(1, "CS101", "", 100, 90, 1, (cs, mt)),
+            CourseRecord(2, "CS102", "", 100, 80, 1, (cs,)),
+            CourseRecord(3, "MT101", "", 100, 70, 2, (mt,)),
+            CourseRecord(4, "CS201", "", 200, 60, 1, (cs,)),
+        ]
+
+        for strategy in ("dsatur", "vectorised"):
+            generator = Generator(courses, 2, 5, strategy, seed=1)
+            generator.start()
+
+            days = {course_id: slot.day for course_id, slot in generator.placements.items()}
+            self.assertEqual(len(days), 4, strategy)
+            # CS101 is on a day apart from the other 100L CS and MT exams
+            self.assertEqual(generator.spread_penalty(), 0, strategy)
+            self.assertGreater(abs(days[1] - days[2]), 1, strategy)
+            self.assertGreater(abs(days[1] - days[3]), 1, strategy)
+
+        first_fit = Generator(courses, 2, 5, "first-fit", seed=1)
+        first_fit.start()
+        self.assertEqual(len(first_fit.placements), 4)
+
+    def test_large_terms_do_not_spill(self):
+        # Seats far over what the terms packed in one int64 could hold
+        courses = [
+            CourseRecord(1, "A", "", 100, 2**61, 1, (DepartmentRecord(1, "CS"),)),
+            CourseRecord(2, "B", "", 100, 10, 2, (DepartmentRecord(2, "MT"),)),
+        ]
+        for seed in range(5):
+            generator = Generator(courses, 3, 2, "vectorised", seed=seed)
+            generator.start()
+
+            self.assertNotEqual(generator.placements[1], generator.placements[2],
+                                "The small course goes to the emptier slot")
+
+
+class TestSpreadObjective(TestCase):
+
+    def setUp(self):
+        cs, mt = DepartmentRecord(1, "CS"), DepartmentRecord(2, "MT")
+        self.a, self.b, self.c = [
+            CourseRecord(i, f"CS10{i}", "", 100, 50, 1, (cs,)) for i in (1, 2, 3)
+        ]
+        self.both = CourseRecord(4, "CM101", "", 100, 50, 1, (cs, mt))
+        self.mt = CourseRecord(5, "MT101", "", 100, 50, 2, (mt,))
+        self.spread = SpreadObjective(DepartmentLevelIndex())
+
+    def counters(self):
+        return self.spread.same_day, self.spread.consecutive_days, self.spread.penalty
+
+    def test_delta_weights(self):
+        self.spread.add(self.a, 2)
+
+        self.assertEqual(self.spread.delta(self.b, 2), 3, "Same day pair")
+        self.assertEqual(self.spread.delta(self.b, 1), 1, "Consecutive day pair")
+        self.assertEqual(self.spread.delta(self.b, 3), 1, "Consecutive day pair")
+        self.assertEqual(self.spread.delta(self.b, 4), 0)
+        self.assertEqual(self.spread.delta(self.mt, 2), 0, "Other department level")
+
+        self.spread.add(self.b, 3)
+        self.spread.add(self.mt, 3)
+        # Both department levels of the course pair with their exams
+        self.assertEqual(self.spread.delta(self.both, 3), 3 + 3 + 1)
+
+    def test_add_then_remove(self):
+        self.spread.add(self.a, 2)
+        self.spread.add(self.b, 3)
+        self.assertEqual(self.counters(), (0, 1, 1))
+
+        delta = self.spread.delta(self.c, 3)
+        self.spread.add(self.c, 3)
+        self.assertEqual(self.counters(), (1, 2, 1 + delta))
+
+        self.spread.remove(self.c, 3)
+        self.assertEqual(self.counters(), (0, 1, 1))
+        self.spread.remove(self.b, 3)
+        self.spread.remove(self.a, 2)
+        self.assertEqual(self.spread.penalty, 0)
+        self.assertEqual(set(self.spread.exams.values()), {0})
+
+
+class TestDSatur(TestCase):
+
+    def cycle(self, length):
+        """Courses i and i + 1 share a department, the last and the first too"""
+        departments = [DepartmentRecord(i, f"D{i}") for i in range(1, length + 1)]
+        return [
+            CourseRecord(i, f"C{i}", "", 100, 50, i,
+                         (departments[i - 1], departments[i % length]))
+            for i in range(1, length + 1)
+        ]
+
+    def assertNoClash(self, generator):
+        for slot in generator.ordered_slots:
+            for course, other in itertools.combinations(slot.courses, 2):
+                self.assertFalse(generator.levels.course_mask(course)
+                                 & generator.levels.course_mask(other),
+                                 f"{course} and {other} share a department level")
+
+    def test_colours_odd_cycle(self):
+        # An odd cycle needs three colours
+        courses = self.cycle(5)
+        generator = Generator(courses, 3, 1, "dsatur", seed=1)
+        generator.start()
+
+        self.assertEqual(generator.ignored_courses, set())
+        self.assertEqual(set(generator.placements), {course.id for course in courses})
+        self.assertNoClash(generator)
+
+        generator = Generator(courses, 2, 1, "dsatur", seed=1)
+        generator.start()
+        self.assertEqual(len(generator.ignored_courses), 1, "Two colours are one short")
+        self.assertNoClash(generator)
+
+    def test_clique_fills_every_slot(self):
+        department = DepartmentRecord(1, "CS")
+        courses = [CourseRecord(i, f"CS10{i}", "", 100, 50, 1, (department,)) for i in range(1, 5)]
+        generator = Generator(courses, 3, 1, "dsatur", seed=1)
+        generator.start()
+
+        self.assertEqual(len(generator.ignored_courses), 1)
+        self.assertEqual([len(slot.courses) for slot in generator.ordered_slots], [1, 1, 1])
+
+    def test_annealing_does_not_add_cost(self):
+        courses = TestRepair().courses(3)
+        generator = Generator(courses, 3, 3, "dsatur", seed=3)
+        generator.start()
+        generator.improve(500)
+
+        self.assertLessEqual(generator.annealing["after"]["cost"],
+                             generator.annealing["before"]["cost"])
+        self.assertEqual(generator.annealing["after"]["ignored"], len(generator.ignored_courses))
+        self.assertNoClash(generator)
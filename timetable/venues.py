@@ -0,0 +1,285 @@
+"""
+Venue allocation shared by the generator and the venue assignment routes.
+
+`VenuePool` keeps the free venues of a slot sorted by capacity, so the best
+fitting venue for a course is found with a binary search instead of a scan of
+the pool. It works with anything that has a `capacity` and a `pk`: venue
+models and `timetable.records.VenueRecord` alike.
+"""
+
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Generic, Iterable, TypeVar
+
+V = TypeVar("V")
+
+# Margin for accuracy for student spacing, a single venue is only picked for a
+# course if it does not have more than 30% seats above the course student count
+SPACING_MARGIN = 1.3
+
+# Most venues a course is split across before falling back to taking venues
+# from the largest down
+MAX_HALLS = 12
+
+
+class VenuePool(Generic[V]):
+    def __init__(
+        self,
+        venues: Iterable[V] = (),
+        margin: float = SPACING_MARGIN,
+        max_halls: int = MAX_HALLS,
+    ) -> None:
+        self.margin = margin
+        self.max_halls = max_halls
+        self.venues: list[V] = sorted(venues, key=lambda venue: venue.capacity)  # type: ignore
+        self.capacities: list[int] = [venue.capacity for venue in self.venues]  # type: ignore
+        # Students seated in each venue allocated from the pool
+        self.occupancy: dict[V, int] = {}
+
+    def __len__(self):
+        return len(self.venues)
+
+    def __iter__(self):
+        return iter(self.venues)
+
+    def __contains__(self, venue: V):
+        return self.position(venue) is not None
+
+    @property
+    def total_capacity(self) -> int:
+        return sum(self.capacities)
+
+    def without(self, venues: Iterable[V]) -> "VenuePool[V]":
+        """Returns a copy of the pool without the given venues, in O(V) since the
+        order of the pool is kept"""
+        excluded = set(venues)
+        pool = self.__class__(margin=self.margin, max_halls=self.max_halls)
+        pool.venues = [venue for venue in self.venues if venue not in excluded]
+        pool.capacities = [venue.capacity for venue in pool.venues]  # type: ignore
+        return pool
+
+    def position(self, venue: V) -> int | None:
+        capacity = venue.capacity  # type: ignore
+        index = bisect_left(self.capacities, capacity)
+        while index < len(self.venues) and self.capacities[index] == capacity:
+            if self.venues[index] == venue:
+                return index
+            index += 1
+        return None
+
+    def take(self, venue: V) -> V:
+        """Removes a venue from the pool
+
+        Raises:
+            KeyError: If the venue is not in the pool
+        """
+        index = self.position(venue)
+        if index is None:
+            raise KeyError(venue)
+        self.capacities.pop(index)
+        return self.venues.pop(index)
+
+    def release(self, venue: V):
+        """Puts a venue back into the pool"""
+        index = bisect_right(self.capacities, venue.capacity)  # type: ignore
+        self.capacities.insert(index, venue.capacity)  # type: ignore
+        self.venues.insert(index, venue)
+
+    def best_fit(self, count: int) -> V | None:
+        """Returns the smallest venue with more seats than count, if it is within
+        the spacing margin"""
+        index = bisect_right(self.capacities, count)
+        if index < len(self.venues) and self.capacities[index] <= count * self.margin:
+            return self.venues[index]
+        return None
+
+    def largest(self) -> V | None:
+        return self.venues[-1] if self.venues else None
+
+    def select_multiple(self, count: int) -> list[V] | None:
+        """Picks the combination of venues that seats count students with the
+        fewest halls among the combinations within the spacing margin, or with
+        the fewest wasted seats when no combination is, see `split_capacities`.
+        Falls back to `select_largest` when more than `max_halls` venues are
+        needed. Returns None if the whole pool can not seat them."""
+        if not self.venues or self.total_capacity <= count:
+            return None
+
+        # Venues of the same capacity are interchangeable, the split only
+        # depends on how many venues of each capacity the pool has
+        first_of: dict[int, int] = {}
+        groups = []
+        start = 0
+        while start < len(self.capacities):
+            capacity = self.capacities[start]
+            end = bisect_right(self.capacities, capacity, start)
+            first_of[capacity] = start
+            groups.append((capacity, min(end - start, self.max_halls)))
+            start = end
+
+        split = split_capacities(count, tuple(groups), self.margin, self.max_halls)
+        if split is None:
+            return self.select_largest(count)
+
+        selected_venues: list[V] = []
+        for capacity, size in split:
+            start = first_of[capacity]
+            selected_venues.extend(self.venues[start : start + size])
+            first_of[capacity] = start + size
+        return selected_venues
+
+    def select_largest(self, count: int) -> list[V] | None:
+        """Picks venues from the largest down until they seat count students,
+        returns None if the whole pool can not"""
+        selected_venues = []
+        current_capacity = 0
+        for venue in reversed(self.venues):
+            selected_venues.append(venue)
+            current_capacity = current_capacity + venue.capacity  # type: ignore
+            if current_capacity > count:
+                return selected_venues
+        return None
+
+    def select(self, count: int) -> list[V] | None:
+        """Picks the venues for count students without taking them out of the
+        pool, returns None if the pool can not seat them"""
+        venue = self.best_fit(count)
+        if venue is not None:
+            return [venue]
+
+        # multiple venues is required
+        return self.select_multiple(count)
+
+    def allocate(self, count: int) -> list[V] | None:
+        """Picks the venues for count students, takes them out of the pool and
+        records the students each one seats in `occupancy`"""
+        venues = self.select(count)
+        if venues:
+            remaining = count
+            for venue in venues:
+                self.take(venue)
+                seated = min(venue.capacity, remaining)  # type: ignore
+                self.occupancy[venue] = seated
+                remaining -= seated
+        return venues
+
+
+class SharedVenuePool(VenuePool[V]):
+    """A venue pool where several courses of a slot can write in one venue.
+
+    Allocating from it is first-fit decreasing bin packing when the courses
+    come largest first: a course goes into the first venue already in use that
+    has room left for it, and only takes venues out of the pool when none has.
+    A shared venue seats at most capacity / margin students, so the spacing
+    margin is kept between the courses writing in it. Courses split across
+    several venues keep them to themselves.
+    """
+
+    def __init__(
+        self,
+        venues: Iterable[V] = (),
+        margin: float = SPACING_MARGIN,
+        max_halls: int = MAX_HALLS,
+    ) -> None:
+        super().__init__(venues, margin, max_halls)
+        # Venues allocated to a single course, in allocation order
+        self.shared: list[V] = []
+
+    def shared_fit(self, count: int) -> V | None:
+        """Returns the first shared venue with room left for count students"""
+        for venue in self.shared:
+            if self.occupancy[venue] + count <= venue.capacity / self.margin:  # type: ignore
+                return venue
+        return None
+
+    def allocate(self, count: int) -> list[V] | None:
+        venue = self.shared_fit(count)
+        if venue is not None:
+            self.occupancy[venue] += count
+            return [venue]
+
+        venues = super().allocate(count)
+        if venues and len(venues) == 1:
+            self.shared.append(venues[0])
+        return venues
+
+
+@lru_cache(maxsize=4096)
+def split_capacities(
+    count: int,
+    groups: tuple[tuple[int, int], ...],
+    margin: float = SPACING_MARGIN,
+    max_halls: int = MAX_HALLS,
+) -> tuple[tuple[int, int], ...] | None:
+    """Splits count students across venues of the given (capacity, venues)
+    groups, returning (capacity, venues taken) pairs. Among the combinations
+    with more seats than count and no more than count * margin, the one with
+    the fewest halls (then the fewest seats) wins, otherwise the one with the
+    fewest wasted seats (then the fewest halls). Returns None if no
+    combination of at most max_halls venues seats them.
+
+    This is a bounded subset-sum: for every number of halls k, an integer
+    bitset holds the seat totals k venues can reach. Totals above count plus
+    the largest capacity can never be part of a minimal combination and are
+    masked off, and the n venues of a capacity are added as bundles of 1, 2,
+    4, ... venues, so a split costs O(capacities * log(max_halls) * max_halls)
+    shifts of (count + largest capacity) bits. Pools of a timetable share
+    their capacities, so most splits are served from the cache.
+    """
+    halls = min(sum(available for _, available in groups), max_halls)
+    limit = (1 << (count + max(capacity for capacity, _ in groups) + 1)) - 1
+
+    # Bundles of 1, 2, 4, ... venues can still make up any number up to n
+    bundles: list[tuple[int, int]] = []
+    for capacity, available in groups:
+        available = min(available, halls)
+        size = 1
+        while available > 0:
+            size = min(size, available)
+            bundles.append((capacity, size))
+            available -= size
+            size *= 2
+
+    # reachable[k] has bit s set if k venues can seat exactly s students,
+    # first_reached[i][k] the totals bundle i made reachable with k venues
+    reachable = [1] + [0] * halls
+    first_reached: list[list[int]] = []
+    for capacity, size in bundles:
+        seats = capacity * size
+        reached = [0] * (halls + 1)
+        for k in range(halls, size - 1, -1):
+            if not reachable[k - size]:
+                continue
+            totals = (reachable[k - size] << seats) & limit & ~reachable[k]
+            if totals:
+                reachable[k] |= totals
+                reached[k] = totals
+        first_reached.append(reached)
+
+    # For every number of halls only the smallest total above count matters
+    covers = []
+    for k in range(1, halls + 1):
+        totals = reachable[k] >> (count + 1)
+        if totals:
+            covers.append((k, count + (totals & -totals).bit_length()))
+
+    if not covers:
+        return None
+
+    spaced = [cover for cover in covers if cover[1] <= count * margin]
+    if spaced:
+        k, total = min(spaced)
+    else:
+        k, total = min(covers, key=lambda cover: (cover[1], cover[0]))
+
+    split = []
+    for position in range(len(bundles) - 1, -1, -1):
+        if k == 0:
+            break
+        if first_reached[position][k] >> total & 1:
+            capacity, size = bundles[position]
+            split.append((capacity, size))
+            total -= capacity * size
+            k -= size
+
+    return tuple(split)